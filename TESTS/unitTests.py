@@ -12,6 +12,7 @@ from pyrtools.pyramids.pyramid import Pyramid
 
 import scipy.io
 import os
+import tempfile
 import os.path as op
 matfiles_path = op.join(op.dirname(op.realpath(__file__)), 'matFiles')
 test_data_path = op.join(op.dirname(op.realpath(__file__)), '..', 'DATA')
@@ -41,6 +42,358 @@ class corrDnTests(unittest.TestCase):
         ramp = pt.synthetic_images.ramp(20)
         res = pt.corrDn(ramp, pt.named_filter('qmf16'))
         self.assertTrue(pt.compareRecon(mres, res))
+    def test4(self):
+        # contiguous float64 input is passed to the C code without copying, so check it's left
+        # untouched and gives the same answer as a non-contiguous input
+        np.random.seed(0)
+        im = np.random.randn(20, 30)
+        im_orig = im.copy()
+        res = pt.corrDn(im, pt.named_filter('binom5'), step=(2, 2))
+        self.assertTrue(np.array_equal(im, im_orig))
+        res_f = pt.corrDn(np.asfortranarray(im), pt.named_filter('binom5'), step=(2, 2))
+        self.assertTrue(np.array_equal(res, res_f))
+
+class convStackTests(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.stack = np.random.randn(4, 20, 24)
+    def test_corrDn(self):
+        filt = pt.named_filter('binom5')
+        for edge_type in ['reflect1', 'circular', 'dont-compute']:
+            res = pt.corrDn(self.stack, filt.T, edge_type, step=(1, 2), start=(1, 1))
+            for im, r in zip(self.stack, res):
+                self.assertTrue(np.array_equal(r, pt.corrDn(im, filt.T, edge_type, step=(1, 2),
+                                                            start=(1, 1))))
+    def test_upConv(self):
+        filt = pt.named_filter('qmf9')
+        for edge_type in ['reflect1', 'circular', 'zero']:
+            res = pt.upConv(self.stack, filt, edge_type, step=(2, 1), stop=(40, 24))
+            for im, r in zip(self.stack, res):
+                self.assertTrue(np.array_equal(r, pt.upConv(im, filt, edge_type, step=(2, 1),
+                                                            stop=(40, 24))))
+    def test_gpyr_build_next(self):
+        pyr = pt.pyramids.GaussianPyramid(self.stack[0])
+        res = pyr._build_next(self.stack)
+        self.assertTrue(np.array_equal(res[1], pyr._build_next(self.stack[1])))
+
+class convOutTests(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.im = np.random.randn(20, 24)
+        self.filt = pt.named_filter('binom5')
+    def test_corrDn(self):
+        ws = pt.ConvWorkspace()
+        out = ws.get('res', (10, 12))
+        res = pt.corrDn(self.im, self.filt, step=(2, 2), out=out, workspace=ws)
+        self.assertTrue(res is out)
+        self.assertTrue(np.array_equal(res, pt.corrDn(self.im, self.filt, step=(2, 2))))
+        self.assertTrue(ws.get('res', (10, 12)) is out)
+    def test_upConv(self):
+        # out starts with garbage in it, which must not end up in the result
+        out = np.ones((40, 48))
+        res = pt.upConv(self.im, self.filt, step=(2, 2), stop=(40, 48), out=out,
+                        workspace=pt.ConvWorkspace())
+        self.assertTrue(res is out)
+        self.assertTrue(np.array_equal(res, pt.upConv(self.im, self.filt, step=(2, 2),
+                                                      stop=(40, 48))))
+    def test_pointOp(self):
+        out = np.empty_like(self.im)
+        res = pt.pointOp(self.im, np.array([0.2, 0.5, 1.0, 0.4, 0.1]), -2, 1, out=out)
+        self.assertTrue(res is out)
+    def test_wrong_out(self):
+        with self.assertRaises(Exception):
+            pt.corrDn(self.im, self.filt, step=(2, 2), out=np.empty((20, 24)))
+
+class convThreadsTests(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.im = np.random.randn(300, 280)
+        self.filt = pt.steerable_filters('sp1_filters')['lo0filt']
+    def tearDown(self):
+        pt.set_num_threads(1)
+    def test_corrDn(self):
+        for edge_type in ['reflect1', 'circular']:
+            res = pt.corrDn(self.im, self.filt, edge_type, step=(2, 1))
+            pt.set_num_threads(3)
+            self.assertEqual(pt.get_num_threads(), 3)
+            self.assertTrue(np.array_equal(res, pt.corrDn(self.im, self.filt, edge_type,
+                                                          step=(2, 1))))
+            pt.set_num_threads(1)
+    def test_upConv(self):
+        for edge_type in ['reflect1', 'circular']:
+            res = pt.upConv(self.im, self.filt, edge_type, step=(2, 1), stop=(600, 280))
+            pt.set_num_threads(3)
+            self.assertTrue(np.allclose(res, pt.upConv(self.im, self.filt, edge_type, step=(2, 1),
+                                                       stop=(600, 280))))
+            pt.set_num_threads(1)
+
+class convSeparableTests(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.im = np.random.randn(40, 36)
+        # a sum of two separable filters
+        self.filt = (np.outer(np.random.randn(7), np.random.randn(9)) +
+                     np.outer(np.random.randn(7), np.random.randn(9)))
+    def test_corrDn(self):
+        for edge_type in ['reflect1', 'reflect2', 'repeat', 'zero', 'circular', 'dont-compute']:
+            res = pt.corrDn(self.im, self.filt, edge_type, step=(2, 3), start=(1, 2),
+                            separable=True)
+            direct = pt.corrDn(self.im, self.filt, edge_type, step=(2, 3), start=(1, 2),
+                               separable=False)
+            self.assertTrue(np.allclose(res, direct, atol=1e-12))
+    def test_upConv(self):
+        for edge_type in ['reflect1', 'reflect2', 'repeat', 'zero', 'circular', 'dont-compute']:
+            res = pt.upConv(self.im, self.filt, edge_type, step=(2, 3), start=(1, 0),
+                            stop=(81, 108), separable=True)
+            direct = pt.upConv(self.im, self.filt, edge_type, step=(2, 3), start=(1, 0),
+                               stop=(81, 108), separable=False)
+            self.assertTrue(np.allclose(res, direct, atol=1e-12))
+    def test_sep_tol(self):
+        noisy = self.filt + 1e-6 * np.random.randn(*self.filt.shape)
+        res = pt.corrDn(self.im, noisy, separable=True, sep_tol=1e-3)
+        self.assertTrue(np.allclose(res, pt.corrDn(self.im, self.filt), atol=1e-4))
+
+class convFFTTests(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.im = np.random.randn(50, 46)
+        self.filt = np.random.randn(15, 13)
+    def test_corrDn(self):
+        for edge_type in ['reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'circular',
+                          'dont-compute']:
+            res = pt.corrDn(self.im, self.filt, edge_type, step=(2, 3), start=(1, 2),
+                            method='fft')
+            direct = pt.corrDn(self.im, self.filt, edge_type, step=(2, 3), start=(1, 2))
+            self.assertTrue(np.allclose(res, direct, atol=1e-12))
+    def test_upConv(self):
+        for edge_type in ['reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'circular',
+                          'dont-compute']:
+            res = pt.upConv(self.im, self.filt, edge_type, step=(2, 3), start=(1, 0),
+                            stop=(101, 138), method='fft')
+            direct = pt.upConv(self.im, self.filt, edge_type, step=(2, 3), start=(1, 0),
+                               stop=(101, 138))
+            self.assertTrue(np.allclose(res, direct, atol=1e-12))
+    def test_stack(self):
+        stack = np.stack([self.im, -2 * self.im])
+        res = pt.corrDn(stack, self.filt, step=(2, 2), method='fft')
+        self.assertTrue(np.allclose(res[1], pt.corrDn(-2 * self.im, self.filt, step=(2, 2))))
+    def test_auto(self):
+        res = pt.corrDn(self.im, self.filt, method='auto')
+        self.assertTrue(np.allclose(res, pt.corrDn(self.im, self.filt), atol=1e-12))
+    def test_wrong_method(self):
+        with self.assertRaises(Exception):
+            pt.corrDn(self.im, self.filt, method='fast')
+
+class convFloat32Tests(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.im = np.random.randn(40, 36)
+        self.filt = np.random.randn(7, 5)
+    def test_corrDn(self):
+        for edge_type in ['reflect1', 'circular', 'dont-compute']:
+            res = pt.corrDn(self.im, self.filt, edge_type, step=(2, 3), dtype=np.float32)
+            self.assertEqual(res.dtype, np.float32)
+            bound = 2**-23 * np.abs(self.filt).sum() * np.abs(self.im).max()
+            diff = res - pt.corrDn(self.im, self.filt, edge_type, step=(2, 3))
+            self.assertTrue(np.abs(diff).max() <= bound)
+    def test_upConv(self):
+        for edge_type in ['reflect2', 'circular', 'zero']:
+            res = pt.upConv(self.im, self.filt, edge_type, step=(2, 3), dtype=np.float32)
+            self.assertEqual(res.dtype, np.float32)
+            bound = ((1 + self.filt.size / 6) * 2**-24 * np.abs(self.filt).sum() *
+                     np.abs(self.im).max())
+            diff = res - pt.upConv(self.im, self.filt, edge_type, step=(2, 3))
+            self.assertTrue(np.abs(diff).max() <= bound)
+    def test_pointOp(self):
+        lut = np.linspace(0, 1, 100)
+        res = pt.pointOp(self.im, lut, -3, .06, dtype=np.float32)
+        self.assertEqual(res.dtype, np.float32)
+        self.assertTrue(np.allclose(res, pt.pointOp(self.im, lut, -3, .06), atol=1e-5))
+    def test_pyramids(self):
+        im = np.random.randn(64, 64)
+        for pyr_class in [pt.pyramids.LaplacianPyramid, pt.pyramids.WaveletPyramid,
+                          pt.pyramids.SteerablePyramidSpace, pt.pyramids.SteerablePyramidFreq]:
+            pyr = pyr_class(im, dtype=np.float32)
+            self.assertTrue(all(c.dtype == np.float32 for c in pyr.pyr_coeffs.values()))
+            recon = pyr.recon_pyr()
+            self.assertEqual(recon.dtype, np.float32)
+            self.assertTrue(np.allclose(recon, pyr_class(im).recon_pyr(), atol=1e-4))
+    def test_wrong_dtype(self):
+        with self.assertRaises(Exception):
+            pt.corrDn(self.im, self.filt, dtype=np.int32)
+
+class convComplexTests(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.im = np.random.randn(40, 36) + 1j * np.random.randn(40, 36)
+        self.filt = np.random.randn(7, 5) + 1j * np.random.randn(7, 5)
+    def test_corrDn(self):
+        for edge_type in ['reflect1', 'circular', 'dont-compute']:
+            res = pt.corrDn(self.im, self.filt.real, edge_type, step=(2, 3))
+            self.assertEqual(res.dtype, np.complex128)
+            real = pt.corrDn(self.im.real, self.filt.real, edge_type, step=(2, 3))
+            imag = pt.corrDn(self.im.imag, self.filt.real, edge_type, step=(2, 3))
+            self.assertTrue(np.allclose(res, real + 1j * imag))
+    def test_upConv(self):
+        for edge_type in ['reflect2', 'circular', 'zero']:
+            res = pt.upConv(self.im, self.filt.real, edge_type, step=(2, 3))
+            real = pt.upConv(self.im.real, self.filt.real, edge_type, step=(2, 3))
+            imag = pt.upConv(self.im.imag, self.filt.real, edge_type, step=(2, 3))
+            self.assertTrue(np.allclose(res, real + 1j * imag))
+    def test_complex_filter(self):
+        res = pt.corrDn(self.im, self.filt, step=(2, 2))
+        parts = [pt.corrDn(self.im, f, step=(2, 2)) for f in [self.filt.real, self.filt.imag]]
+        self.assertTrue(np.allclose(res, parts[0] + 1j * parts[1]))
+        res = pt.upConv(self.im.real, self.filt, 'zero', step=(2, 2))
+        parts = [pt.upConv(self.im.real, f, 'zero', step=(2, 2))
+                 for f in [self.filt.real, self.filt.imag]]
+        self.assertTrue(np.allclose(res, parts[0] + 1j * parts[1]))
+    def test_complex64(self):
+        res = pt.corrDn(self.im, self.filt, dtype=np.float32)
+        self.assertEqual(res.dtype, np.complex64)
+        self.assertTrue(np.allclose(res, pt.corrDn(self.im, self.filt), atol=1e-4))
+
+class pointOpBatchTests(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+        self.im = 3 * np.random.randn(30, 40)
+        self.lut = np.random.rand(50)
+    def test_batch(self):
+        origins = np.array([-3, -2, -1.5])
+        res = pt.pointOp(self.im, self.lut, origins, .12)
+        self.assertEqual(res.shape, (3, 30, 40))
+        for r, o in zip(res, origins):
+            self.assertTrue(np.array_equal(r, pt.pointOp(self.im, self.lut, o, .12)))
+    def test_batch_luts(self):
+        luts = np.random.rand(4, 50)
+        res = pt.pointOp(self.im, luts, -3, [.1, .12, .2, .3], dtype=np.float32)
+        self.assertEqual(res.dtype, np.float32)
+        for r, l, inc in zip(res, luts, [.1, .12, .2, .3]):
+            self.assertTrue(np.array_equal(r, pt.pointOp(self.im, l, -3, inc, dtype=np.float32)))
+    def test_strided(self):
+        for im in [self.im.T, self.im[::2, ::-3], self.im[:, 5], np.random.randn(3, 4, 5, 6).transpose(2, 0, 3, 1)[:, ::2]]:
+            res = pt.pointOp(im, self.lut, -3, .12)
+            self.assertEqual(res.shape, im.shape)
+            self.assertTrue(np.array_equal(res, pt.pointOp(im.copy(), self.lut, -3, .12)))
+
+class SteerablePyramidFreqMaskCacheTests(unittest.TestCase):
+    def tearDown(self):
+        pt.pyramids.set_mask_cache_limits()
+    def test_cached(self):
+        im = np.random.rand(64, 64)
+        pt.pyramids.clear_mask_cache()
+        pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=True)
+        pyr2 = pt.pyramids.SteerablePyramidFreq(im[::-1], is_complex=True)
+        self.assertTrue(pyr._lo0mask is pyr2._lo0mask)
+        self.assertFalse(pyr._himasks[0].flags.writeable)
+        pyr3 = pt.pyramids.SteerablePyramidFreq(im, is_complex=False)
+        self.assertFalse(pyr._anglemasks[0][0] is pyr3._anglemasks[0][0])
+    def test_disabled(self):
+        im = np.random.rand(64, 48)
+        pyr = pt.pyramids.SteerablePyramidFreq(im, order=2)
+        pt.pyramids.set_mask_cache_limits(max_bytes=0)
+        pyr2 = pt.pyramids.SteerablePyramidFreq(im, order=2)
+        self.assertFalse(pyr._lo0mask is pyr2._lo0mask)
+        for k, v in pyr.pyr_coeffs.items():
+            self.assertTrue(np.array_equal(v, pyr2.pyr_coeffs[k]))
+    def test_recon(self):
+        for shape in [(64, 64), (65, 47)]:
+            im = np.random.rand(*shape)
+            pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=True)
+            recon = pyr.recon_pyr(levels=[0, 'residual_lowpass'])
+            self.assertTrue(1 in pyr._recon_maps)
+            pt.pyramids.set_mask_cache_limits(max_bytes=0)
+            pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=True)
+            self.assertTrue(np.array_equal(recon, pyr.recon_pyr(levels=[0, 'residual_lowpass'])))
+            pt.pyramids.set_mask_cache_limits()
+        # the reconstruction maps are shared between pyramids too
+        pyr = pt.pyramids.SteerablePyramidFreq(np.random.rand(64, 64))
+        pyr2 = pt.pyramids.SteerablePyramidFreq(np.random.rand(64, 64), is_complex=True)
+        pyr.recon_pyr()
+        pyr2.recon_pyr()
+        self.assertTrue(pyr._recon_maps[1] is pyr2._recon_maps[1])
+    def test_real(self):
+        # the real pyramid is built on half the Fourier plane, but it's still the real part of
+        # the complex one
+        im = np.random.rand(64, 48)
+        for order in [1, 2]:
+            pyr = pt.pyramids.SteerablePyramidFreq(im, order=order)
+            pyr2 = pt.pyramids.SteerablePyramidFreq(im, order=order, is_complex=True)
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertTrue(np.allclose(v, np.real(pyr2.pyr_coeffs[k]), atol=1e-12))
+            self.assertTrue(np.allclose(pyr.recon_pyr(), pyr2.recon_pyr(), atol=1e-12))
+    def test_limits(self):
+        pt.pyramids.set_mask_cache_limits(max_entries=1)
+        pyr = pt.pyramids.SteerablePyramidFreq(np.random.rand(32, 32))
+        pt.pyramids.SteerablePyramidFreq(np.random.rand(32, 32), order=1)
+        pyr2 = pt.pyramids.SteerablePyramidFreq(np.random.rand(32, 32))
+        self.assertFalse(pyr._lo0mask is pyr2._lo0mask)
+
+class fftBackendTests(unittest.TestCase):
+    def test_scipy(self):
+        im = np.random.rand(64, 48)
+        for is_complex in [False, True]:
+            pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex)
+            with pt.fft_backend('scipy', workers=2):
+                self.assertEqual(pt.get_fft_backend(), ('scipy', 2))
+                pyr2 = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex)
+                recon = pyr2.recon_pyr()
+            self.assertEqual(pt.get_fft_backend(), ('numpy', 1))
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertTrue(np.allclose(v, pyr2.pyr_coeffs[k]))
+            self.assertTrue(np.allclose(recon, pyr.recon_pyr()))
+    def test_restore(self):
+        with self.assertRaises(Exception):
+            with pt.fft_backend('scipy'):
+                pt.set_fft_backend('fftpack')
+        self.assertEqual(pt.get_fft_backend(), ('numpy', 1))
+
+class SteerablePyramidFreqBatchTests(unittest.TestCase):
+    def test_batch(self):
+        ims = np.random.rand(3, 65, 48)
+        for is_complex in [False, True]:
+            pyr = pt.pyramids.SteerablePyramidFreq(ims, is_complex=is_complex)
+            self.assertEqual(pyr.batch_size, 3)
+            self.assertEqual(pyr.image_size, (65, 48))
+            recon = pyr.recon_pyr(levels=[1, 'residual_lowpass'])
+            self.assertEqual(recon.shape, ims.shape)
+            for i, im in enumerate(ims):
+                pyr2 = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex)
+                self.assertEqual(pyr2.batch_size, None)
+                for k, v in pyr2.pyr_coeffs.items():
+                    self.assertEqual(pyr.pyr_size[k], v.shape)
+                    self.assertTrue(np.allclose(pyr.pyr_coeffs[k][i], v))
+                self.assertTrue(np.allclose(recon[i], pyr2.recon_pyr(levels=[1, 'residual_lowpass'])))
+    def test_not_batched(self):
+        with self.assertRaises(Exception):
+            pt.pyramids.LaplacianPyramid(np.random.rand(3, 32, 32))
+
+class SteerablePyramidFreqDftTests(unittest.TestCase):
+    def test_lazy(self):
+        im = np.random.rand(65, 48)
+        for is_complex in [False, True]:
+            pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex)
+            pyr2 = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex, store_dft=True)
+            self.assertEqual(list(pyr.pyr_coeffs.keys()), list(pyr2.pyr_coeffs.keys()))
+            self.assertEqual(pyr.pyr_size, pyr2.pyr_size)
+            self.assertFalse(pyr2.pyr_coeffs.is_computed((0, 0)))
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertTrue(np.allclose(v, pyr2.pyr_coeffs[k], atol=1e-12))
+                self.assertTrue(pyr2.pyr_coeffs.is_computed(k))
+            for k in [(1, 2), 'residual_lowpass']:
+                dft = np.fft.fft2(pyr.pyr_coeffs[k]) if is_complex else np.fft.rfft2(pyr.pyr_coeffs[k])
+                self.assertTrue(np.allclose(dft, pyr2.pyr_dft[k]))
+    def test_recon(self):
+        im = np.random.rand(64, 47)
+        for is_complex in [False, True]:
+            pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex, store_dft=True)
+            pyr2 = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex)
+            self.assertTrue(np.allclose(pyr.recon_pyr(), pyr2.recon_pyr()))
+            # modified coefficients are used instead of the spectra
+            pyr.pyr_coeffs[(0, 1)][:] = 0
+            pyr2.pyr_coeffs[(0, 1)][:] = 0
+            self.assertTrue(np.allclose(pyr.recon_pyr(), pyr2.recon_pyr()))
+            self.assertTrue(np.allclose(pyr.recon_pyr(levels=1), pyr2.recon_pyr(levels=1)))
 
 class blurTests(unittest.TestCase):
     def test0(self):
@@ -261,6 +614,124 @@ class binomialFilterTests(unittest.TestCase):
         #target = target / np.sqrt(np.sum(target ** 2))
         self.assertTrue((pt.binomial_filter(5) == target).all())
 
+class lazyPyramidTests(unittest.TestCase):
+    def test_bands(self):
+        im = np.random.rand(65, 47)
+        for pyr_class, kwargs in [(pt.pyramids.GaussianPyramid, {}), (pt.pyramids.LaplacianPyramid, {}),
+                                  (pt.pyramids.WaveletPyramid, {}), (pt.pyramids.SteerablePyramidSpace, {}),
+                                  (pt.pyramids.SteerablePyramidFreq, {}),
+                                  (pt.pyramids.SteerablePyramidFreq, {'is_complex': True})]:
+            pyr = pyr_class(im, **kwargs)
+            lazy = pyr_class(im, lazy=True, **kwargs)
+            self.assertEqual(pyr.pyr_size, lazy.pyr_size)
+            self.assertEqual(list(pyr.pyr_coeffs.keys()), list(lazy.pyr_coeffs.keys()))
+            # go from coarse to fine, so the lowpass images have to be recomputed
+            for k in reversed(list(pyr.pyr_coeffs.keys())):
+                self.assertTrue(np.array_equal(pyr.pyr_coeffs[k], lazy.pyr_coeffs[k]))
+            self.assertEqual(len(lazy._lowpass_cache), 0)
+    def test_partial(self):
+        im = np.random.rand(64, 64)
+        pyr = pt.pyramids.LaplacianPyramid(im)
+        lazy = pt.pyramids.LaplacianPyramid(im, lazy=True)
+        lazy.lowpass_cache_size = 1
+        self.assertTrue(np.array_equal(pyr.recon_pyr(levels=[0, 1]), lazy.recon_pyr(levels=[0, 1])))
+        self.assertEqual([lazy.pyr_coeffs.is_computed(k) for k in lazy.pyr_coeffs],
+                         [True, True] + [False] * (lazy.num_scales - 2))
+        # recon_pyr goes from coarse to fine, so level 1 was the last one used
+        self.assertEqual(list(lazy._lowpass_cache.keys()), [1])
+
+class packedPyramidTests(unittest.TestCase):
+    def test_packed(self):
+        im = np.random.rand(65, 47)
+        for pyr_class, kwargs in [(pt.pyramids.GaussianPyramid, {}), (pt.pyramids.LaplacianPyramid, {}),
+                                  (pt.pyramids.WaveletPyramid, {}), (pt.pyramids.SteerablePyramidSpace, {}),
+                                  (pt.pyramids.SteerablePyramidFreq, {'is_complex': True})]:
+            pyr = pyr_class(im, **kwargs)
+            packed = pyr_class(im, packed=True, **kwargs)
+            self.assertEqual(pyr.pyr_buffer, None)
+            self.assertEqual(packed.pyr_buffer.shape, (sum([np.prod(s) for s in pyr.pyr_size.values()]),))
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertTrue(np.array_equal(v, packed.pyr_coeffs[k]))
+                self.assertTrue(np.shares_memory(packed.pyr_buffer, packed.pyr_coeffs[k]))
+    def test_pack(self):
+        pyr = pt.pyramids.SteerablePyramidSpace(np.random.rand(64, 48), lazy=True)
+        buffer = pyr.pack(order='F')
+        self.assertFalse(pyr.lazy)
+        self.assertTrue(np.array_equal(buffer, np.concatenate([v.flatten(order='F') for v in pyr.pyr_coeffs.values()])))
+        pyr.pyr_coeffs[(1, 0)] = 1
+        start, stop = pyr.pyr_coeffs.index[(1, 0)]
+        self.assertTrue((buffer[start:stop] == 1).all())
+        # matlabPyrTools pyramids are column vectors
+        self.assertTrue(pt.comparePyr(buffer[:, None], pyr))
+        self.assertEqual(len(pyr.pyr_coeffs), 2 + 2 * pyr.num_scales)
+
+class pyramidArithmeticTests(unittest.TestCase):
+    def test_scale(self):
+        im = np.random.rand(64, 48)
+        for packed in [False, True]:
+            pyr = pt.pyramids.WaveletPyramid(im, packed=packed)
+            coeffs = {k: v.copy() for k, v in pyr.pyr_coeffs.items()}
+            scaled = pyr.scale(2)
+            pyr.scale({k: 3 for k in coeffs}, levels=[1, 'residual_lowpass'], bands=[0, 2], inplace=True)
+            for k, v in coeffs.items():
+                self.assertTrue(np.array_equal(scaled.pyr_coeffs[k], 2 * v))
+                gain = 3 if k == 'residual_lowpass' or (k[0] == 1 and k[1] != 1) else 1
+                self.assertTrue(np.array_equal(pyr.pyr_coeffs[k], gain * v))
+    def test_threshold(self):
+        im = np.random.rand(64, 64)
+        for is_complex in [False, True]:
+            pyr = pt.pyramids.SteerablePyramidFreq(im, is_complex=is_complex, packed=True)
+            soft = pyr.threshold(.1)
+            hard = pyr.threshold(.1, mode='hard', levels=0)
+            for k, v in pyr.pyr_coeffs.items():
+                shrunk = np.maximum(np.abs(v) - .1, 0)
+                self.assertTrue(np.allclose(soft.pyr_coeffs[k], shrunk * np.exp(1j * np.angle(v))))
+                if k in hard._band_keys(0, 'all'):
+                    self.assertTrue(np.array_equal(hard.pyr_coeffs[k], v * (np.abs(v) > .1)))
+                else:
+                    self.assertTrue(np.array_equal(hard.pyr_coeffs[k], v))
+    def test_add(self):
+        im = np.random.rand(64, 48)
+        pyr = pt.pyramids.LaplacianPyramid(im)
+        for packed in [False, True]:
+            pyr2 = pt.pyramids.LaplacianPyramid(im[::-1], packed=packed)
+            total = pyr2.add(pyr, weight=.5)
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertTrue(np.allclose(total.pyr_coeffs[k], pyr2.pyr_coeffs[k] + .5 * v))
+            self.assertTrue(np.allclose(total.recon_pyr(), im[::-1] + .5 * im))
+            pyr2.apply(np.negative, inplace=True, elementwise=True).add(pyr2, weight=-1, inplace=True)
+            self.assertFalse(np.any(pyr2.pyr_buffer if packed else pyr2.pyr_coeffs[(0, 0)]))
+
+class pyramidIOTests(unittest.TestCase):
+    def test_save_load(self):
+        im = np.random.rand(64, 48)
+        path = op.join(tempfile.mkdtemp(), 'pyr.pyr')
+        for pyr_class, kwargs in [(pt.pyramids.LaplacianPyramid, {'upsample_filter_name': 'binom3'}),
+                                  (pt.pyramids.WaveletPyramid, {'filter_name': 'daub2'}),
+                                  (pt.pyramids.SteerablePyramidSpace, {'order': 3}),
+                                  (pt.pyramids.SteerablePyramidFreq, {'is_complex': True, 'dtype': np.float32})]:
+            pyr = pyr_class(im, **kwargs)
+            pyr.save(path)
+            for mmap in [False, True]:
+                loaded = pyr_class.load(path, mmap=mmap)
+                self.assertEqual(loaded.pyr_size, pyr.pyr_size)
+                self.assertEqual(loaded.dtype, pyr.dtype)
+                self.assertIsNone(loaded.image)
+                for k, v in pyr.pyr_coeffs.items():
+                    self.assertTrue(np.array_equal(loaded.pyr_coeffs[k], v))
+                    self.assertEqual(isinstance(loaded.pyr_coeffs[k], np.memmap), mmap)
+                self.assertTrue(np.array_equal(loaded.recon_pyr(), pyr.recon_pyr()))
+                del loaded
+    def test_image(self):
+        im = np.random.rand(2, 64, 64)
+        path = op.join(tempfile.mkdtemp(), 'pyr.pyr')
+        pt.pyramids.SteerablePyramidFreq(im, height=3).save(path, include_image=True)
+        pyr = pt.pyramids.load_pyramid(path)
+        self.assertEqual(pyr.batch_size, 2)
+        self.assertTrue(np.array_equal(pyr.image, im))
+        with self.assertRaises(Exception):
+            pt.pyramids.GaussianPyramid.load(path)
+
 class GpyrTests(unittest.TestCase):
     def test1(self):
         matPyr = scipy.io.loadmat(op.join(matfiles_path, 'buildGpyr1.mat'))
@@ -363,6 +834,105 @@ class LpyrTests(unittest.TestCase):
         recon = pyPyr.recon_pyr(levels=[0, 2, 4])
         self.assertTrue((matPyr['recon'] == recon).all())
 
+class tiledPyramidTests(unittest.TestCase):
+    def test_tiled(self):
+        tmp_dir = tempfile.mkdtemp()
+        im = np.memmap(op.join(tmp_dir, 'im.dat'), np.float64, 'w+', shape=(211, 73))
+        im[:] = np.random.rand(211, 73)
+        path = op.join(tmp_dir, 'pyr.pyr')
+        for pyr_class, kwargs in [(pt.pyramids.GaussianPyramid, {}),
+                                  (pt.pyramids.GaussianPyramid, {'filter_name': 'qmf9', 'edge_type': 'zero'}),
+                                  (pt.pyramids.LaplacianPyramid, {}),
+                                  (pt.pyramids.LaplacianPyramid, {'upsample_filter_name': 'binom3', 'dtype': np.float32})]:
+            pyr = pyr_class(im, **kwargs)
+            for rows in [1, 16, 1000]:
+                tiled = pyr_class.build_tiled(im, path, rows=rows, **kwargs)
+                self.assertEqual(tiled.pyr_size, pyr.pyr_size)
+                for k, v in pyr.pyr_coeffs.items():
+                    self.assertTrue(np.array_equal(tiled.pyr_coeffs[k], v))
+                del tiled
+    def test_reader(self):
+        im = np.random.rand(100, 64)
+        path = op.join(tempfile.mkdtemp(), 'pyr.pyr')
+        pyr = pt.pyramids.LaplacianPyramid(im, height=4)
+        tiled = pt.pyramids.LaplacianPyramid.build_tiled(lambda start, stop: im[start:stop], path, rows=8,
+                                                         image_size=im.shape, height=4)
+        self.assertTrue(np.array_equal(tiled.recon_pyr(), pyr.recon_pyr()))
+        with self.assertRaises(Exception):
+            pt.pyramids.GaussianPyramid.build_tiled(im, path, edge_type='circular')
+
+class pyramidUpdateTests(unittest.TestCase):
+    def test_update(self):
+        im = np.random.rand(130, 97)
+        for pyr_class in [pt.pyramids.GaussianPyramid, pt.pyramids.LaplacianPyramid]:
+            for edge_type in ['reflect1', 'zero', 'circular']:
+                pyr = pyr_class(im, edge_type=edge_type)
+                new = im.copy()
+                for start, stop in [((40, 30), (52, 45)), ((0, 90), (5, 97)), ((128, 0), (130, 3))]:
+                    new[start[0]:stop[0], start[1]:stop[1]] = np.random.rand(stop[0] - start[0], stop[1] - start[1])
+                    pyr.update(new, start, stop)
+                rebuilt = pyr_class(new, edge_type=edge_type)
+                self.assertTrue(np.array_equal(pyr.image, new))
+                for k, v in rebuilt.pyr_coeffs.items():
+                    self.assertTrue(np.allclose(pyr.pyr_coeffs[k], v, rtol=0, atol=1e-12))
+    def test_lazy(self):
+        im = np.random.rand(64, 64)
+        pyr = pt.pyramids.LaplacianPyramid(im, lazy=True)
+        pyr.pyr_coeffs[(1, 0)]
+        new = im.copy()
+        new[10:20, 10:20] = 0
+        pyr.update(new, (10, 10), (20, 20))
+        rebuilt = pt.pyramids.LaplacianPyramid(new)
+        for k, v in rebuilt.pyr_coeffs.items():
+            self.assertTrue(np.allclose(pyr.pyr_coeffs[k], v, rtol=0, atol=1e-12))
+
+class reduceExpandTests(unittest.TestCase):
+    def tearDown(self):
+        pt.set_num_threads(1)
+    def test_reduce_expand(self):
+        im = np.random.randn(53, 40)
+        for filt, up_filt in [('binom5', 'binom5'), ('daub2', 'binom3')]:
+            filt = pt.named_filter(filt)
+            up_filt = pt.named_filter(up_filt)
+            for edge_type in ['reflect1', 'zero', 'extend', 'circular']:
+                for dtype in [np.float64, np.float32]:
+                    band, lowpass = pt.reduce_expand(im, filt, up_filt, edge_type, dtype)
+                    tmp = pt.corrDn(im, filt.T, edge_type, step=(1, 2), dtype=dtype)
+                    low = pt.corrDn(tmp, filt, edge_type, step=(2, 1), dtype=dtype)
+                    tmp = pt.upConv(low, up_filt, edge_type, step=(2, 1), stop=(53, 20), dtype=dtype)
+                    recon = pt.upConv(tmp, up_filt.T, edge_type, step=(1, 2), stop=(53, 40), dtype=dtype)
+                    self.assertTrue(np.array_equal(lowpass, low))
+                    self.assertTrue(np.array_equal(band, im.astype(dtype) - recon))
+    def test_pyramid(self):
+        for im in [np.random.randn(70, 64), np.random.randn(70, 1)]:
+            pyr = pt.pyramids.LaplacianPyramid(im)
+            lazy = pt.pyramids.LaplacianPyramid(im, lazy=True)
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertTrue(np.array_equal(lazy.pyr_coeffs[k], v))
+    def test_small_levels(self):
+        # these reach levels with a single row or column, and levels with two of them
+        for shape, filt, up_filt in [((8, 8), 'haar', None), ((64, 64), 'haar', None),
+                                     ((48, 80), 'haar', None), ((63, 65), 'haar', 'binom3'),
+                                     ((33, 17), 'haar', None), ((33, 17), 'binom3', 'haar')]:
+            im = np.random.randn(*shape)
+            pyr = pt.pyramids.LaplacianPyramid(im, downsample_filter_name=filt,
+                                               upsample_filter_name=up_filt)
+            lazy = pt.pyramids.LaplacianPyramid(im, downsample_filter_name=filt,
+                                                upsample_filter_name=up_filt, lazy=True)
+            for k, v in pyr.pyr_coeffs.items():
+                self.assertTrue(np.array_equal(lazy.pyr_coeffs[k], v))
+            self.assertTrue(np.allclose(pyr.recon_pyr(), im))
+    def test_threads(self):
+        im = np.random.randn(301, 280)
+        for filt in ['binom5', 'haar', 'qmf9']:
+            filt = pt.named_filter(filt)
+            band, lowpass = pt.reduce_expand(im, filt)
+            pt.set_num_threads(3)
+            threaded = pt.reduce_expand(im, filt)
+            pt.set_num_threads(1)
+            self.assertTrue(np.array_equal(threaded[0], band))
+            self.assertTrue(np.array_equal(threaded[1], lowpass))
+
 class WpyrTests(unittest.TestCase):
     def test0(self):
         matPyr = scipy.io.loadmat(op.join(matfiles_path, 'buildWpyr0.mat'))
@@ -513,6 +1083,61 @@ class WpyrTests(unittest.TestCase):
         res = pyr.recon_pyr()
         self.assertTrue(np.allclose(res, im))
 
+class waveletReduceExpandTests(unittest.TestCase):
+    def tearDown(self):
+        pt.set_num_threads(1)
+    def test_wavelet_reduce(self):
+        im = np.random.randn(53, 40)
+        for filt in ['qmf9', 'daub2']:
+            lo = pt.named_filter(filt)
+            hi = pt.pyramids.WaveletPyramid._modulate_flip(lo)
+            stagger = (lo.size + 1) % 2
+            for edge_type in ['reflect1', 'zero', 'extend', 'circular']:
+                for dtype in [np.float64, np.float32]:
+                    bands = pt.wavelet_reduce(im, lo, hi, stagger, edge_type, dtype)
+                    l = pt.corrDn(im, lo, edge_type, step=(2, 1), start=(stagger, 0), dtype=dtype)
+                    h = pt.corrDn(im, hi, edge_type, step=(2, 1), start=(1, 0), dtype=dtype)
+                    for band, tmp, filt_x, start in zip(bands, [l, h, l, h], [lo, lo, hi, hi],
+                                                        [stagger, stagger, 1, 1]):
+                        self.assertTrue(np.array_equal(band, pt.corrDn(tmp, filt_x.T, edge_type, step=(1, 2), start=(0, start), dtype=dtype)))
+    def test_wavelet_expand(self):
+        for filt in ['qmf9', 'daub2']:
+            lo = pt.named_filter(filt)
+            hi = pt.pyramids.WaveletPyramid._modulate_flip(lo)
+            stagger = (lo.size + 1) % 2
+            for edge_type in ['reflect1', 'zero', 'extend', 'circular']:
+                pyr = pt.pyramids.WaveletPyramid(np.random.randn(64, 48), 1, filt, edge_type)
+                for bands in ['all', [1], [0, 2]]:
+                    recon = pyr.recon_pyr(bands=bands)
+                    keys = pyr._recon_keys('all', bands)
+                    lohi, hilo, hihi = [pyr.pyr_coeffs[(0, b)] if (0, b) in keys else None for b in range(3)]
+                    for dtype in [np.float64, np.float32]:
+                        res = pt.wavelet_expand(pyr.pyr_coeffs['residual_lowpass'], lohi, hilo, hihi, lo, hi, stagger, (64, 48), edge_type, dtype)
+                        tmp = pt.upConv(pyr.pyr_coeffs['residual_lowpass'], lo.T, edge_type, step=(1, 2), start=(0, stagger), stop=(32, 48), dtype=dtype)
+                        expected = pt.upConv(tmp, lo, edge_type, step=(2, 1), start=(stagger, 0), stop=(64, 48), dtype=dtype)
+                        for band, filt_x, start_x, filt_y, start_y in [(lohi, lo, stagger, hi, 1), (hilo, hi, 1, lo, stagger), (hihi, hi, 1, hi, 1)]:
+                            if band is not None:
+                                tmp = pt.upConv(band, filt_x.T, edge_type, step=(1, 2), start=(0, start_x), stop=(32, 48), dtype=dtype)
+                                expected += pt.upConv(tmp, filt_y, edge_type, step=(2, 1), start=(start_y, 0), stop=(64, 48), dtype=dtype)
+                        self.assertTrue(np.array_equal(res, expected))
+                        if dtype == np.float64:
+                            self.assertTrue(np.array_equal(recon, expected))
+    def test_threads(self):
+        im = np.random.randn(301, 280)
+        for filt in ['qmf9', 'daub2']:
+            lo = pt.named_filter(filt)
+            hi = pt.pyramids.WaveletPyramid._modulate_flip(lo)
+            stagger = (lo.size + 1) % 2
+            bands = pt.wavelet_reduce(im, lo, hi, stagger)
+            recon = pt.wavelet_expand(*bands, lo, hi, stagger, im.shape)
+            pt.set_num_threads(3)
+            threaded = pt.wavelet_reduce(im, lo, hi, stagger)
+            threaded_recon = pt.wavelet_expand(*bands, lo, hi, stagger, im.shape)
+            pt.set_num_threads(1)
+            for band, threaded_band in zip(bands, threaded):
+                self.assertTrue(np.array_equal(threaded_band, band))
+            self.assertTrue(np.array_equal(threaded_recon, recon))
+
 class spFilterTests(unittest.TestCase):
     def test1(self):
         matFilt0 = scipy.io.loadmat(op.join(matfiles_path, 'sp0Filters.mat'))
@@ -1,6 +1,8 @@
 from . import pyramids
 
-from .pyramids.c.wrapper import corrDn, upConv, pointOp
+from .pyramids.c.wrapper import corrDn, upConv, reduce_expand, wavelet_reduce, wavelet_expand
+from .pyramids.c.wrapper import pointOp, ConvWorkspace
+from .pyramids.c.wrapper import set_num_threads, get_num_threads
 from .pyramids.filters import named_filter, binomial_filter, steerable_filters
 
 from .tools import synthetic_images
@@ -8,6 +10,7 @@ from .tools.convolutions import blurDn, blur, upBlur, image_gradient, rconv2
 from .tools.display import imshow, animshow, pyrshow
 from .tools.image_stats import image_compare, image_stats, range, skew, var, entropy
 from .tools.utils import rcosFn, matlab_histo, matlab_round, project_polar_to_cartesian
+from .tools.fft import set_fft_backend, get_fft_backend, fft_backend
 from .tools.compare_matpyrtools import comparePyr, compareRecon
 
 from .version import version as __version__
@@ -1,5 +1,8 @@
+import numpy as np
 from .pyramid import Pyramid
 from .filters import parse_filter
+from .pyr_utils import ImageShape, RowReader
+from .pyr_io import create_pyramid_file
 from .c.wrapper import corrDn
 
 
@@ -32,6 +35,16 @@ class GaussianPyramid(Pyramid):
         * `'zero'` - assume values of zero outside image boundary
         * `'extend'` - reflect and invert
         * `'dont-compute'` - zero output when filter overhangs imput boundaries.
+    dtype : {np.float64, np.float32}
+        Precision with which the pyramid is built (and reconstructed): the image and all the
+        coefficients are stored with this type. float32 halves the memory used; see `corrDn` and
+        `upConv` for how much the results can differ from float64.
+    lazy : `bool`
+        Whether to only compute each level when it's first accessed (see `Pyramid`), instead of
+        building the whole pyramid right away.
+    packed : `bool`
+        Whether to store all the coefficients in a single buffer, `pyr_buffer`, which the values of
+        `pyr_coeffs` are views into (see `Pyramid.pack`). Can't be used with `lazy`.
 
     Attributes
     ----------
@@ -43,6 +56,8 @@ class GaussianPyramid(Pyramid):
         Human-readable string specifying the type of pyramid. For base class, is None.
     edge_type : `str`
         Specifies how edges were handled.
+    dtype : `np.dtype`
+        The precision of the image and the coefficients.
     pyr_coeffs : `dict`
         Dictionary containing the coefficients of the pyramid. Keys are `(level, band)` tuples and
         values are 1d or 2d numpy arrays (same number of dimensions as the input image)
@@ -67,8 +82,9 @@ class GaussianPyramid(Pyramid):
 
     """
 
-    def __init__(self, image, height='auto', filter_name='binom5', edge_type='reflect1', **kwargs):
-        super().__init__(image=image, edge_type=edge_type)
+    def __init__(self, image, height='auto', filter_name='binom5', edge_type='reflect1',
+                 dtype=np.float64, lazy=False, packed=False, **kwargs):
+        super().__init__(image=image, edge_type=edge_type, dtype=dtype, lazy=lazy)
         if self.pyr_type is None:
             self.pyr_type = 'Gaussian'
         self.num_orientations = 1
@@ -81,22 +97,58 @@ class GaussianPyramid(Pyramid):
             self.filters['upsample_filter'] = parse_filter(upsamp_filt, normalize=False)
         self._set_num_scales('downsample_filter', height, 1)
 
-        self._build_pyr()
+        if packed:
+            self._set_packed(self._level_sizes())
+        if self.lazy:
+            self._set_lazy(self._level_sizes())
+        else:
+            self._build_pyr()
+
+    def _save_params(self):
+        """the arguments needed to create this pyramid, for `save`"""
+        return {'height': self.num_scales, 'edge_type': self.edge_type,
+                'filter_name': self.filters['downsample_filter'].tolist()}
+
+    def _level_sizes(self):
+        """compute the size of each level of the pyramid, without building it"""
+        sizes = {}
+        size = tuple(self.image_size)
+        for lev in range(self.num_scales):
+            sizes[(lev, 0)] = size
+            # _build_next downsamples by 2 along the dimensions that aren't 1 (along both, if
+            # neither is)
+            if size[0] == 1:
+                size = (1, (size[1]+1) // 2)
+            elif size[1] == 1:
+                size = ((size[0]+1) // 2, 1)
+            else:
+                size = ((size[0]+1) // 2, (size[1]+1) // 2)
+        return sizes
+
+    def _next_lowpass(self, lev, image):
+        """build the image of level lev+1 from that of level lev, for lazy pyramids"""
+        return self._build_next(image)
+
+    def _compute_bands(self, key):
+        """compute a level of a lazy pyramid (see `Pyramid._set_lazy`)"""
+        # the lowpass images are cached, so we need a copy
+        return {key: self._lowpass(key[0]).copy()}
 
     def _build_next(self, image):
         """build the next level of the pyramid
 
         This should not be called directly by users, it's a helper function for constructing the
-        pyramid
+        pyramid. `image` can also be a 3d stack of images (see `corrDn`), in which case the next
+        level is built for all of them at once.
 
         """
-        if image.shape[0] == 1:
-            res = corrDn(image=image, filt=self.filters['downsample_filter'].T, edge_type=self.edge_type, step=(1, 2))
-        elif image.shape[1] == 1:
-            res = corrDn(image=image, filt=self.filters['downsample_filter'], edge_type=self.edge_type, step=(2, 1))
+        if image.shape[-2] == 1:
+            res = corrDn(image=image, filt=self.filters['downsample_filter'].T, edge_type=self.edge_type, dtype=self.dtype, step=(1, 2))
+        elif image.shape[-1] == 1:
+            res = corrDn(image=image, filt=self.filters['downsample_filter'], edge_type=self.edge_type, dtype=self.dtype, step=(2, 1))
         else:
-            tmp = corrDn(image=image, filt=self.filters['downsample_filter'].T, edge_type=self.edge_type, step=(1, 2))
-            res = corrDn(image=tmp, filt=self.filters['downsample_filter'], edge_type=self.edge_type, step=(2, 1))
+            tmp = corrDn(image=image, filt=self.filters['downsample_filter'].T, edge_type=self.edge_type, dtype=self.dtype, step=(1, 2))
+            res = corrDn(image=tmp, filt=self.filters['downsample_filter'], edge_type=self.edge_type, dtype=self.dtype, step=(2, 1))
         return res
 
     def _build_pyr(self):
@@ -111,13 +163,188 @@ class GaussianPyramid(Pyramid):
         constructor
         """
         im = self.image
-        self.pyr_coeffs[(0, 0)] = self.image.copy()
+        # packed coefficients copy the image into their buffer anyway
+        self.pyr_coeffs[(0, 0)] = self.image if self.pyr_buffer is not None else self.image.copy()
         self.pyr_size[(0, 0)] = self.image_size
         for lev in range(1, self.num_scales):
+            # _build_next returns a new array, so we don't need to copy it
             im = self._build_next(im)
-            self.pyr_coeffs[(lev, 0)] = im.copy()
+            self.pyr_coeffs[(lev, 0)] = im
             self.pyr_size[(lev, 0)] = im.shape
 
+    def update(self, image, start, stop):
+        """Update the pyramid after the image changed inside a rectangle
+
+        Only the coefficients that depend on the pixels that changed, from `start` (included) to
+        `stop` (excluded), are updated, so this costs about as much as building the pyramid of an
+        image the size of that rectangle, not of the whole image. The pyramid is linear in the
+        image, so we build it for the difference between the new and old values of the rectangle
+        (surrounded by enough zeros that the edges of each patch don't matter) and add that to
+        the coefficients. The result agrees with a pyramid built from scratch on the new image up
+        to floating point rounding.
+
+        The bands of a lazy pyramid that haven't been computed yet will be computed from the new
+        image when they're needed.
+
+        Parameters
+        ----------
+        image : `array_like`
+            The new image, of the same size as `image`. Only the values inside the rectangle are
+            read.
+        start : `tuple`
+            2-tuple (y, x) with the first row and column of the rectangle that changed.
+        stop : `tuple`
+            2-tuple (y, x) with the row and column just past the end of the rectangle.
+
+        Returns
+        -------
+        pyr : `GaussianPyramid`
+            The pyramid itself, which is updated in place.
+        """
+        if self.image is None or self.batch_size is not None:
+            raise Exception("Can only update pyramids built on a single image!")
+        image = np.asarray(image)
+        if image.ndim == 1:
+            image = image.reshape(-1, 1)
+        if image.shape != self.image.shape:
+            raise Exception("image must have shape %s, but got %s!" % (self.image.shape, image.shape))
+        start = tuple(max(int(s), 0) for s in start)
+        stop = tuple(min(int(s), n) for s, n in zip(stop, self.image_size))
+        if start[0] >= stop[0] or start[1] >= stop[1]:
+            return self
+        window = (slice(start[0], stop[0]), slice(start[1], stop[1]))
+        new = image[window].astype(self.dtype)
+        delta = new - self.image[window]
+        self.image[window] = new
+        self._lowpass_cache.clear()
+
+        # beyond this many samples from the change, every filter window (and upsampled
+        # contribution) is zero, so the patches don't need to extend any further
+        margin = 2 * max(max(f.shape) for f in self.filters.values()) + 2
+        origin = start
+        for lev in range(self.num_scales):
+            delta_next = None
+            if lev < self.num_scales - 1:
+                delta, origin = self._pad_patch(delta, origin, self.pyr_size[(lev, 0)], margin)
+                delta_next = self._build_next(delta)
+            key = (lev, 0)
+            if not self.lazy or self.pyr_coeffs.is_computed(key):
+                band = self.pyr_coeffs[key]
+                band[origin[0]:origin[0]+delta.shape[0], origin[1]:origin[1]+delta.shape[1]] += self._band_delta(delta, delta_next)
+            # the patches start at even samples, so halving gives the origin of the next one
+            delta, origin = delta_next, (origin[0] // 2, origin[1] // 2)
+        return self
+
+    def _pad_patch(self, patch, origin, size, margin):
+        """pad patch, at origin of a level of the given size, with margin zeros on each side
+
+        The padding stops at the edges of the level, and the padded patch starts at an even
+        sample, so that downsampling it gives samples of the next level. With circular edges,
+        patches that would extend past the edge cover the whole level along that dimension
+        instead. Returns the padded patch and its origin.
+        """
+        lo, hi = [], []
+        for o, n, dim in zip(origin, patch.shape, size):
+            if self.edge_type == 'circular' and (o - margin < 0 or o + n + margin > dim):
+                lo.append(0)
+                hi.append(dim)
+            else:
+                lo.append(max(o - margin, 0) // 2 * 2)
+                hi.append(min(o + n + margin, dim))
+        padded = np.zeros((hi[0] - lo[0], hi[1] - lo[1]), dtype=patch.dtype)
+        padded[origin[0]-lo[0]:origin[0]-lo[0]+patch.shape[0],
+               origin[1]-lo[1]:origin[1]-lo[1]+patch.shape[1]] = patch
+        return padded, tuple(lo)
+
+    def _band_delta(self, delta, delta_next):
+        """the change in a band, given the change in its lowpass image and the next one, for `update`"""
+        return delta
+
+    @classmethod
+    def build_tiled(cls, image, path, rows=256, image_size=None, **kwargs):
+        """Build the pyramid of an image too large to fit in memory, writing it to a file
+
+        The image is read a strip of rows at a time, and each level is computed from the one below
+        it in strips of `rows` rows, straight into the file `path` (see `save` for its format), so
+        that only a few strips are ever in memory. Each strip is read with enough extra rows on
+        either side (set by the size of the filters) that the rows computed don't depend on where
+        the strips start and stop, so the coefficients are exactly the same as those of the
+        pyramid built in memory (if `corrDn` and `upConv` only use a single thread, see
+        `set_num_threads`).
+
+        Circular edges aren't supported, since there the rows at the top of each level depend on
+        those at the bottom.
+
+        Parameters
+        ----------
+        image : `array_like` or `callable`
+            1d or 2d image that can be read a few rows at a time, e.g., a `np.memmap`, or a function
+            taking `start` and `stop` and returning rows `start` to `stop` (excluded) of the image.
+        path : `str`
+            The file to write the pyramid to.
+        rows : `int`
+            Number of rows of each level computed at once. Each strip holds about twice as many
+            rows of the level below, so this sets how much memory is used.
+        image_size : `tuple` or None
+            The size of the image. Must be given if `image` is a function, ignored otherwise.
+        kwargs :
+            The other arguments used to create the pyramid (e.g., `height`, `filter_name`,
+            `dtype`).
+
+        Returns
+        -------
+        pyr : `GaussianPyramid`
+            The pyramid, loaded from `path` with `mmap=True` (see `load`).
+        """
+        rows = int(rows)
+        if rows < 1:
+            raise Exception("rows must be a positive integer, but got %d!" % rows)
+        reader = RowReader(image, image_size, kwargs.get('dtype', np.float64))
+        pyr = cls(ImageShape(reader.shape), lazy=True, **kwargs)
+        if pyr.edge_type == 'circular':
+            raise Exception("Can't build pyramids with circular edges in strips!")
+        bands = create_pyramid_file(pyr, path)
+        pyr._build_tiled(reader, bands, rows)
+        for band in bands.values():
+            band.flush()
+        del bands
+        return cls.load(path, mmap=True)
+
+    def _build_tiled(self, image, bands, rows):
+        """build the pyramid of image (a `RowReader`) into bands, a strip at a time
+
+        This should not be called directly by users, see `build_tiled`.
+        """
+        for start in range(0, image.shape[0], rows):
+            bands[(0, 0)][start:start+rows] = image[start:start+rows]
+        for lev in range(1, self.num_scales):
+            self._build_next_tiled(bands[(lev-1, 0)], bands[(lev, 0)], rows)
+
+    def _build_next_tiled(self, image, out, rows):
+        """compute out, the next level of the pyramid, from image, a strip at a time
+
+        Equivalent to ``out[:] = self._build_next(image[:])``, but only reads the rows of image
+        needed for `rows` rows of out at once.
+        """
+        filt = self.filters['downsample_filter']
+        if image.shape[0] <= 2 * rows:
+            out[:] = self._build_next(image[:])
+            return
+        for start in range(0, out.shape[0], rows):
+            stop = min(start + rows, out.shape[0])
+            # the filter size on either side is enough for the C code to treat all the rows we
+            # keep as interior ones, which don't depend on the edges of the strip (unless those are
+            # also the edges of image, in which case they are handled like they would be there)
+            strip_start = max(2*start - filt.shape[0], 0)
+            strip = image[strip_start:min(2*stop + filt.shape[0], image.shape[0])]
+            if strip.shape[1] != 1:
+                strip = corrDn(image=strip, filt=filt.T, edge_type=self.edge_type, dtype=self.dtype, step=(1, 2))
+            # the C code can't handle windows ending this close to the edge, so we compute all the
+            # rows to the end of the strip and only keep the ones we want
+            res = corrDn(image=strip, filt=filt, edge_type=self.edge_type, dtype=self.dtype, step=(2, 1),
+                         start=(2*start - strip_start, 0))
+            out[start:stop] = res[:stop - start]
+
     def recon_pyr(self, *args):
         """Reconstruct the pyramid -- NOT NECESSARY FOR GAUSSIANS
         """
@@ -1,7 +1,7 @@
 import numpy as np
 from .GaussianPyramid import GaussianPyramid
 from .filters import parse_filter
-from .c.wrapper import upConv
+from .c.wrapper import upConv, reduce_expand
 
 
 class LaplacianPyramid(GaussianPyramid):
@@ -44,6 +44,17 @@ class LaplacianPyramid(GaussianPyramid):
         * `'zero'` - assume values of zero outside image boundary
         * `'extend'` - reflect and invert
         * `'dont-compute'` - zero output when filter overhangs imput boundaries.
+    dtype : {np.float64, np.float32}
+        Precision with which the pyramid is built (and reconstructed): the image and all the
+        coefficients are stored with this type. float32 halves the memory used; see `corrDn` and
+        `upConv` for how much the results can differ from float64.
+    lazy : `bool`
+        Whether to only compute each level when it's first accessed (see `Pyramid`), instead of
+        building the whole pyramid right away. Each level needs the Gaussian pyramid images of
+        that level and the next one, which are computed (and cached) as needed.
+    packed : `bool`
+        Whether to store all the coefficients in a single buffer, `pyr_buffer`, which the values of
+        `pyr_coeffs` are views into (see `Pyramid.pack`). Can't be used with `lazy`.
 
     Attributes
     ----------
@@ -55,6 +66,8 @@ class LaplacianPyramid(GaussianPyramid):
         Human-readable string specifying the type of pyramid. For base class, is None.
     edge_type : `str`
         Specifies how edges were handled.
+    dtype : `np.dtype`
+        The precision of the image and the coefficients.
     pyr_coeffs : `dict`
         Dictionary containing the coefficients of the pyramid. Keys are `(level, band)` tuples and
         values are 1d or 2d numpy arrays (same number of dimensions as the input image)
@@ -79,11 +92,13 @@ class LaplacianPyramid(GaussianPyramid):
 
     """
     def __init__(self, image, height='auto', downsample_filter_name='binom5',
-                 upsample_filter_name=None, edge_type='reflect1'):
+                 upsample_filter_name=None, edge_type='reflect1', dtype=np.float64, lazy=False,
+                 packed=False):
         self.pyr_type = 'Laplacian'
         if upsample_filter_name is None:
             upsample_filter_name = downsample_filter_name
-        super().__init__(image, height, downsample_filter_name, edge_type, upsample_filter_name=upsample_filter_name)
+        super().__init__(image, height, downsample_filter_name, edge_type, dtype=dtype,
+                         lazy=lazy, packed=packed, upsample_filter_name=upsample_filter_name)
 
 
     def _build_pyr(self):
@@ -95,21 +110,89 @@ class LaplacianPyramid(GaussianPyramid):
         """
         im = self.image
         for lev in range(self.num_scales - 1):
-            im_next = self._build_next(im)
-            im_recon = self._recon_prev(im_next, output_size=im.shape)
-            im_residual = im - im_recon
-            self.pyr_coeffs[(lev, 0)] = im_residual.copy()
+            # _recon_prev only upsamples along one dimension when the next level is a single row or
+            # column, which reduce_expand doesn't do
+            if min(im.shape[-2:]) <= 2:
+                im_next = self._build_next(im)
+                im_residual = im - self._recon_prev(im_next, output_size=im.shape)
+            else:
+                # both at once, in a single pass through im
+                im_residual, im_next = reduce_expand(im, self.filters['downsample_filter'],
+                                                     self.filters['upsample_filter'],
+                                                     self.edge_type, self.dtype)
+            self.pyr_coeffs[(lev, 0)] = im_residual
             self.pyr_size[(lev, 0)] = im_residual.shape
             im = im_next
-        self.pyr_coeffs[(lev+1, 0)] = im.copy()
+        # im was returned by _build_next, so it's not used anywhere else
+        self.pyr_coeffs[(lev+1, 0)] = im
         self.pyr_size[(lev+1, 0)] = im.shape
 
+    def _build_tiled(self, image, bands, rows):
+        """build the pyramid of image (a `RowReader`) into bands, a strip at a time
+
+        This should not be called directly by users, see `build_tiled`. Each lowpass image is
+        first written where its band goes, and then replaced by the band (each strip of which only
+        needs the same rows of the lowpass image, along with the next one).
+        """
+        if self.num_scales == 1:
+            return super()._build_tiled(image, bands, rows)
+        for lev in range(self.num_scales - 1):
+            im = image if lev == 0 else bands[(lev, 0)]
+            self._build_next_tiled(im, bands[(lev+1, 0)], rows)
+            self._residual_tiled(im, bands[(lev+1, 0)], bands[(lev, 0)], rows)
+
+    def _residual_tiled(self, image, image_next, out, rows):
+        """compute out, the band of a level of the pyramid, a strip at a time
+
+        Equivalent to ``out[:] = image - self._recon_prev(image_next, image.shape)``, where image
+        is that level's lowpass image and image_next the next one, but only reads the rows of
+        image_next needed for `rows` rows of out at once. out can be image itself.
+        """
+        filt = self.filters['upsample_filter']
+        if image.shape[0] <= 2 * rows:
+            im = image[:]
+            out[:] = im - self._recon_prev(image_next[:], output_size=im.shape)
+            return
+        for start in range(0, out.shape[0], rows):
+            stop = min(start + rows, out.shape[0])
+            # as in _build_next_tiled, this is enough for the rows we keep to be interior ones
+            # (here, of the upsampled strip)
+            strip_start = max(start // 2 - filt.shape[0] - 1, 0)
+            strip_stop = min(stop // 2 + filt.shape[0] + 1, image_next.shape[0])
+            recon = self._recon_prev(image_next[strip_start:strip_stop],
+                                     output_size=(min(2 * strip_stop, image.shape[0]) - 2 * strip_start,
+                                                  image.shape[1]))
+            out[start:stop] = image[start:stop] - recon[start - 2*strip_start:stop - 2*strip_start]
+
+    def _band_delta(self, delta, delta_next):
+        """the change in a band, given the change in its lowpass image and the next one, for `update`"""
+        if delta_next is None:
+            return delta
+        return delta - self._recon_prev(delta_next, output_size=delta.shape)
+
+    def _save_params(self):
+        """the arguments needed to create this pyramid, for `save`"""
+        return {'height': self.num_scales, 'edge_type': self.edge_type,
+                'downsample_filter_name': self.filters['downsample_filter'].tolist(),
+                'upsample_filter_name': self.filters['upsample_filter'].tolist()}
+
+    def _compute_bands(self, key):
+        """compute a level of a lazy pyramid (see `Pyramid._set_lazy`)"""
+        lev = key[0]
+        im = self._lowpass(lev)
+        if lev == self.num_scales - 1:
+            # the lowpass images are cached, so we need a copy
+            return {key: im.copy()}
+        im_recon = self._recon_prev(self._lowpass(lev+1), output_size=im.shape)
+        return {key: im - im_recon}
+
 
     def _recon_prev(self, image, output_size, upsample_filter=None, edge_type=None):
         """Reconstruct the previous level of the pyramid.
 
         Should not be called by users directly, this is a helper function for reconstructing the
-        input image using pyramid coefficients.
+        input image using pyramid coefficients. `image` can also be a 3d stack of images (see
+        `upConv`), in which case all of them are upsampled at once.
 
         """
         if upsample_filter is None:
@@ -120,13 +203,18 @@ class LaplacianPyramid(GaussianPyramid):
         if edge_type is None:
             edge_type = self.edge_type
 
-        if image.shape[0] == 1:
-            res = upConv(image=image, filt=upsample_filter.T, edge_type=edge_type, step=(1, 2), stop=(output_size[0], output_size[1]))
-        elif image.shape[1] == 1:
-            res = upConv(image=image, filt=upsample_filter, edge_type=edge_type, step=(2, 1), stop=(output_size[0], output_size[1]))
+        if image.shape[-2] == 1 or image.shape[-1] == 1:
+            # a single row (column) is only upsampled along that row (column). If the previous
+            # level had more rows (columns), which happens when it had 2 of them, there's nothing
+            # to upsample them from, so they're predicted as 0 (and kept in full in the band)
+            res = np.zeros(image.shape[:-2] + tuple(output_size[-2:]), dtype=self.dtype)
+            if image.shape[-2] == 1:
+                res[..., :1, :] = upConv(image=image, filt=upsample_filter.T, edge_type=edge_type, dtype=self.dtype, step=(1, 2), stop=(1, output_size[-1]))
+            else:
+                res[..., :1] = upConv(image=image, filt=upsample_filter, edge_type=edge_type, dtype=self.dtype, step=(2, 1), stop=(output_size[-2], 1))
         else:
-            tmp = upConv(image=image, filt=upsample_filter, edge_type=edge_type, step=(2, 1), stop=(output_size[0], image.shape[1]))
-            res = upConv(image=tmp, filt=upsample_filter.T, edge_type=edge_type, step=(1, 2), stop=(output_size[0], output_size[1]))
+            tmp = upConv(image=image, filt=upsample_filter, edge_type=edge_type, dtype=self.dtype, step=(2, 1), stop=(output_size[0], image.shape[-1]))
+            res = upConv(image=tmp, filt=upsample_filter.T, edge_type=edge_type, dtype=self.dtype, step=(1, 2), stop=(output_size[0], output_size[1]))
         return res
 
 
@@ -169,7 +257,9 @@ class LaplacianPyramid(GaussianPyramid):
             The reconstructed image.
         """
         recon_keys = self._recon_keys(levels, 'all')
-        recon = np.zeros_like(self.pyr_coeffs[(self.num_scales-1, 0)])
+        # we only need the shape, so we don't use the coefficients (which a lazy pyramid would
+        # then have to compute)
+        recon = np.zeros(self.pyr_size[(self.num_scales-1, 0)], dtype=self.dtype)
         for lev in reversed(range(self.num_scales)):
             # upsample to generate higher reconolution image
             recon = self._recon_prev(recon, self.pyr_size[(lev, 0)], upsample_filter_name, edge_type)
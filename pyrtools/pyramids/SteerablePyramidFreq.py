@@ -1,9 +1,375 @@
 import warnings
+import threading
+from collections import OrderedDict
 import numpy as np
 from scipy.special import factorial
 from .pyramid import SteerablePyramidBase
+from .pyr_utils import LazyCoeffs
 from .c.wrapper import pointOp
 from ..tools.utils import rcosFn
+from ..tools import fft
+
+
+# process-wide cache of the masks SteerablePyramidFreq multiplies the image's Fourier transform
+# with, see set_mask_cache_limits
+_mask_cache = OrderedDict()
+_mask_cache_lock = threading.Lock()
+_mask_cache_max_bytes = 2**28
+_mask_cache_max_entries = 16
+
+
+def set_mask_cache_limits(max_bytes=2**28, max_entries=16):
+    """Set how much memory the cache of `SteerablePyramidFreq` masks can use
+
+    Building a `SteerablePyramidFreq` requires computing the (radial and angular) masks that the
+    image's Fourier transform is multiplied with, which only depend on the image shape and on the
+    `height`, `order`, `twidth` and `is_complex` arguments. The masks are kept in a process-wide
+    cache, so that building pyramids of many same-sized images (e.g., the frames of a video) only
+    requires FFTs and multiplications. When either limit is exceeded, the least recently used
+    masks are dropped; masks bigger than `max_bytes` are never cached.
+
+    Parameters
+    ----------
+    max_bytes : `int`
+        Maximum total size (in bytes) of the cached masks. Default is 256 MiB. Set to 0 to disable
+        the cache.
+    max_entries : `int`
+        Maximum number of sets of masks (i.e., distinct combinations of shape and parameters) to
+        keep.
+    """
+    global _mask_cache_max_bytes, _mask_cache_max_entries
+    if max_bytes < 0 or max_entries < 0:
+        raise Exception("max_bytes and max_entries must be non-negative, but got %d and %d!" %
+                        (max_bytes, max_entries))
+    with _mask_cache_lock:
+        _mask_cache_max_bytes = int(max_bytes)
+        _mask_cache_max_entries = int(max_entries)
+        _trim_mask_cache()
+
+
+def clear_mask_cache():
+    """Drop all the `SteerablePyramidFreq` masks cached so far, see `set_mask_cache_limits`
+    """
+    with _mask_cache_lock:
+        _mask_cache.clear()
+
+
+def _arrays(masks):
+    """list all the arrays in (possibly nested dicts, lists and tuples of) masks"""
+    if isinstance(masks, np.ndarray):
+        return [masks]
+    if isinstance(masks, dict):
+        masks = list(masks.values())
+    if isinstance(masks, (list, tuple)):
+        return [a for m in masks for a in _arrays(m)]
+    return []
+
+
+def _trim_mask_cache():
+    """drop least recently used masks until the cache is within its limits. needs the lock"""
+    total = sum(nbytes for _, nbytes in _mask_cache.values())
+    while _mask_cache and (total > _mask_cache_max_bytes or
+                           len(_mask_cache) > _mask_cache_max_entries):
+        _, (_, nbytes) = _mask_cache.popitem(last=False)
+        total -= nbytes
+
+
+def _cached(key, build, *args):
+    """get the masks stored under key in the cache, calling build(*args) to create them if needed
+
+    The arrays are shared with the cache, and so are made read-only.
+    """
+    with _mask_cache_lock:
+        if key in _mask_cache:
+            _mask_cache.move_to_end(key)
+            return _mask_cache[key][0]
+    # build outside the lock, so other threads don't have to wait for us
+    masks = build(*args)
+    arrays = _arrays(masks)
+    for a in arrays:
+        # these get cached, so make sure no one changes them
+        a.setflags(write=False)
+    nbytes = sum(a.nbytes for a in arrays)
+    with _mask_cache_lock:
+        if nbytes <= _mask_cache_max_bytes and _mask_cache_max_entries > 0:
+            _mask_cache[key] = (masks, nbytes)
+            _mask_cache.move_to_end(key)
+            _trim_mask_cache()
+    return masks
+
+
+def _get_masks(shape, num_scales, order, twidth, is_complex, centered=False):
+    """get the masks for these parameters from the cache, building them if necessary
+
+    See `_build_masks` for what this returns.
+    """
+    # the two grids only differ along odd-sized dimensions
+    centered = centered and any(d % 2 for d in shape)
+    key = (tuple(shape), num_scales, order, twidth, bool(is_complex), centered)
+    return _cached(key, _build_masks, *key)
+
+
+def _get_half_plane_maps(shape, num_scales, order, twidth, centered=False, to_small=True):
+    """get the half-plane maps of a real pyramid from the cache, building them if necessary
+
+    See `_build_half_plane_maps` for what this returns.
+    """
+    centered = centered and any(d % 2 for d in shape)
+    key = (tuple(shape), num_scales, order, twidth, centered, to_small)
+    masks = _get_masks(shape, num_scales, order, twidth, False, centered)
+    return _cached(('half-plane',) + key, _build_half_plane_maps, masks, order, to_small)
+
+
+def _build_masks(shape, num_scales, order, twidth, is_complex, centered=False):
+    """build the Fourier-domain masks of a `SteerablePyramidFreq`
+
+    If `centered` is True, the frequencies are sampled on a grid centered on the DC component,
+    as `recon_pyr` has always done, instead of the one used to build the pyramid. The two only
+    differ for odd sizes, where the latter is offset by half a sample.
+
+    Returns a dictionary with the (fftshifted) masks: `'lo0mask'` and `'hi0mask'` (shape
+    `shape`), and, for each scale `i`, `'himasks'[i]`, the list of `order+1` angular masks
+    `'anglemasks'[i]` (all with the shape of that scale), `'crops'[i]`, the slices giving the
+    lowpass region of that scale, and `'lomasks'[i]`, applied to the cropped region.
+    """
+    num_orientations = order + 1
+    dims = np.array(shape)
+    ctr = np.ceil((np.array(dims)+0.5)/2).astype(int)
+
+    if centered:
+        (xramp, yramp) = np.meshgrid((np.arange(1, dims[1]+1)-ctr[1]) / (dims[1]/2.),
+                                     (np.arange(1, dims[0]+1)-ctr[0]) / (dims[0]/2.))
+    else:
+        (xramp, yramp) = np.meshgrid(np.linspace(-1, 1, dims[1]+1)[:-1],
+                                     np.linspace(-1, 1, dims[0]+1)[:-1])
+
+    angle = np.arctan2(yramp, xramp)
+    log_rad = np.sqrt(xramp**2 + yramp**2)
+    log_rad[ctr[0]-1, ctr[1]-1] = log_rad[ctr[0]-1, ctr[1]-2]
+    log_rad = np.log2(log_rad)
+
+    # Radial transition function (a raised cosine in log-frequency):
+    (Xrcos, Yrcos) = rcosFn(twidth, (-twidth/2.0), np.array([0, 1]))
+    Yrcos = np.sqrt(Yrcos)
+
+    YIrcos = np.sqrt(1.0 - Yrcos**2)
+    masks = {'lo0mask': pointOp(log_rad, YIrcos, Xrcos[0], Xrcos[1]-Xrcos[0]),
+             'hi0mask': pointOp(log_rad, Yrcos, Xrcos[0], Xrcos[1]-Xrcos[0]),
+             'himasks': [], 'anglemasks': [], 'crops': [], 'lomasks': []}
+
+    lutsize = 1024
+    Xcosn = np.pi * np.arange(-(2*lutsize+1), (lutsize+2)) / lutsize
+    const = (2**(2*order))*(factorial(order, exact=True)**2)/ float(num_orientations*factorial(2*order, exact=True))
+    if is_complex:
+        # TODO clean that up and give comments
+        alfa = ((np.pi+Xcosn) % (2.0*np.pi)) - np.pi
+        Ycosn = (2.0 * np.sqrt(const) * (np.cos(Xcosn) ** order) *
+                 (np.abs(alfa) < np.pi/2.0).astype(int))
+    else:
+        Ycosn = np.sqrt(const) * (np.cos(Xcosn))**order
+    # one angle mask per orientation, all computed in a single pass over angle
+    angle_origins = Xcosn[0] + np.pi*np.arange(num_orientations)/num_orientations
+
+    for i in range(num_scales):
+        Xrcos -= np.log2(2)
+
+        masks['himasks'].append(pointOp(log_rad, Yrcos, Xrcos[0], Xrcos[1]-Xrcos[0]))
+        masks['anglemasks'].append(list(pointOp(angle, Ycosn, angle_origins, Xcosn[1]-Xcosn[0])))
+
+        dims = np.array(log_rad.shape)
+        ctr = np.ceil((dims+0.5)/2).astype(int)
+        lodims = np.ceil((dims-0.5)/2).astype(int)
+        loctr = np.ceil((lodims+0.5)/2).astype(int)
+        lostart = ctr - loctr
+        loend = lostart + lodims
+        crop = (slice(lostart[0], loend[0]), slice(lostart[1], loend[1]))
+        masks['crops'].append(crop)
+
+        log_rad = log_rad[crop]
+        angle = angle[crop]
+        YIrcos = np.abs(np.sqrt(1.0 - Yrcos**2))
+        masks['lomasks'].append(pointOp(log_rad, YIrcos, Xrcos[0], Xrcos[1]-Xrcos[0]))
+
+    return masks
+
+
+def _freqs(n):
+    """the (integer) frequencies of the entries of a length n DFT, in numpy's unshifted order"""
+    return np.round(np.fft.fftfreq(n, 1/n)).astype(int)
+
+
+def _wrap(freqs, n):
+    """wrap freqs to the frequencies of a length n DFT, i.e., to [-(n//2), n - n//2)"""
+    return (freqs + n//2) % n - n//2
+
+
+def _half_index(fy, fx, shape):
+    """find frequencies (fy, fx) in the (flattened) rfft2 of a real array of size shape
+
+    returns the index of each frequency and whether the value there has to be conjugated, for the
+    frequencies in the half of the Fourier plane that rfft2 drops.
+    """
+    rows, cols = shape
+    fy = fy % rows
+    fx = fx % cols
+    conj = fx > cols // 2
+    fy = np.where(conj, -fy % rows, fy)
+    fx = np.where(conj, -fx % cols, fx)
+    return fy * (cols//2 + 1) + fx, conj
+
+
+def _half_plane_map(mask, shape, to_small):
+    """build the map applying a Fourier-domain mask to half-plane spectra
+
+    `mask` is an (fftshifted) mask for the frequencies of the band of a pyramid, whose size
+    (`mask.shape`) can be smaller than the image's (`shape`), in which case it covers the lowest
+    frequencies. If `to_small`, the map takes the rfft2 of the image to the rfft2 of the band
+    (i.e., of the real part of the inverse DFT of the image's DFT times the mask); otherwise, it
+    takes the rfft2 of the band to its contribution to the rfft2 of the image (i.e., the real part
+    of the inverse DFT of the band's DFT times the mask, zero-padded to the image's size).
+
+    Taking the real part means the spectrum of the output at each frequency f is the average of
+    the masked spectrum at f and the conjugate of that at -f. Except on the Nyquist lines of the
+    smaller grid (where -f isn't part of it) and on the columns rfft2 keeps both halves of, both
+    come from the same value of the input, so most of the map is a single coefficient per
+    frequency. Returns a dictionary with `'shape'`, the size of the band, `'coef'`, those
+    coefficients (with the shape of the smaller spectrum, whose first `h - h//2` and last `h//2`
+    rows correspond to the first and last rows of the larger one), and `'extra'`, a list of
+    (output index, input index, indices of the inputs to conjugate, coefficient) tuples, each
+    with distinct output indices, for the other terms.
+    """
+    h, w = mask.shape
+    ncols = w//2 + 1
+    rows = _freqs(h) % shape[0]
+
+    def in_mask(fy, fx):
+        return (-(h//2) <= fy) & (fy < h - h//2) & (-(w//2) <= fx) & (fx < w - w//2)
+
+    def lookup(fy, fx):
+        # we can't index with the frequencies outside the mask, but they're dropped anyway
+        return mask[np.clip(fy + h//2, 0, h-1), np.clip(fx + w//2, 0, w-1)]
+
+    if to_small:
+        fy, fx = np.broadcast_arrays(_freqs(h)[:, None], _freqs(w)[:ncols])
+        neg = (_wrap(-fy, h), _wrap(-fx, w))
+        in_shape = shape
+        out_rows, out_cols = np.indices(fy.shape)
+        valid = np.ones(fy.shape, bool)
+        neg_valid = valid
+        # the coefficients apply to the input rows corresponding to each output row
+        block = np.ones(fy.shape, bool)
+        block_index = rows[:, None] * (shape[1]//2 + 1) + np.arange(ncols)
+    else:
+        # only the output rows and columns whose frequencies (or their negatives) are in the mask
+        all_fy = _wrap(np.arange(shape[0]), shape[0])
+        all_fx = _wrap(np.arange(shape[1]//2 + 1), shape[1])
+        out_rows = np.nonzero(in_mask(all_fy, 0) | in_mask(_wrap(-all_fy, shape[0]), 0))[0]
+        out_cols = np.nonzero(in_mask(0, all_fx) | in_mask(0, _wrap(-all_fx, shape[1])))[0]
+        out_rows, out_cols = np.meshgrid(out_rows, out_cols, indexing='ij')
+        fy, fx = all_fy[out_rows], all_fx[out_cols]
+        neg = (_wrap(-fy, shape[0]), _wrap(-fx, shape[1]))
+        in_shape = (h, w)
+        valid = in_mask(fy, fx)
+        neg_valid = in_mask(*neg)
+        # the coefficients apply to the output rows corresponding to each input row
+        small_row = np.full(shape[0], -1)
+        small_row[rows] = np.arange(h)
+        block = (small_row[out_rows] >= 0) & (out_cols < ncols)
+        block_index = small_row[out_rows] * ncols + out_cols
+
+    index, conj = _half_index(fy, fx, in_shape)
+    coef = np.where(valid, lookup(fy, fx) / 2, 0)
+    neg_index, neg_conj = _half_index(*neg, in_shape)
+    # we want the conjugate of the input at -f
+    neg_conj = ~neg_conj
+    neg_coef = np.where(neg_valid, np.conj(lookup(*neg)) / 2, 0)
+
+    same = valid & neg_valid & (index == neg_index) & (conj == neg_conj)
+    coef = np.where(same, coef + neg_coef, coef)
+    neg_valid = neg_valid & ~same
+    block = block & valid & ~conj & (index == block_index)
+
+    block_coef = np.zeros((h, ncols), complex)
+    if to_small:
+        block_coef[block] = coef[block]
+    else:
+        block_coef[small_row[out_rows[block]], out_cols[block]] = coef[block]
+    extra = []
+    for terms, idx, cj, cf in [(valid & ~block, index, conj, coef),
+                               (neg_valid, neg_index, neg_conj, neg_coef)]:
+        if terms.any():
+            extra.append(((out_rows[terms], out_cols[terms]),
+                          np.unravel_index(idx[terms], (in_shape[0], in_shape[1]//2 + 1)),
+                          np.nonzero(cj[terms])[0], cf[terms]))
+    return {'shape': (h, w), 'coef': block_coef, 'extra': extra}
+
+
+def _apply_extra_terms(half_plane_map, spectrum, result):
+    """add the terms of half_plane_map that aren't in its coefficients into result"""
+    for out_index, index, conj, coef in half_plane_map['extra']:
+        vals = spectrum[(Ellipsis,) + index]
+        vals[..., conj] = np.conj(vals[..., conj])
+        result[(Ellipsis,) + out_index] += vals * coef
+
+
+def _mask_half_plane(half_plane_map, spectrum):
+    """compute the rfft2 of a band of a real pyramid from that of the image, see `_half_plane_map`
+
+    the last two dimensions of spectrum are the frequencies, any others are batch dimensions.
+    """
+    coef = half_plane_map['coef']
+    npos = coef.shape[0] - coef.shape[0]//2
+    banddft = np.empty(spectrum.shape[:-2] + coef.shape, complex)
+    np.multiply(spectrum[..., :npos, :coef.shape[1]], coef[:npos], out=banddft[..., :npos, :])
+    nrows = spectrum.shape[-2]
+    np.multiply(spectrum[..., nrows-coef.shape[0]+npos:, :coef.shape[1]], coef[npos:],
+                out=banddft[..., npos:, :])
+    _apply_extra_terms(half_plane_map, spectrum, banddft)
+    return banddft
+
+
+def _unmask_half_plane(half_plane_map, banddft, result):
+    """add the contribution of a band to the rfft2 of the reconstruction, see `_half_plane_map`
+
+    banddft is the rfft2 of the band. the last two dimensions of banddft and result are the
+    frequencies, any others are batch dimensions.
+    """
+    coef = half_plane_map['coef']
+    npos = coef.shape[0] - coef.shape[0]//2
+    result[..., :npos, :coef.shape[1]] += banddft[..., :npos, :] * coef[:npos]
+    nrows = result.shape[-2]
+    result[..., nrows-coef.shape[0]+npos:, :coef.shape[1]] += banddft[..., npos:, :] * coef[npos:]
+    _apply_extra_terms(half_plane_map, banddft, result)
+
+
+def _real_part_dft(dft):
+    """DFT of the real part of the inverse DFT of dft (both unshifted, over the last two dims)"""
+    # the value at frequency -f, for each f
+    neg = np.roll(dft[..., ::-1, ::-1], 1, axis=(-2, -1))
+    return (dft + np.conj(neg)) / 2
+
+
+def _build_half_plane_maps(masks, order, to_small):
+    """build the maps used to compute the bands of a real pyramid with rfft2 and irfft2
+
+    Returns a dictionary with a map (see `_half_plane_map`) for each key of `pyr_coeffs`: for
+    each band, the mask is the product of the lowpass masks of the finer scales, the band's
+    angle and highpass masks and the phase the band is multiplied by (`(-1j)**order` when
+    building, and its inverse when reconstructing).
+    """
+    shape = masks['lo0mask'].shape
+    if to_small:
+        phase = (-1j) ** order
+    else:
+        phase = (np.power(-1+0j, 0.5))**order
+    maps = {'residual_highpass': _half_plane_map(masks['hi0mask'], shape, to_small)}
+    lowpass = masks['lo0mask']
+    for i, himask in enumerate(masks['himasks']):
+        for b, anglemask in enumerate(masks['anglemasks'][i]):
+            maps[(i, b)] = _half_plane_map(phase * lowpass * anglemask * himask, shape, to_small)
+        lowpass = lowpass[masks['crops'][i]] * masks['lomasks'][i]
+    maps['residual_lowpass'] = _half_plane_map(lowpass, shape, to_small)
+    return maps
 
 
 class SteerablePyramidFreq(SteerablePyramidBase):
@@ -20,6 +386,19 @@ class SteerablePyramidFreq(SteerablePyramidBase):
     The squared radial functions tile the Fourier plane with a raised-cosine
     falloff. Angular functions are cos(theta- k*pi/order+1)^(order).
 
+    The masks these functions give are cached (see `set_mask_cache_limits`), so building many
+    pyramids with the same image shape and parameters only requires FFTs and multiplications.
+    Since the image is real, only half of its Fourier transform is needed: pyramids with real
+    coefficients are built (and all pyramids are reconstructed) using `rfft2` and `irfft2`, with
+    the masks stored on that half-plane. The FFTs are computed with the library set by
+    `set_fft_backend`.
+
+    When only the spectra of the bands are needed (e.g., for band energies or further
+    Fourier-domain processing), set `store_dft=True`: the spectra are kept in `pyr_dft`, and
+    each band's inverse FFT is only computed when its coefficients are accessed, which skips
+    most of the FFTs of the build. With `lazy=True`, nothing but the image's FFT is computed
+    until a band is accessed, and then only that band.
+
     Notes
     -----
     Transform described in [1]_, filter kernel design described in [2]_.
@@ -27,7 +406,9 @@ class SteerablePyramidFreq(SteerablePyramidBase):
     Parameters
     ----------
     image : `array_like`
-        2d image upon which to construct to the pyramid.
+        2d image upon which to construct to the pyramid, or 3d stack of same-sized images (indexed
+        along the first dimension), whose pyramids are all built at once. The coefficients then
+        have the same leading dimension, while `pyr_size` gives the size of each image's band.
     height : 'auto' or `int`.
         The height of the pyramid. If 'auto', will automatically determine based on the size of
         `image`.
@@ -41,15 +422,33 @@ class SteerablePyramidFreq(SteerablePyramidBase):
         Whether the pyramid coefficients should be complex or not. If True, the real and imaginary
         parts correspond to a pair of even and odd symmetric filters. If False, the coefficients
         only include the real part / even symmetric filter.
+    dtype : {np.float64, np.float32}
+        Precision with which the image and the coefficients are stored (complex coefficients are
+        complex64 for float32). The FFTs and masks are always computed in double, so with float32
+        each coefficient is just the float64 one rounded to float32.
+    store_dft : `bool`
+        Whether to keep the spectra of the bands in `pyr_dft`, and only compute the coefficients
+        of each band (from its spectrum) the first time they're accessed.
+    lazy : `bool`
+        Whether to only compute each band when it's first accessed (see `Pyramid`), instead of
+        building the whole pyramid right away. Can't be used with `store_dft`.
+    packed : `bool`
+        Whether to store all the coefficients in a single buffer, `pyr_buffer`, which the values of
+        `pyr_coeffs` are views into (see `Pyramid.pack`). For complex pyramids, the buffer is
+        complex, and so are the residuals. Can't be used with `lazy` or `store_dft`.
 
     Attributes
     ----------
     image : `array_like`
         The input image used to construct the pyramid.
     image_size : `tuple`
-        The size of the input image.
+        The size of the input image (of each image, for a stack).
+    batch_size : `int` or None
+        The number of images in the stack, or None if `image` was a single image.
     pyr_type : `str` or `None`
         Human-readable string specifying the type of pyramid. For base class, is None.
+    dtype : `np.dtype`
+        The precision of the image and the coefficients.
     pyr_coeffs : `dict`
         Dictionary containing the coefficients of the pyramid. Keys are `(level, band)` tuples and
         values are 1d or 2d numpy arrays (same number of dimensions as the input image)
@@ -58,6 +457,13 @@ class SteerablePyramidFreq(SteerablePyramidBase):
         tuples and values are tuples.
     is_complex : `bool`
         Whether the coefficients are complex- or real-valued.
+    pyr_dft : `dict` or None
+        If `store_dft=True`, dictionary containing the spectra of the pyramid coefficients, with
+        the same keys as `pyr_coeffs`: for real pyramids, the `rfft2` of each band; for complex
+        ones, its `fft2` (in both cases, unshifted and computed over the last two dimensions).
+        They're complex64 if dtype is float32. `recon_pyr` uses these directly for the bands
+        whose coefficients haven't been accessed; changing them after that doesn't update
+        `pyr_coeffs`. None if `store_dft=False`.
 
     References
     ----------
@@ -67,10 +473,11 @@ class SteerablePyramidFreq(SteerablePyramidBase):
     .. [2] A Karasaridis and E P Simoncelli, "A Filter Design Technique for Steerable Pyramid
        Image Transforms", ICASSP, Atlanta, GA, May 1996.
     """
-    def __init__(self, image, height='auto', order=3, twidth=1, is_complex=False):
+    def __init__(self, image, height='auto', order=3, twidth=1, is_complex=False,
+                 dtype=np.float64, store_dft=False, lazy=False, packed=False):
         # in the Fourier domain, there's only one choice for how do edge-handling: circular. to
         # emphasize that thisisn'ta choice, we use None here.
-        super().__init__(image=image, edge_type=None)
+        super().__init__(image=image, edge_type=None, dtype=dtype, allow_batch=True, lazy=lazy)
 
         self.pyr_type = 'SteerableFrequency'
         self.is_complex = is_complex
@@ -80,7 +487,7 @@ class SteerablePyramidFreq(SteerablePyramidBase):
 
         # we can't use the base class's _set_num_scales method because the max height is calculated
         # slightly differently
-        max_ht = np.floor(np.log2(min(self.image.shape))) - 2
+        max_ht = np.floor(np.log2(min(self.image_size))) - 2
         if height == 'auto' or height is None:
             self.num_scales = int(max_ht)
         elif height > max_ht:
@@ -97,105 +504,157 @@ class SteerablePyramidFreq(SteerablePyramidBase):
             warnings.warn("twidth must be positive. Setting to 1.")
             twidth = 1
         twidth = int(twidth)
-
-        dims = np.array(self.image.shape)
-        ctr = np.ceil((np.array(dims)+0.5)/2).astype(int)
-
-        (xramp, yramp) = np.meshgrid(np.linspace(-1, 1, dims[1]+1)[:-1],
-                                     np.linspace(-1, 1, dims[0]+1)[:-1])
-
-        angle = np.arctan2(yramp, xramp)
-        log_rad = np.sqrt(xramp**2 + yramp**2)
-        log_rad[ctr[0]-1, ctr[1]-1] = log_rad[ctr[0]-1, ctr[1]-2]
-        log_rad = np.log2(log_rad)
-
-        # Radial transition function (a raised cosine in log-frequency):
-        (Xrcos, Yrcos) = rcosFn(twidth, (-twidth/2.0), np.array([0, 1]))
-        Yrcos = np.sqrt(Yrcos)
-
-        YIrcos = np.sqrt(1.0 - Yrcos**2)
-        lo0mask = pointOp(log_rad, YIrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-        self._lo0mask = lo0mask
-
-        imdft = np.fft.fftshift(np.fft.fft2(self.image))
-
-        hi0mask = pointOp(log_rad, Yrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-        self._hi0mask = hi0mask
-
-        hi0dft = imdft * hi0mask.reshape(imdft.shape[0], imdft.shape[1])
-        hi0 = np.fft.ifft2(np.fft.ifftshift(hi0dft))
-
-        self.pyr_coeffs['residual_highpass'] = np.real(hi0)
-        self.pyr_size['residual_highpass'] = hi0.shape
-
-        lo0mask = lo0mask.reshape(imdft.shape[0], imdft.shape[1])
-        lodft = imdft * lo0mask
-
-        self._anglemasks = []
-        self._himasks = []
-        self._lomasks = []
-
+        self._twidth = twidth
+        # the masks are only needed to compute the bands, so lazy pyramids wait until then
+        self._lo0mask = None
+        # the maps used by recon_pyr, for each twidth
+        self._recon_maps = {}
+        # complex64 if dtype is float32, complex128 if it's float64
+        self._complex_dtype = np.result_type(self.dtype, np.complex64)
+        self.pyr_dft = {} if store_dft else None
+        if store_dft and (lazy or packed):
+            raise Exception("store_dft can't be used with lazy or packed!")
+
+        # each scale's lowpass region is half the size of the previous one (see _build_masks)
+        sizes = {'residual_highpass': tuple(self.image_size)}
+        dims = np.array(self.image_size)
         for i in range(self.num_scales):
-            Xrcos -= np.log2(2)
-
-            lutsize = 1024
-            Xcosn = np.pi * np.arange(-(2*lutsize+1), (lutsize+2)) / lutsize
+            sizes.update({(i, b): tuple(int(d) for d in dims)
+                          for b in range(self.num_orientations)})
+            dims = np.ceil((dims-0.5)/2).astype(int)
+        sizes['residual_lowpass'] = tuple(int(d) for d in dims)
+        if packed:
+            # the residuals of complex pyramids are stored as complex too
+            self._set_packed(sizes, self._complex_dtype if self.is_complex else self.dtype)
+        if self.lazy:
+            self._set_lazy(sizes)
+            return
+        self._set_masks()
+
+        if not self.is_complex:
+            imdft = fft.rfft2(self.image)
+            for key, half_plane_map in self._maps.items():
+                banddft = _mask_half_plane(half_plane_map, imdft)
+                self.pyr_size[key] = sizes[key]
+                if store_dft:
+                    self.pyr_dft[key] = banddft.astype(self._complex_dtype)
+                else:
+                    band = fft.irfft2(banddft, s=half_plane_map['shape'])
+                    self.pyr_coeffs[key] = band.astype(self.dtype)
+        else:
+            # any leading dimension is the batch
+            axes = (-2, -1)
+            imdft = np.fft.fftshift(fft.fft2(self.image), axes=axes)
+
+            self._store_band('residual_highpass', imdft * self._hi0mask)
+
+            lodft = imdft * self._lo0mask
+
+            for i in range(self.num_scales):
+                himask = self._himasks[i]
+                for b, anglemask in enumerate(self._anglemasks[i]):
+                    # that (-1j)**order term in the beginning will be 1, -j, -1, j for order 0, 1,
+                    # 2, 3, and will then loop again
+                    banddft = (-1j) ** self.order * lodft * anglemask * himask
+                    self._store_band((i, b), banddft)
+
+                lodft = lodft[(Ellipsis,) + self._crops[i]] * self._lomasks[i]
+
+            self._store_band('residual_lowpass', lodft)
+
+        if store_dft:
+            self.pyr_coeffs = LazyCoeffs(self._coeffs_from_dft, self.pyr_dft.keys())
+
+    def _set_masks(self):
+        """get the masks used to compute the bands (from the cache, if possible)"""
+        masks = _get_masks(self.image_size, self.num_scales, self.order, self._twidth,
+                           self.is_complex)
+        self._lo0mask = masks['lo0mask']
+        self._hi0mask = masks['hi0mask']
+        self._himasks = masks['himasks']
+        self._anglemasks = masks['anglemasks']
+        self._lomasks = masks['lomasks']
+        self._crops = masks['crops']
+        if not self.is_complex:
+            # the coefficients are real, so we only need half of the Fourier plane
+            self._maps = _get_half_plane_maps(self.image_size, self.num_scales, self.order,
+                                              self._twidth)
+
+    def _save_params(self):
+        """the arguments needed to create this pyramid, for `save`"""
+        return {'height': self.num_scales, 'order': self.order, 'twidth': self._twidth,
+                'is_complex': bool(self.is_complex)}
+
+    def copy(self):
+        """Return a copy of the pyramid, whose coefficients can be changed independently
+
+        See `Pyramid.copy`. The copy has all its coefficients computed, so it only uses its copy of
+        `pyr_dft` (if any) for reference.
+        """
+        pyr = super().copy()
+        if self.pyr_dft is not None:
+            pyr.pyr_dft = {k: v.copy() for k, v in self.pyr_dft.items()}
+        return pyr
+
+    def _store_band(self, key, banddft):
+        """store a band of a complex pyramid, given its (fftshifted) spectrum"""
+        banddft = np.fft.ifftshift(banddft, axes=(-2, -1))
+        self.pyr_size[key] = banddft.shape[-2:]
+        if self.pyr_dft is not None:
+            if isinstance(key, str):
+                banddft = _real_part_dft(banddft)
+            self.pyr_dft[key] = banddft.astype(self._complex_dtype)
+        else:
+            self.pyr_coeffs[key] = self._coeffs_from_dft(key, banddft)
 
-            const = (2**(2*self.order))*(factorial(self.order, exact=True)**2)/ float(self.num_orientations*factorial(2*self.order, exact=True))
+    def _coeffs_from_dft(self, key, banddft=None):
+        """compute the coefficients of a band from its (unshifted) spectrum
 
-            if self.is_complex:
-                # TODO clean that up and give comments
-                alfa = ((np.pi+Xcosn) % (2.0*np.pi)) - np.pi
-                Ycosn = (2.0 * np.sqrt(const) * (np.cos(Xcosn) ** self.order) *
-                         (np.abs(alfa) < np.pi/2.0).astype(int))
-            else:
-                Ycosn = np.sqrt(const) * (np.cos(Xcosn))**self.order
-
-            log_rad_test = np.reshape(log_rad, (1, log_rad.shape[0] * log_rad.shape[1]))
-            himask = pointOp(log_rad_test, Yrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-            himask = himask.reshape((lodft.shape[0], lodft.shape[1]))
-            self._himasks.append(himask)
-
-            anglemasks = []
-            for b in range(self.num_orientations):
-                angle_tmp = np.reshape(angle, (1, angle.shape[0] * angle.shape[1]))
-                anglemask = pointOp(angle_tmp, Ycosn, Xcosn[0]+np.pi*b/self.num_orientations,
-                                    Xcosn[1]-Xcosn[0])
-
-                anglemask = anglemask.reshape(lodft.shape[0], lodft.shape[1])
-                anglemasks.append(anglemask)
-                # that (-1j)**order term in the beginning will be 1, -j, -1, j for order 0, 1, 2,
-                # 3, and will then loop again
-                banddft = (-1j) ** self.order * lodft * anglemask * himask
-                band = np.fft.ifft2(np.fft.ifftshift(banddft))
-                if not self.is_complex:
-                    self.pyr_coeffs[(i, b)] = np.real(band.copy())
-                else:
-                    self.pyr_coeffs[(i, b)] = band.copy()
-                self.pyr_size[(i, b)] = band.shape
-
-            self._anglemasks.append(anglemasks)
-            dims = np.array(lodft.shape)
-            ctr = np.ceil((dims+0.5)/2).astype(int)
-            lodims = np.ceil((dims-0.5)/2).astype(int)
-            loctr = np.ceil((lodims+0.5)/2).astype(int)
-            lostart = ctr - loctr
-            loend = lostart + lodims
-
-            log_rad = log_rad[lostart[0]:loend[0], lostart[1]:loend[1]]
-            angle = angle[lostart[0]:loend[0], lostart[1]:loend[1]]
-            lodft = lodft[lostart[0]:loend[0], lostart[1]:loend[1]]
-            YIrcos = np.abs(np.sqrt(1.0 - Yrcos**2))
-            log_rad_tmp = np.reshape(log_rad, (1, log_rad.shape[0] * log_rad.shape[1]))
-            lomask = pointOp(log_rad_tmp, YIrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-            lomask = lomask.reshape(lodft.shape[0], lodft.shape[1])
-            self._lomasks.append(lomask)
-
-            lodft = lodft * lomask
-
-        lodft = np.fft.ifft2(np.fft.ifftshift(lodft))
-        self.pyr_coeffs['residual_lowpass'] = np.real(np.array(lodft).copy())
-        self.pyr_size['residual_lowpass'] = lodft.shape
+        which is in pyr_dft, unless given. the residuals are real, so we keep the real part of
+        their inverse DFT.
+        """
+        if banddft is None:
+            banddft = self.pyr_dft[key]
+        if not self.is_complex:
+            return fft.irfft2(banddft, s=self.pyr_size[key]).astype(self.dtype)
+        band = fft.ifft2(banddft)
+        if isinstance(key, str):
+            return np.real(band).astype(self.dtype)
+        return band.astype(self._complex_dtype)
+
+    def _first_lowpass(self):
+        """the image's spectrum, for lazy pyramids
+
+        for real pyramids, that's its rfft2, which all bands are computed from. for complex ones,
+        it's the (fftshifted) spectrum times the first lowpass mask, what the first scale is built
+        from.
+        """
+        if self._lo0mask is None:
+            self._set_masks()
+        if not self.is_complex:
+            return fft.rfft2(self.image)
+        return np.fft.fftshift(fft.fft2(self.image), axes=(-2, -1)) * self._lo0mask
+
+    def _next_lowpass(self, lev, lodft):
+        """compute the lowpass spectrum of scale lev+1 from that of scale lev, for lazy pyramids"""
+        return lodft[(Ellipsis,) + self._crops[lev]] * self._lomasks[lev]
+
+    def _compute_bands(self, key):
+        """compute a band of a lazy pyramid (see `Pyramid._set_lazy`)"""
+        if self._lo0mask is None:
+            self._set_masks()
+        if not self.is_complex:
+            banddft = _mask_half_plane(self._maps[key], self._lowpass(0))
+            return {key: self._coeffs_from_dft(key, banddft)}
+        if key == 'residual_highpass':
+            imdft = np.fft.fftshift(fft.fft2(self.image), axes=(-2, -1))
+            banddft = imdft * self._hi0mask
+        elif key == 'residual_lowpass':
+            banddft = self._lowpass(self.num_scales)
+        else:
+            i, b = key
+            banddft = (-1j) ** self.order * self._lowpass(i) * self._anglemasks[i][b] * self._himasks[i]
+        return {key: self._coeffs_from_dft(key, np.fft.ifftshift(banddft, axes=(-2, -1)))}
 
     def recon_pyr(self, levels='all', bands='all', twidth=1):
         """Reconstruct the image, optionally using subset of pyramid coefficients.
@@ -216,7 +675,7 @@ class SteerablePyramidFreq(SteerablePyramidBase):
         Returns
         -------
         recon : `np.array`
-            The reconstructed image.
+            The reconstructed image (stack of images, for a batched pyramid).
 
         """
         if twidth <= 0:
@@ -225,149 +684,31 @@ class SteerablePyramidFreq(SteerablePyramidBase):
 
         recon_keys = self._recon_keys(levels, bands)
 
-        # make list of dims and bounds
-        bound_list = []
-        dim_list = []
-        # we go through pyr_sizes from smallest to largest
-        for dims in sorted(self.pyr_size.values()):
-            if dims in dim_list:
-                continue
-            dim_list.append(dims)
-            dims = np.array(dims)
-            ctr = np.ceil((dims+0.5)/2).astype(int)
-            lodims = np.ceil((dims-0.5)/2).astype(int)
-            loctr = np.ceil((lodims+0.5)/2).astype(int)
-            lostart = ctr - loctr
-            loend = lostart + lodims
-            bounds = (lostart[0], lostart[1], loend[0], loend[1])
-            bound_list.append(bounds)
-        bound_list.append((0, 0, dim_list[-1][0], dim_list[-1][1]))
-        dim_list.append((dim_list[-1][0], dim_list[-1][1]))
-
-        # matlab code starts here
-        dims = np.array(self.pyr_size['residual_highpass'])
-        ctr = np.ceil((dims+0.5)/2.0).astype(int)
-
-        (xramp, yramp) = np.meshgrid((np.arange(1, dims[1]+1)-ctr[1]) / (dims[1]/2.),
-                                     (np.arange(1, dims[0]+1)-ctr[0]) / (dims[0]/2.))
-        angle = np.arctan2(yramp, xramp)
-        log_rad = np.sqrt(xramp**2 + yramp**2)
-        log_rad[ctr[0]-1, ctr[1]-1] = log_rad[ctr[0]-1, ctr[1]-2]
-        log_rad = np.log2(log_rad)
-
-        # Radial transition function (a raised cosine in log-frequency):
-        (Xrcos, Yrcos) = rcosFn(twidth, (-twidth/2.0), np.array([0, 1]))
-        Yrcos = np.sqrt(Yrcos)
-        YIrcos = np.sqrt(1.0 - Yrcos**2)
-
-        # from reconSFpyrLevs
-        lutsize = 1024
-
-        Xcosn = np.pi * np.arange(-(2*lutsize+1), (lutsize+2)) / lutsize
-
-        const = (2**(2*self.order))*(factorial(self.order, exact=True)**2) / float(self.num_orientations*factorial(2*self.order, exact=True))
-        Ycosn = np.sqrt(const) * (np.cos(Xcosn))**self.order
-
-        # lowest band
-        # initialize reconstruction
-        if 'residual_lowpass' in recon_keys:
-            nresdft = np.fft.fftshift(np.fft.fft2(self.pyr_coeffs['residual_lowpass']))
-        else:
-            nresdft = np.zeros_like(self.pyr_coeffs['residual_lowpass'])
-        resdft = np.zeros(dim_list[1]) + 0j
-
-        bounds = (0, 0, 0, 0)
-        for idx in range(len(bound_list)-2, 0, -1):
-            diff = (bound_list[idx][2]-bound_list[idx][0],
-                    bound_list[idx][3]-bound_list[idx][1])
-            bounds = (bounds[0]+bound_list[idx][0], bounds[1]+bound_list[idx][1],
-                      bounds[0]+bound_list[idx][0] + diff[0],
-                      bounds[1]+bound_list[idx][1] + diff[1])
-            Xrcos -= np.log2(2.0)
-        nlog_rad = log_rad[bounds[0]:bounds[2], bounds[1]:bounds[3]]
-
-        nlog_rad_tmp = np.reshape(nlog_rad, (1, nlog_rad.shape[0]*nlog_rad.shape[1]))
-        lomask = pointOp(nlog_rad_tmp, YIrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-        lomask = lomask.reshape(nresdft.shape[0], nresdft.shape[1])
-        lomask = lomask + 0j
-        resdft[bound_list[1][0]:bound_list[1][2],
-               bound_list[1][1]:bound_list[1][3]] = nresdft * lomask
-
-        # middle bands
-        for idx in range(1, len(bound_list)-1):
-            bounds1 = (0, 0, 0, 0)
-            bounds2 = (0, 0, 0, 0)
-            for boundIdx in range(len(bound_list) - 1, idx - 1, -1):
-                diff = (bound_list[boundIdx][2]-bound_list[boundIdx][0],
-                        bound_list[boundIdx][3]-bound_list[boundIdx][1])
-                bound2tmp = bounds2
-                bounds2 = (bounds2[0]+bound_list[boundIdx][0],
-                           bounds2[1]+bound_list[boundIdx][1],
-                           bounds2[0]+bound_list[boundIdx][0] + diff[0],
-                           bounds2[1]+bound_list[boundIdx][1] + diff[1])
-                bounds1 = bound2tmp
-            nlog_rad1 = log_rad[bounds1[0]:bounds1[2], bounds1[1]:bounds1[3]]
-            nlog_rad2 = log_rad[bounds2[0]:bounds2[2], bounds2[1]:bounds2[3]]
-            dims = dim_list[idx]
-            nangle = angle[bounds1[0]:bounds1[2], bounds1[1]:bounds1[3]]
-            YIrcos = np.abs(np.sqrt(1.0 - Yrcos**2))
-            if idx > 1:
-                Xrcos += np.log2(2.0)
-                nlog_rad2_tmp = np.reshape(nlog_rad2, (1, nlog_rad2.shape[0]*nlog_rad2.shape[1]))
-                lomask = pointOp(nlog_rad2_tmp, YIrcos, Xrcos[0],
-                                 Xrcos[1]-Xrcos[0])
-                lomask = lomask.reshape(bounds2[2]-bounds2[0],
-                                        bounds2[3]-bounds2[1])
-                lomask = lomask + 0j
-                nresdft = np.zeros(dim_list[idx]) + 0j
-                nresdft[bound_list[idx][0]:bound_list[idx][2],
-                        bound_list[idx][1]:bound_list[idx][3]] = resdft * lomask
-                resdft = nresdft.copy()
-
-            # reconSFpyrLevs
-            if idx != 0 and idx != len(bound_list)-1:
-                for b in range(self.num_orientations):
-                    nlog_rad1_tmp = np.reshape(nlog_rad1,
-                                               (1, nlog_rad1.shape[0]*nlog_rad1.shape[1]))
-                    himask = pointOp(nlog_rad1_tmp, Yrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-
-                    himask = himask.reshape(nlog_rad1.shape)
-                    nangle_tmp = np.reshape(nangle, (1, nangle.shape[0]*nangle.shape[1]))
-                    anglemask = pointOp(nangle_tmp, Ycosn,
-                                        Xcosn[0]+np.pi*b/self.num_orientations,
-                                        Xcosn[1]-Xcosn[0])
-
-                    anglemask = anglemask.reshape(nangle.shape)
-                    # either the coefficients will already be real-valued (if
-                    # self.is_complex=False) or complex (if self.is_complex=True). in the
-                    # former case, this np.real() does nothing. in the latter, we want to only
-                    # reconstruct with the real portion
-                    curLev = self.num_scales-1 - (idx-1)
-                    band = np.real(self.pyr_coeffs[(curLev, b)])
-                    if (curLev, b) in recon_keys:
-                        banddft = np.fft.fftshift(np.fft.fft2(band))
-                    else:
-                        banddft = np.zeros(band.shape)
-                    resdft += ((np.power(-1+0j, 0.5))**(self.num_orientations-1) *
-                               banddft * anglemask * himask)
-
-        # apply lo0mask
-        Xrcos += np.log2(2.0)
-        lo0mask = pointOp(log_rad, YIrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-
-        lo0mask = lo0mask.reshape(dims[0], dims[1])
-        resdft = resdft * lo0mask
-
-        # residual highpass subband
-        hi0mask = pointOp(log_rad, Yrcos, Xrcos[0], Xrcos[1]-Xrcos[0])
-
-        hi0mask = hi0mask.reshape(resdft.shape[0], resdft.shape[1])
-        if 'residual_highpass' in recon_keys:
-            hidft = np.fft.fftshift(np.fft.fft2(self.pyr_coeffs['residual_highpass']))
-        else:
-            hidft = np.zeros_like(self.pyr_coeffs['residual_highpass'])
-        resdft += hidft * hi0mask
+        if twidth not in self._recon_maps:
+            self._recon_maps[twidth] = _get_half_plane_maps(self.image_size, self.num_scales,
+                                                            self.order, twidth, centered=True,
+                                                            to_small=False)
+        maps = self._recon_maps[twidth]
+
+        # the output is real, so we only need half of the Fourier plane. each band's spectrum gets
+        # multiplied by its masks and the lowpass masks of all the finer scales, and added in
+        batch = () if self.batch_size is None else (self.batch_size,)
+        resdft = np.zeros(batch + (self.image_size[0], self.image_size[1]//2 + 1), complex)
+        for key in recon_keys:
+            if (self.pyr_dft is not None and isinstance(self.pyr_coeffs, LazyCoeffs) and
+                    not self.pyr_coeffs.is_computed(key)):
+                # we can use the band's spectrum directly, which saves us two FFTs
+                banddft = self.pyr_dft[key]
+                if self.is_complex:
+                    banddft = _real_part_dft(banddft)[..., :banddft.shape[-1]//2 + 1]
+            else:
+                # either the coefficients will already be real-valued (if
+                # self.is_complex=False) or complex (if self.is_complex=True). in the former
+                # case, this np.real() does nothing. in the latter, we want to only reconstruct
+                # with the real portion
+                banddft = fft.rfft2(np.real(self.pyr_coeffs[key]))
+            _unmask_half_plane(maps[key], banddft, resdft)
 
-        outresdft = np.real(np.fft.ifft2(np.fft.ifftshift(resdft)))
+        outresdft = fft.irfft2(resdft, s=self.image_size)
 
-        return outresdft
+        return outresdft.astype(self.dtype, copy=False)
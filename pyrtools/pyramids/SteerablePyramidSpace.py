@@ -33,6 +33,16 @@ class SteerablePyramidSpace(SteerablePyramidBase):
         * `'zero'` - assume values of zero outside image boundary
         * `'extend'` - reflect and invert
         * `'dont-compute'` - zero output when filter overhangs imput boundaries.
+    dtype : {np.float64, np.float32}
+        Precision with which the pyramid is built (and reconstructed): the image and all the
+        coefficients are stored with this type. float32 halves the memory used; see `corrDn` and
+        `upConv` for how much the results can differ from float64.
+    lazy : `bool`
+        Whether to only compute each band when it's first accessed (see `Pyramid`), instead of
+        building the whole pyramid right away.
+    packed : `bool`
+        Whether to store all the coefficients in a single buffer, `pyr_buffer`, which the values of
+        `pyr_coeffs` are views into (see `Pyramid.pack`). Can't be used with `lazy`.
 
     Attributes
     ----------
@@ -44,6 +54,8 @@ class SteerablePyramidSpace(SteerablePyramidBase):
         Human-readable string specifying the type of pyramid. For base class, is None.
     edge_type : `str`
         Specifies how edges were handled.
+    dtype : `np.dtype`
+        The precision of the image and the coefficients.
     pyr_coeffs : `dict`
         Dictionary containing the coefficients of the pyramid. Keys are `(level, band)` tuples and
         values are 1d or 2d numpy arrays (same number of dimensions as the input image)
@@ -63,8 +75,9 @@ class SteerablePyramidSpace(SteerablePyramidBase):
        Image Transforms", ICASSP, Atlanta, GA, May 1996.
     """
 
-    def __init__(self, image, height='auto', order=1, edge_type='reflect1'):
-        super().__init__(image=image, edge_type=edge_type)
+    def __init__(self, image, height='auto', order=1, edge_type='reflect1', dtype=np.float64,
+                 lazy=False, packed=False):
+        super().__init__(image=image, edge_type=edge_type, dtype=dtype, lazy=lazy)
 
         self.order = order
         self.num_orientations = self.order + 1
@@ -72,27 +85,68 @@ class SteerablePyramidSpace(SteerablePyramidBase):
         self.pyr_type = 'SteerableSpace'
         self._set_num_scales('lofilt', height)
 
-        hi0 = corrDn(image=self.image, filt=self.filters['hi0filt'], edge_type=self.edge_type)
+        if packed:
+            self._set_packed(self._level_sizes())
+        if self.lazy:
+            self._set_lazy(self._level_sizes())
+            return
+
+        hi0 = corrDn(image=self.image, filt=self.filters['hi0filt'], edge_type=self.edge_type, dtype=self.dtype)
 
         self.pyr_coeffs['residual_highpass'] = hi0
         self.pyr_size['residual_highpass'] = hi0.shape
 
-        lo = corrDn(image=self.image, filt=self.filters['lo0filt'], edge_type=self.edge_type)
+        lo = corrDn(image=self.image, filt=self.filters['lo0filt'], edge_type=self.edge_type, dtype=self.dtype)
         for i in range(self.num_scales):
             # assume square filters  -- start of buildSpyrLevs
             bfiltsz = int(np.floor(np.sqrt(self.filters['bfilts'].shape[0])))
 
             for b in range(self.num_orientations):
                 filt = self.filters['bfilts'][:, b].reshape(bfiltsz, bfiltsz).T
-                band = corrDn(image=lo, filt=filt, edge_type=self.edge_type)
-                self.pyr_coeffs[(i, b)] = np.array(band)
+                band = corrDn(image=lo, filt=filt, edge_type=self.edge_type, dtype=self.dtype)
+                self.pyr_coeffs[(i, b)] = band
                 self.pyr_size[(i, b)] = band.shape
 
-            lo = corrDn(image=lo, filt=self.filters['lofilt'], edge_type=self.edge_type, step=(2, 2))
+            lo = corrDn(image=lo, filt=self.filters['lofilt'], edge_type=self.edge_type, dtype=self.dtype, step=(2, 2))
 
         self.pyr_coeffs['residual_lowpass'] = lo
         self.pyr_size['residual_lowpass'] = lo.shape
 
+    def _save_params(self):
+        """the arguments needed to create this pyramid, for `save`"""
+        return {'height': self.num_scales, 'order': self.order, 'edge_type': self.edge_type}
+
+    def _level_sizes(self):
+        """compute the size of each band of the pyramid, without building it"""
+        sizes = {'residual_highpass': tuple(self.image_size)}
+        size = tuple(self.image_size)
+        for i in range(self.num_scales):
+            for b in range(self.num_orientations):
+                sizes[(i, b)] = size
+            size = ((size[0]+1) // 2, (size[1]+1) // 2)
+        sizes['residual_lowpass'] = size
+        return sizes
+
+    def _first_lowpass(self):
+        """the lowpass image the first level is built from, for lazy pyramids"""
+        return corrDn(image=self.image, filt=self.filters['lo0filt'], edge_type=self.edge_type, dtype=self.dtype)
+
+    def _next_lowpass(self, lev, lo):
+        """compute the lowpass image of level lev+1 from that of level lev, for lazy pyramids"""
+        return corrDn(image=lo, filt=self.filters['lofilt'], edge_type=self.edge_type, dtype=self.dtype, step=(2, 2))
+
+    def _compute_bands(self, key):
+        """compute a band of a lazy pyramid (see `Pyramid._set_lazy`)"""
+        if key == 'residual_highpass':
+            return {key: corrDn(image=self.image, filt=self.filters['hi0filt'], edge_type=self.edge_type, dtype=self.dtype)}
+        if key == 'residual_lowpass':
+            # the lowpass images are cached, so we need a copy
+            return {key: self._lowpass(self.num_scales).copy()}
+        i, b = key
+        bfiltsz = int(np.floor(np.sqrt(self.filters['bfilts'].shape[0])))
+        filt = self.filters['bfilts'][:, b].reshape(bfiltsz, bfiltsz).T
+        return {key: corrDn(image=self._lowpass(i), filt=filt, edge_type=self.edge_type, dtype=self.dtype)}
+
     def recon_pyr(self, order=None, edge_type=None, levels='all', bands='all'):
         """Reconstruct the image, optionally using subset of pyramid coefficients.
 
@@ -149,12 +203,12 @@ class SteerablePyramidSpace(SteerablePyramidBase):
         if 'residual_lowpass' in recon_keys:
             recon = self.pyr_coeffs['residual_lowpass']
         else:
-            recon = np.zeros_like(self.pyr_coeffs['residual_lowpass'])
+            recon = np.zeros(self.pyr_size['residual_lowpass'], dtype=self.dtype)
 
         for lev in reversed(range(self.num_scales)):
             # we need to upConv once per level, in order to up-sample
             # the image back to the right shape.
-            recon = upConv(image=recon, filt=filters['lofilt'], edge_type=edges,
+            recon = upConv(image=recon, filt=filters['lofilt'], edge_type=edges, dtype=self.dtype,
                            step=(2, 2), start=(0, 0), stop=self.pyr_size[(lev, 0)])
             # I think the most effective way to do this is to just
             # check every possible sub-band and then only add in the
@@ -163,14 +217,14 @@ class SteerablePyramidSpace(SteerablePyramidBase):
             for band in reversed(range(self.num_orientations)):
                 if (lev, band) in recon_keys:
                     filt = filters['bfilts'][:, band].reshape(bfiltsz, bfiltsz, order='F')
-                    recon += upConv(image=self.pyr_coeffs[(lev, band)], filt=filt, edge_type=edges,
+                    recon += upConv(image=self.pyr_coeffs[(lev, band)], filt=filt, edge_type=edges, dtype=self.dtype,
                                     stop=self.pyr_size[(lev, band)])
 
         # apply lo0filt
-        recon = upConv(image=recon, filt=filters['lo0filt'], edge_type=edges, stop=recon.shape)
+        recon = upConv(image=recon, filt=filters['lo0filt'], edge_type=edges, dtype=self.dtype, stop=recon.shape)
 
         if 'residual_highpass' in recon_keys:
             recon += upConv(image=self.pyr_coeffs['residual_highpass'], filt=filters['hi0filt'],
-                            edge_type=edges, start=(0, 0), step=(1, 1), stop=recon.shape)
+                            edge_type=edges, dtype=self.dtype, start=(0, 0), step=(1, 1), stop=recon.shape)
 
         return recon
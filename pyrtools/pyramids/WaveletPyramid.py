@@ -1,7 +1,7 @@
 import numpy as np
 from .pyramid import Pyramid
 from .filters import parse_filter
-from .c.wrapper import corrDn, upConv
+from .c.wrapper import corrDn, upConv, wavelet_reduce, wavelet_expand
 
 
 class WaveletPyramid(Pyramid):
@@ -33,6 +33,16 @@ class WaveletPyramid(Pyramid):
         * `'zero'` - assume values of zero outside image boundary
         * `'extend'` - reflect and invert
         * `'dont-compute'` - zero output when filter overhangs imput boundaries.
+    dtype : {np.float64, np.float32}
+        Precision with which the pyramid is built (and reconstructed): the image and all the
+        coefficients are stored with this type. float32 halves the memory used; see `corrDn` and
+        `upConv` for how much the results can differ from float64.
+    lazy : `bool`
+        Whether to only compute the bands of each level when they're first accessed (see
+        `Pyramid`), instead of building the whole pyramid right away.
+    packed : `bool`
+        Whether to store all the coefficients in a single buffer, `pyr_buffer`, which the values of
+        `pyr_coeffs` are views into (see `Pyramid.pack`). Can't be used with `lazy`.
 
     Attributes
     ----------
@@ -44,6 +54,8 @@ class WaveletPyramid(Pyramid):
         Human-readable string specifying the type of pyramid. For base class, is None.
     edge_type : `str`
         Specifies how edges were handled.
+    dtype : `np.dtype`
+        The precision of the image and the coefficients.
     pyr_coeffs : `dict`
         Dictionary containing the coefficients of the pyramid. Keys are `(level, band)` tuples and
         values are 1d or 2d numpy arrays (same number of dimensions as the input image)
@@ -67,8 +79,9 @@ class WaveletPyramid(Pyramid):
        ed. John W Woods, Kluwer Academic Publishers,  Norwell, MA, 1990, pp 143--192.
     """
 
-    def __init__(self, image, height='auto', filter_name='qmf9', edge_type='reflect1'):
-        super().__init__(image=image, edge_type=edge_type)
+    def __init__(self, image, height='auto', filter_name='qmf9', edge_type='reflect1',
+                 dtype=np.float64, lazy=False, packed=False):
+        super().__init__(image=image, edge_type=edge_type, dtype=dtype, lazy=lazy)
         self.pyr_type = 'Wavelet'
 
         self.filters = {}
@@ -82,12 +95,17 @@ class WaveletPyramid(Pyramid):
         self._set_num_scales('lo_filter', height)
 
         # compute the number of channels per level
-        if min(self.image.shape) == 1:
+        if min(self.image_size) == 1:
             self.num_orientations = 1
         else:
             self.num_orientations = 3
 
-        self._build_pyr()
+        if packed:
+            self._set_packed(self._level_sizes())
+        if self.lazy:
+            self._set_lazy(self._level_sizes())
+        else:
+            self._build_pyr()
 
     def _modulate_flip(lo_filter):
         '''construct QMF/Wavelet highpass filter from lowpass filter
@@ -125,7 +143,8 @@ class WaveletPyramid(Pyramid):
         Parameters
         ----------
         image : `array_like`
-            image to use to construct next level.
+            image to use to construct next level. Can also be a 3d stack of images (see `corrDn`),
+            in which case the next level is built for all of them at once.
 
         Returns
         -------
@@ -138,21 +157,19 @@ class WaveletPyramid(Pyramid):
             the highpass, the highpass then the lowpass, and the highpass twice. All will be
             downsampled by a factor of two from the original `image`.
         """
-        if image.shape[1] == 1:
-            lolo = corrDn(image=image, filt=self.filters['lo_filter'], edge_type=self.edge_type, step=(2, 1), start=(self.stagger, 0))
-            hihi = corrDn(image=image, filt=self.filters['hi_filter'], edge_type=self.edge_type, step=(2, 1), start=(1, 0))
+        if image.shape[-1] == 1:
+            lolo = corrDn(image=image, filt=self.filters['lo_filter'], edge_type=self.edge_type, dtype=self.dtype, step=(2, 1), start=(self.stagger, 0))
+            hihi = corrDn(image=image, filt=self.filters['hi_filter'], edge_type=self.edge_type, dtype=self.dtype, step=(2, 1), start=(1, 0))
             return lolo, (hihi, )
-        elif image.shape[0] == 1:
-            lolo = corrDn(image=image, filt=self.filters['lo_filter'].T, edge_type=self.edge_type, step=(1, 2), start=(0, self.stagger))
-            hihi = corrDn(image=image, filt=self.filters['hi_filter'].T, edge_type=self.edge_type, step=(1, 2), start=(0, 1))
+        elif image.shape[-2] == 1:
+            lolo = corrDn(image=image, filt=self.filters['lo_filter'].T, edge_type=self.edge_type, dtype=self.dtype, step=(1, 2), start=(0, self.stagger))
+            hihi = corrDn(image=image, filt=self.filters['hi_filter'].T, edge_type=self.edge_type, dtype=self.dtype, step=(1, 2), start=(0, 1))
             return lolo, (hihi, )
         else:
-            lo = corrDn(image=image, filt=self.filters['lo_filter'], edge_type=self.edge_type, step=(2, 1), start=(self.stagger, 0))
-            hi = corrDn(image=image, filt=self.filters['hi_filter'], edge_type=self.edge_type, step=(2, 1), start=(1, 0))
-            lolo = corrDn(image=lo, filt=self.filters['lo_filter'].T, edge_type=self.edge_type, step=(1, 2), start=(0, self.stagger))
-            lohi = corrDn(image=hi, filt=self.filters['lo_filter'].T, edge_type=self.edge_type, step=(1, 2), start=(0, self.stagger))
-            hilo = corrDn(image=lo, filt=self.filters['hi_filter'].T, edge_type=self.edge_type, step=(1, 2), start=(0, 1))
-            hihi = corrDn(image=hi, filt=self.filters['hi_filter'].T, edge_type=self.edge_type, step=(1, 2), start=(0, 1))
+            # all four bands in a single pass through the image
+            lolo, lohi, hilo, hihi = wavelet_reduce(image, self.filters['lo_filter'],
+                                                    self.filters['hi_filter'], self.stagger,
+                                                    self.edge_type, self.dtype)
             return lolo, (lohi, hilo, hihi)
 
     def _build_pyr(self):
@@ -166,6 +183,56 @@ class WaveletPyramid(Pyramid):
         self.pyr_size['residual_lowpass'] = im.shape
 
 
+    def _save_params(self):
+        """the arguments needed to create this pyramid, for `save`"""
+        return {'height': self.num_scales, 'edge_type': self.edge_type,
+                'filter_name': self.filters['lo_filter'].tolist()}
+
+    def _level_sizes(self):
+        """compute the size of each band of the pyramid, without building it"""
+        sizes = {}
+        size = tuple(self.image_size)
+        for lev in range(self.num_scales):
+            # the sizes of the lowpass and highpass outputs of corrDn along each dimension (as in
+            # _build_next, a dimension of size 1 is left alone, and then there's a single band)
+            lo = [len(range(self.stagger, n, 2)) if n > 1 else 1 for n in size]
+            hi = [len(range(1, n, 2)) if n > 1 else 1 for n in size]
+            if 1 in size:
+                sizes[(lev, 0)] = tuple(hi)
+            else:
+                sizes[(lev, 0)] = (hi[0], lo[1])
+                sizes[(lev, 1)] = (lo[0], hi[1])
+                sizes[(lev, 2)] = (hi[0], hi[1])
+            size = tuple(lo)
+        sizes['residual_lowpass'] = size
+        return sizes
+
+    def _next_lowpass(self, lev, image):
+        """compute the lowpass image of level lev+1 from that of level lev, for lazy pyramids
+
+        This is the lolo output of `_build_next`, without computing the other bands.
+        """
+        lo_filter = self.filters['lo_filter']
+        if image.shape[-1] == 1:
+            return corrDn(image=image, filt=lo_filter, edge_type=self.edge_type, dtype=self.dtype, step=(2, 1), start=(self.stagger, 0))
+        elif image.shape[-2] == 1:
+            return corrDn(image=image, filt=lo_filter.T, edge_type=self.edge_type, dtype=self.dtype, step=(1, 2), start=(0, self.stagger))
+        lo = corrDn(image=image, filt=lo_filter, edge_type=self.edge_type, dtype=self.dtype, step=(2, 1), start=(self.stagger, 0))
+        return corrDn(image=lo, filt=lo_filter.T, edge_type=self.edge_type, dtype=self.dtype, step=(1, 2), start=(0, self.stagger))
+
+    def _compute_bands(self, key):
+        """compute the bands of a level of a lazy pyramid (see `Pyramid._set_lazy`)
+
+        All the bands of a level are computed together, and the next lowpass image comes for free.
+        """
+        if key == 'residual_lowpass':
+            # the lowpass images are cached, so we need a copy
+            return {key: self._lowpass(self.num_scales).copy()}
+        lev = key[0]
+        im, higher_bands = self._build_next(self._lowpass(lev))
+        self._cache_lowpass(lev+1, im)
+        return {(lev, j): band for j, band in enumerate(higher_bands)}
+
     def _recon_prev(self, image, lev, recon_keys, output_size, lo_filter, hi_filter, edge_type,
                     stagger):
         """Reconstruct the previous level of the pyramid.
@@ -176,19 +243,34 @@ class WaveletPyramid(Pyramid):
         """
         if self.num_orientations == 1:
             if output_size[0] == 1:
-                recon = upConv(image=image, filt=lo_filter.T, edge_type=edge_type, step=(1, 2), start=(0, stagger), stop=output_size)
+                recon = upConv(image=image, filt=lo_filter.T, edge_type=edge_type, dtype=self.dtype, step=(1, 2), start=(0, stagger), stop=output_size)
                 if (lev, 0) in recon_keys:
-                    recon += upConv(image=self.pyr_coeffs[(lev, 0)], filt=hi_filter.T, edge_type=edge_type, step=(1, 2), start=(0, 1), stop=output_size)
+                    recon += upConv(image=self.pyr_coeffs[(lev, 0)], filt=hi_filter.T, edge_type=edge_type, dtype=self.dtype, step=(1, 2), start=(0, 1), stop=output_size)
             elif output_size[1] == 1:
-                recon = upConv(image=image, filt=lo_filter, edge_type=edge_type, step=(2, 1), start=(stagger, 0), stop=output_size)
+                recon = upConv(image=image, filt=lo_filter, edge_type=edge_type, dtype=self.dtype, step=(2, 1), start=(stagger, 0), stop=output_size)
                 if (lev, 0) in recon_keys:
-                    recon += upConv(image=self.pyr_coeffs[(lev, 0)], filt=hi_filter, edge_type=edge_type, step=(2, 1), start=(1, 0), stop=output_size)
+                    recon += upConv(image=self.pyr_coeffs[(lev, 0)], filt=hi_filter, edge_type=edge_type, dtype=self.dtype, step=(2, 1), start=(1, 0), stop=output_size)
         else:
+            lo = [len(range(stagger, n, 2)) for n in output_size]
+            hi = [n // 2 for n in output_size]
+            sizes = [image.shape] + [self.pyr_size[(lev, band)] for band in range(3)]
+            if sizes == [(lo[0], lo[1]), (hi[0], lo[1]), (lo[0], hi[1]), (hi[0], hi[1])]:
+                # all four bands in a single pass. with circular edges, wavelet_expand does it
+                # step by step too: the last rows of the bands wrap around into the first rows
+                # of the image, and upConv adds them in before the others, so the single pass
+                # would have to hold on to them until the end to get the same values
+                bands = [self.pyr_coeffs[(lev, band)] if (lev, band) in recon_keys else None
+                         for band in range(3)]
+                return wavelet_expand(image, *bands, lo_filter, hi_filter, stagger, output_size,
+                                      edge_type, self.dtype)
+            # the sizes don't match when the levels of the pyramid had odd sizes with an
+            # even-length filter, or if it's reconstructed with a filter whose stagger is
+            # different, which wavelet_expand doesn't allow, so we do it step by step
             lo_size = ([self.pyr_size[(lev, 1)][0], output_size[1]])
             hi_size = ([self.pyr_size[(lev, 0)][0], output_size[1]])
 
-            tmp_recon = upConv(image=image, filt=lo_filter.T, edge_type=edge_type, step=(1, 2), start=(0, stagger), stop=lo_size)
-            recon = upConv(image=tmp_recon, filt=lo_filter, edge_type=edge_type, step=(2, 1), start=(stagger, 0), stop=output_size)
+            tmp_recon = upConv(image=image, filt=lo_filter.T, edge_type=edge_type, dtype=self.dtype, step=(1, 2), start=(0, stagger), stop=lo_size)
+            recon = upConv(image=tmp_recon, filt=lo_filter, edge_type=edge_type, dtype=self.dtype, step=(2, 1), start=(stagger, 0), stop=output_size)
 
             bands_recon_dict = {
                 0: [{'filt': lo_filter.T, 'start': (0, stagger), 'stop': hi_size},
@@ -201,8 +283,8 @@ class WaveletPyramid(Pyramid):
 
             for band in range(self.num_orientations):
                 if (lev, band) in recon_keys:
-                    tmp_recon = upConv(image=self.pyr_coeffs[(lev, band)], edge_type=edge_type, step=(1, 2), **bands_recon_dict[band][0])
-                    recon += upConv(image=tmp_recon, edge_type=edge_type, step=(2, 1), stop=output_size, **bands_recon_dict[band][1])
+                    tmp_recon = upConv(image=self.pyr_coeffs[(lev, band)], edge_type=edge_type, dtype=self.dtype, step=(1, 2), **bands_recon_dict[band][0])
+                    recon += upConv(image=tmp_recon, edge_type=edge_type, dtype=self.dtype, step=(2, 1), stop=output_size, **bands_recon_dict[band][1])
 
         return recon
 
@@ -271,12 +353,12 @@ class WaveletPyramid(Pyramid):
         if 'residual_lowpass' in recon_keys:
             recon = self.pyr_coeffs['residual_lowpass']
         else:
-            recon = np.zeros_like(self.pyr_coeffs['residual_lowpass'])
+            recon = np.zeros(self.pyr_size['residual_lowpass'], dtype=self.dtype)
 
         for lev in reversed(range(self.num_scales)):
             if self.num_orientations == 1:
                 if lev == 0:
-                    output_size = self.image.shape
+                    output_size = self.image_size
                 else:
                     output_size = self.pyr_size[(lev-1, 0)]
             else:
@@ -2,6 +2,7 @@ from .GaussianPyramid import GaussianPyramid
 from .LaplacianPyramid import LaplacianPyramid
 from .WaveletPyramid import WaveletPyramid
 from .SteerablePyramidSpace import SteerablePyramidSpace
-from .SteerablePyramidFreq import SteerablePyramidFreq
+from .SteerablePyramidFreq import SteerablePyramidFreq, set_mask_cache_limits, clear_mask_cache
 from .steer import steer, steer_to_harmonics_mtx
 from .pyr_utils import convert_pyr_coeffs_to_pyr, max_pyr_height
+from .pyr_io import load_pyramid
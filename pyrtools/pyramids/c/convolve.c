@@ -20,6 +20,7 @@
 
 #include <stdio.h>
 #include <math.h>
+#include <string.h>
 #include "convolve.h"
 
 /*
@@ -69,20 +70,57 @@
 	}
 */
 
+/*
+  Correlate FILT with a row of N_RES interior positions of IMAGE (which
+  points at the upper left corner of the first one), X_STEP apart, placing
+  the values into RESULT.  Rather than computing each inner product in turn,
+  as INPROD does, this adds the contribution of one filter tap to the whole
+  row at a time (in SUMS, scratch space for N_RES sums), so the innermost
+  loop can be vectorized.  Each value is still summed in the same order as in
+  INPROD, so the results are identical.
+*/
+VECTOR_CLONES
+static void reduce_center_row(image, x_dim, x_step, filt, x_fdim, y_fdim,
+			      sums, result, n_res)
+  const image_type *restrict image;
+  const filt_type *restrict filt;
+  accum_type *restrict sums;
+  image_type *restrict result;
+  int x_dim, x_step, x_fdim, y_fdim, n_res;
+  {
+  const image_type *im;
+  double tap;
+  int x_filt, y_filt, i;
+
+  for (i=0; i<n_res; i++)
+    sums[i] = 0.0;
+  for (y_filt=0; y_filt<y_fdim; y_filt++)
+    for (x_filt=0; x_filt<x_fdim; x_filt++)
+      {
+      im = image + y_filt*x_dim + x_filt;
+      tap = filt[y_filt*x_fdim + x_filt];
+      for (i=0; i<n_res; i++)
+	sums[i] += im[i*x_step]*tap;
+      }
+  for (i=0; i<n_res; i++)
+    result[i] = sums[i];
+  }
+
 int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
 		x_start, x_step, x_stop, y_start, y_step, y_stop,
 		result, edges)
-  register image_type *image, *temp;
+  register image_type *image;
+  register filt_type *temp;
   register int x_fdim, x_dim;
   register image_type *result;
   register int x_step, y_step;
   int x_start, y_start;
   int x_stop, y_stop;
-  image_type *filt;
+  filt_type *filt;
   int y_dim, y_fdim;
   char *edges;
   {
-  register double sum;
+  register accum_type sum;
   register int filt_pos, im_pos, x_filt_stop;
   register int x_pos, filt_size = x_fdim*y_fdim;
   register int y_pos, res_pos;
@@ -93,7 +131,8 @@ int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
   int y_ctr_start = ((y_fdim==1)?0:1);
   int x_fmid = x_fdim/2;
   int y_fmid = y_fdim/2;
-  int base_res_pos;
+  int base_res_pos, n_ctr;
+  accum_type *sums;
   fptr reflect = edge_function(edges);  /* look up edge-handling function */
   int i,j;
 
@@ -158,13 +197,22 @@ int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
     }
 
   (*reflect)(filt,x_fdim,y_fdim,0,0,temp,REDUCE);
-  for (;				      /* CENTER */
-       x_pos<x_ctr_stop;
-       x_pos+=x_step, base_res_pos++)
+  n_ctr = (x_pos<x_ctr_stop) ? (x_ctr_stop-x_pos+x_step-1)/x_step : 0;
+  if (n_ctr > 0)			      /* CENTER, a row at a time */
+    {
+    sums = (accum_type *) malloc(n_ctr*sizeof(accum_type));
+    if (!sums) return(-1);
     for (y_pos=y_ctr_start, res_pos=base_res_pos;
 	 y_pos<y_ctr_stop;
 	 y_pos+=y_step, res_pos+=x_res_dim)
-      INPROD(x_pos,y_pos)
+      reduce_center_row(image+y_pos*x_dim+x_pos, x_dim, x_step, temp,
+			x_fdim, y_fdim, sums, result+res_pos, n_ctr);
+    free(sums);
+    /* leave the positions where the column-by-column loop would have */
+    x_pos += n_ctr*x_step;
+    base_res_pos += n_ctr;
+    res_pos += n_ctr-1;
+    }
 
   for (;				      /* RIGHT EDGE */
        x_pos<x_stop;
@@ -235,19 +283,53 @@ int internal_reduce(image, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
       }									\
   }
 
+/*
+  Upsample and convolve a column of N_IM interior positions of IMAGE
+  (X_IM_DIM apart), adding the values into RESULT (which points at the upper
+  left corner of the first one, and has rows X_DIM long).  The positions are
+  Y_STEP rows apart in RESULT.  This does the same adds in the same order as
+  INPROD2, just in a form that the compiler can vectorize.
+*/
+VECTOR_CLONES
+static void expand_center_column(image, x_im_dim, n_im, filt, x_fdim, y_fdim,
+				 result, x_dim, y_step)
+  const image_type *restrict image;
+  const filt_type *restrict filt;
+  image_type *restrict result;
+  int x_im_dim, n_im, x_fdim, y_fdim, x_dim, y_step;
+  {
+  image_type *res;
+  const filt_type *filt_row;
+  accum_type val;
+  int x_filt, y_filt, i;
+
+  for (i=0; i<n_im; i++)
+    {
+    val = image[i*x_im_dim];
+    for (y_filt=0; y_filt<y_fdim; y_filt++)
+      {
+      res = result + (i*y_step + y_filt)*x_dim;
+      filt_row = filt + y_filt*x_fdim;
+      for (x_filt=0; x_filt<x_fdim; x_filt++)
+	res[x_filt] += val*filt_row[x_filt];
+      }
+    }
+  }
+
 int internal_expand(image,filt,temp,x_fdim,y_fdim,
 		x_start,x_step,x_stop,y_start,y_step,y_stop,
 		result,x_dim,y_dim,edges)
-  register image_type *result, *temp;
+  register image_type *result;
+  register filt_type *temp;
   register int x_fdim, x_dim;
   register int x_step, y_step;
   register image_type *image;
   int x_start, y_start;
-  image_type *filt;
+  filt_type *filt;
   int y_fdim, y_dim;
   char *edges;
   {
-  register double val;
+  register accum_type val;
   register int filt_pos, res_pos, x_filt_stop;
   register int x_pos, filt_size = x_fdim*y_fdim;
   register int y_pos, im_pos;
@@ -257,7 +339,7 @@ int internal_expand(image,filt,temp,x_fdim,y_fdim,
   int y_ctr_start = ((y_fdim==1)?0:1);
   int x_fmid = x_fdim/2;
   int y_fmid = y_fdim/2;
-  int base_im_pos, x_im_dim = (x_stop-x_start+x_step-1)/x_step;
+  int n_ctr, base_im_pos, x_im_dim = (x_stop-x_start+x_step-1)/x_step;
   fptr reflect = edge_function(edges);  /* look up edge-handling function */
   int i,j;
 
@@ -322,13 +404,18 @@ int internal_expand(image,filt,temp,x_fdim,y_fdim,
     }
 
   (*reflect)(filt,x_fdim,y_fdim,0,0,temp,EXPAND);
+  n_ctr = (y_ctr_start<y_ctr_stop) ? (y_ctr_stop-y_ctr_start+y_step-1)/y_step : 0;
   for (;				      /* CENTER */
        x_pos<x_ctr_stop;
        x_pos+=x_step, base_im_pos++)
-    for (y_pos=y_ctr_start, im_pos=base_im_pos;
-	 y_pos<y_ctr_stop;
-	 y_pos+=y_step, im_pos+=x_im_dim)
-      INPROD2(x_pos,y_pos)
+    {
+    expand_center_column(image+base_im_pos, x_im_dim, n_ctr, temp,
+			 x_fdim, y_fdim, result+y_ctr_start*x_dim+x_pos,
+			 x_dim, y_step);
+    /* leave the positions where the point-by-point loop would have */
+    y_pos = y_ctr_start + n_ctr*y_step;
+    im_pos = base_im_pos + n_ctr*x_im_dim;
+    }
 
   for (;				      /* RIGHT EDGE */
        x_pos<x_stop;
@@ -371,6 +458,538 @@ int internal_expand(image,filt,temp,x_fdim,y_fdim,
   } /* end of internal_expand */
 
 
+/*
+  --------------------------------------------------------------------
+  Apply internal_reduce to each of the N_IMAGES images stored
+  contiguously in IMAGE (each of size X_DIM by Y_DIM), placing the
+  results contiguously into RESULT.  This lets a whole stack of images
+  be filtered with a single call from python.
+ ------------------------------------------------------------------------ */
+
+int internal_reduce_stack(image, n_images, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
+		x_start, x_step, x_stop, y_start, y_step, y_stop,
+		result, edges)
+  image_type *image, *result;
+  filt_type *filt, *temp;
+  int n_images, x_dim, y_dim, x_fdim, y_fdim;
+  int x_start, x_step, x_stop, y_start, y_step, y_stop;
+  char *edges;
+  {
+  int n, status;
+  int im_size = x_dim*y_dim;
+  int res_size = ((x_stop-x_start+x_step-1)/x_step) * ((y_stop-y_start+y_step-1)/y_step);
+
+  for (n=0; n<n_images; n++)
+    {
+    status = internal_reduce(image+n*im_size, x_dim, y_dim, filt, temp, x_fdim, y_fdim,
+			     x_start, x_step, x_stop, y_start, y_step, y_stop,
+			     result+n*res_size, edges);
+    if (status) return(status);
+    }
+  return(0);
+  } /* end of internal_reduce_stack */
+
+
+/*
+  --------------------------------------------------------------------
+  Apply internal_expand to each of the N_IMAGES images stored
+  contiguously in IMAGE, adding values into the N_IMAGES result arrays
+  (each of size X_DIM by Y_DIM) stored contiguously in RESULT.
+  WARNING: like internal_expand, this destructively modifies RESULT!
+ ------------------------------------------------------------------------ */
+
+int internal_expand_stack(image, n_images, filt, temp, x_fdim, y_fdim,
+		x_start, x_step, x_stop, y_start, y_step, y_stop,
+		result, x_dim, y_dim, edges)
+  image_type *image, *result;
+  filt_type *filt, *temp;
+  int n_images, x_fdim, y_fdim, x_dim, y_dim;
+  int x_start, x_step, x_stop, y_start, y_step, y_stop;
+  char *edges;
+  {
+  int n, status;
+  int im_size = ((x_stop-x_start+x_step-1)/x_step) * ((y_stop-y_start+y_step-1)/y_step);
+  int res_size = x_dim*y_dim;
+
+  for (n=0; n<n_images; n++)
+    {
+    status = internal_expand(image+n*im_size, filt, temp, x_fdim, y_fdim,
+			     x_start, x_step, x_stop, y_start, y_step, y_stop,
+			     result+n*res_size, x_dim, y_dim, edges);
+    if (status) return(status);
+    }
+  return(0);
+  } /* end of internal_expand_stack */
+
+
+
+/*
+  --------------------------------------------------------------------
+  Compute one level of a Laplacian pyramid of IMAGE (X_DIM by Y_DIM):
+  LOWPASS (ceil(X_DIM/2) by ceil(Y_DIM/2)) is IMAGE correlated with the
+  1d filter FILT (FDIM long) along the rows and then along the columns,
+  subsampling by 2 each time, and BAND (X_DIM by Y_DIM) is IMAGE minus
+  LOWPASS upsampled and convolved with UP_FILT (UP_FDIM long) along the
+  columns and then along the rows.  The values are exactly those of the
+  four separate calls to internal_reduce and internal_expand (each sum is
+  done in the same order), but the image is worked through a row at a
+  time: only the FDIM rows of the row-filtered image and the UP_FDIM
+  rows of the upsampled LOWPASS that the filters currently overlap are
+  kept (in circular buffers), so the intermediate images never leave the
+  cache.  Circular edges aren't handled (see internal_wrap_reduce).
+  Only rows Y_START to Y_STOP-1 of BAND are computed, along with rows
+  Y_START/2 to (Y_STOP+1)/2-1 of LOWPASS (Y_START has to be even), so
+  that strips of the image can be handed to separate threads: the rows
+  of LOWPASS just outside that range, which the strip's rows of BAND
+  need too, are computed again into a scratch row.
+ ------------------------------------------------------------------------ */
+
+/* the first row of an image of Y_DIM rows that a filter of FDIM taps
+   whose window starts at Y_POS overlaps, as in internal_reduce and
+   internal_expand (which move the window inside the image at the edges) */
+static int window_first(y_pos, fdim, y_dim)
+  int y_pos, fdim, y_dim;
+  {
+  if (y_pos < 1)
+    return(0);
+  if (y_pos < y_dim - fdim)
+    return(y_pos);
+  return(y_dim - fdim);
+  }
+
+/* add each of the N_ROWS rows of BUF (a circular buffer of N_ROWS rows,
+   starting with row FIRST) times the corresponding tap of FILT, in the
+   same order as INPROD */
+VECTOR_CLONES
+static void reduce_rows(buf, n_rows, first, filt, sums, result, x_dim)
+  const image_type *restrict buf;
+  const filt_type *restrict filt;
+  accum_type *restrict sums;
+  image_type *restrict result;
+  int n_rows, first, x_dim;
+  {
+  const image_type *row;
+  double tap;
+  int t, i;
+
+  for (i=0; i<x_dim; i++)
+    sums[i] = 0.0;
+  for (t=0; t<n_rows; t++)
+    {
+    row = buf + ((first+t)%n_rows)*x_dim;
+    tap = filt[t];
+    for (i=0; i<x_dim; i++)
+      sums[i] += row[i]*tap;
+    }
+  for (i=0; i<x_dim; i++)
+    result[i] = sums[i];
+  }
+
+/* add IMAGE (a row) times each tap of FILT to the corresponding row of
+   BUF (a circular buffer of N_ROWS rows, starting with row FIRST), as
+   INPROD2 does */
+VECTOR_CLONES
+static void expand_rows(image, filt, buf, n_rows, first, x_dim)
+  const image_type *restrict image;
+  const filt_type *restrict filt;
+  image_type *restrict buf;
+  int n_rows, first, x_dim;
+  {
+  image_type *row;
+  accum_type val;
+  int t, i;
+
+  for (t=0; t<n_rows; t++)
+    {
+    row = buf + ((first+t)%n_rows)*x_dim;
+    for (i=0; i<x_dim; i++)
+      {
+      val = image[i];
+      row[i] += val*filt[t];
+      }
+    }
+  }
+
+int internal_reduce_expand(image, x_dim, y_dim, filt, fdim, up_filt, up_fdim,
+		band, lowpass, edges, y_start, y_stop)
+  image_type *image, *band, *lowpass;
+  filt_type *filt, *up_filt;
+  int x_dim, y_dim, fdim, up_fdim, y_start, y_stop;
+  char *edges;
+  {
+  int x_low = (x_dim+1)/2, y_low = (y_dim+1)/2;
+  int y_ctr_stop = y_dim - fdim, y_up_ctr_stop = y_dim - up_fdim;
+  int low_start = y_start/2, low_stop = (y_stop+1)/2;  /* our rows of LOWPASS */
+  int next_row = 0;  /* next row of IMAGE to correlate along x */
+  int next_up;       /* next row of the upsampled LOWPASS to start */
+  int done = y_start;  /* rows of BAND computed so far */
+  int i, x, y_pos, first, status = 0;
+  image_type *rows, *up_rows, *recon, *low_row, *spare;
+  accum_type *sums;
+  filt_type *temps, *ctr, *up_ctr, *temp, *row_temp, *f = NULL;
+  fptr reflect = edge_function(edges);  /* look up edge-handling function */
+
+  if (!reflect) return(-1);
+  rows = (image_type *) malloc((fdim+up_fdim+1)*x_low*sizeof(image_type) + x_dim*sizeof(image_type));
+  sums = (accum_type *) malloc(x_low*sizeof(accum_type));
+  temps = (filt_type *) malloc((fdim + up_fdim + 2*((fdim > up_fdim) ? fdim : up_fdim))
+			       *sizeof(filt_type));
+  if (!rows OR !sums OR !temps)
+    {
+    free(rows); free(sums); free(temps);
+    return(-1);
+    }
+  up_rows = rows + fdim*x_low;
+  recon = up_rows + up_fdim*x_low;
+  spare = recon + x_dim;
+  ctr = temps;  up_ctr = ctr + fdim;  temp = up_ctr + up_fdim;
+  row_temp = temp + ((fdim > up_fdim) ? fdim : up_fdim);
+  (*reflect)(filt,1,fdim,0,0,ctr,REDUCE);
+  (*reflect)(up_filt,1,up_fdim,0,0,up_ctr,EXPAND);
+
+  /* skip the rows of LOWPASS that don't add into any of our rows of BAND */
+  for (i=0; i<y_low; i++)
+    if (window_first(2*i - up_fdim/2, up_fdim, y_dim) + up_fdim > y_start)
+      break;
+  next_up = (i < y_low) ? window_first(2*i - up_fdim/2, up_fdim, y_dim) : y_start;
+  if (next_up > y_start) next_up = y_start;
+
+  for (; i<=y_low; i++)
+    {
+    if (done >= y_stop AND i >= low_stop) break;
+    if (i < y_low)
+      {
+      /* REDUCE: the rows of the filter window, as in internal_reduce */
+      y_pos = 2*i - fdim/2;
+      if (y_pos < 1)
+	{ (*reflect)(filt,1,fdim,0,y_pos-1,temp,REDUCE); f = temp; first = 0; }
+      else if (y_pos < y_ctr_stop)
+	{ f = ctr; first = y_pos; }
+      else
+	{ (*reflect)(filt,1,fdim,0,y_pos-y_ctr_stop+1,temp,REDUCE); f = temp; first = y_ctr_stop; }
+      if (next_row < first) next_row = first;
+      for (; next_row<first+fdim; next_row++)
+	{
+	status = internal_reduce(image+next_row*x_dim, x_dim, 1, filt, row_temp, fdim, 1,
+				 0, 2, x_dim, 0, 1, 1, rows+(next_row%fdim)*x_low, edges);
+	if (status) goto cleanup;
+	}
+      low_row = (i >= low_start AND i < low_stop) ? lowpass+i*x_low : spare;
+      reduce_rows(rows, fdim, first, f, sums, low_row, x_low);
+
+      /* EXPAND: the rows this one is added into, as in internal_expand */
+      y_pos = 2*i - up_fdim/2;
+      if (y_pos < 1)
+	{ (*reflect)(up_filt,1,up_fdim,0,y_pos-1,temp,EXPAND); f = temp; first = 0; }
+      else if (y_pos < y_up_ctr_stop)
+	{ f = up_ctr; first = y_pos; }
+      else
+	{ (*reflect)(up_filt,1,up_fdim,0,y_pos-y_up_ctr_stop+1,temp,EXPAND); f = temp; first = y_up_ctr_stop; }
+      }
+    else
+      first = y_dim;
+
+    /* no later row of LOWPASS adds into rows above FIRST, so finish them */
+    for (; done<first AND done<y_stop; done++)
+      {
+      if (done >= next_up)
+	{
+	for (x=0; x<x_low; x++)
+	  up_rows[(done%up_fdim)*x_low+x] = 0.0;
+	next_up = done+1;
+	}
+      for (x=0; x<x_dim; x++)
+	recon[x] = 0.0;
+      status = internal_expand(up_rows+(done%up_fdim)*x_low, up_filt, row_temp, up_fdim, 1,
+			       0, 2, x_dim, 0, 1, 1, recon, x_dim, 1, edges);
+      if (status) goto cleanup;
+      for (x=0; x<x_dim; x++)
+	band[done*x_dim+x] = image[done*x_dim+x] - recon[x];
+      }
+    if (i == y_low) break;
+
+    for (; next_up<first+up_fdim; next_up++)
+      for (x=0; x<x_low; x++)
+	up_rows[(next_up%up_fdim)*x_low+x] = 0.0;
+    expand_rows(low_row, f, up_rows, up_fdim, first, x_low);
+    }
+
+ cleanup:
+  free(rows); free(sums); free(temps);
+  return(status);
+  } /* end of internal_reduce_expand */
+
+
+/*
+  --------------------------------------------------------------------
+  Compute one level of a wavelet pyramid: correlate IMAGE (X_DIM by
+  Y_DIM) with LO_FILT and HI_FILT (both FDIM long) along y, downsampling
+  by two starting at STAGGER and 1 respectively, and then each of the
+  results along x in the same way, placing the four bands into LOLO,
+  LOHI (highpass along y, lowpass along x), HILO and HIHI.  This gives
+  the same values as the six corresponding calls to internal_reduce (or
+  internal_wrap_reduce, if EDGES is "circular"), but goes through the
+  image once: each pair of rows of the lowpass and highpass along y is
+  computed from the rows of IMAGE under the filter, and filtered along x
+  right away, so the two intermediate images are never stored.  Only
+  rows I_START to I_STOP-1 of the four bands are computed, so that
+  separate threads can compute different strips of them.  Returns -1 if
+  it can't allocate its memory (or EDGES isn't valid).
+ ------------------------------------------------------------------------ */
+
+/* correlate the N_TAPS rows ROWS[t] (each X_DIM long) with the taps of
+   FILT, placing the values into RESULT, in the same order as INPROD */
+VECTOR_CLONES
+static void reduce_window(rows, filt, n_taps, sums, result, x_dim)
+  const image_type *const *rows;
+  const filt_type *restrict filt;
+  accum_type *restrict sums;
+  image_type *restrict result;
+  int n_taps, x_dim;
+  {
+  const image_type *row;
+  double tap;
+  int t, i;
+
+  for (i=0; i<x_dim; i++)
+    sums[i] = 0.0;
+  for (t=0; t<n_taps; t++)
+    {
+    row = rows[t];
+    tap = filt[t];
+    for (i=0; i<x_dim; i++)
+      sums[i] += row[i]*tap;
+    }
+  for (i=0; i<x_dim; i++)
+    result[i] = sums[i];
+  }
+
+int internal_wavelet_reduce(image, x_dim, y_dim, lo_filt, hi_filt, fdim, stagger,
+			    lolo, lohi, hilo, hihi, edges, i_start, i_stop)
+  image_type *image, *lolo, *lohi, *hilo, *hihi;
+  filt_type *lo_filt, *hi_filt;
+  int x_dim, y_dim, fdim, stagger, i_start, i_stop;
+  char *edges;
+  {
+  int circular = (strcmp(edges, "circular") IS 0);
+  int y_lo = (y_dim-stagger+1)/2, y_hi = y_dim/2;
+  int x_lo = (x_dim-stagger+1)/2, x_hi = x_dim/2;
+  int y_ctr_stop = y_dim - fdim;
+  int i, t, k, band, start, first, status = 0;
+  const image_type **rows;
+  image_type *row, *x_lo_out, *x_hi_out;
+  accum_type *sums;
+  filt_type *temps, *ctr[2], *temp, *row_temp, *filt, *f;
+  fptr reflect = circular ? NULL : edge_function(edges);
+
+  if (!circular AND !reflect) return(-1);
+  rows = (const image_type **) malloc(fdim*sizeof(image_type *));
+  row = (image_type *) malloc(x_dim*sizeof(image_type));
+  sums = (accum_type *) malloc(x_dim*sizeof(accum_type));
+  temps = (filt_type *) malloc(4*fdim*sizeof(filt_type));
+  if (!rows OR !row OR !sums OR !temps)
+    {
+    free(rows); free(row); free(sums); free(temps);
+    return(-1);
+    }
+  ctr[0] = temps;  ctr[1] = ctr[0] + fdim;  temp = ctr[1] + fdim;  row_temp = temp + fdim;
+  if (!circular)
+    {
+    (*reflect)(lo_filt,1,fdim,0,0,ctr[0],REDUCE);
+    (*reflect)(hi_filt,1,fdim,0,0,ctr[1],REDUCE);
+    }
+
+  for (i=i_start; i<i_stop AND (i<y_lo OR i<y_hi); i++)
+    for (band=0; band<2; band++)  /* the lowpass along y, then the highpass */
+      {
+      if (i >= (band ? y_hi : y_lo)) continue;
+      filt = band ? hi_filt : lo_filt;
+      start = (band ? 1 : stagger) + 2*i - fdim/2;
+      if (circular)
+	{
+	for (t=0; t<fdim; t++)
+	  {
+	  k = (start + t) % y_dim;
+	  if (k < 0) k += y_dim;
+	  rows[t] = image + k*x_dim;
+	  }
+	f = filt;
+	}
+      else
+	{
+	/* the rows of the filter window, as in internal_reduce */
+	if (start < 1)
+	  { (*reflect)(filt,1,fdim,0,start-1,temp,REDUCE); f = temp; first = 0; }
+	else if (start < y_ctr_stop)
+	  { f = ctr[band]; first = start; }
+	else
+	  { (*reflect)(filt,1,fdim,0,start-y_ctr_stop+1,temp,REDUCE); f = temp; first = y_ctr_stop; }
+	for (t=0; t<fdim; t++)
+	  rows[t] = image + (first+t)*x_dim;
+	}
+      reduce_window(rows, f, fdim, sums, row, x_dim);
+
+      /* and along x */
+      x_lo_out = (band ? lohi : lolo) + i*x_lo;
+      x_hi_out = (band ? hihi : hilo) + i*x_hi;
+      if (circular)
+	{
+	status = internal_wrap_reduce(row, x_dim, 1, lo_filt, fdim, 1, stagger, 2, x_dim,
+				      0, 1, 1, x_lo_out);
+	if (!status)
+	  status = internal_wrap_reduce(row, x_dim, 1, hi_filt, fdim, 1, 1, 2, x_dim,
+					0, 1, 1, x_hi_out);
+	}
+      else
+	{
+	status = internal_reduce(row, x_dim, 1, lo_filt, row_temp, fdim, 1, stagger, 2, x_dim,
+				 0, 1, 1, x_lo_out, edges);
+	if (!status)
+	  status = internal_reduce(row, x_dim, 1, hi_filt, row_temp, fdim, 1, 1, 2, x_dim,
+				   0, 1, 1, x_hi_out, edges);
+	}
+      if (status) goto cleanup;
+      }
+
+ cleanup:
+  free(rows); free(row); free(sums); free(temps);
+  return(status);
+  } /* end of internal_wavelet_reduce */
+
+
+/*
+  --------------------------------------------------------------------
+  Reconstruct the image (X_DIM by Y_DIM) that a level of a wavelet
+  pyramid came from, placing it into RESULT: the inverse of
+  internal_wavelet_reduce, where LO_FILT and HI_FILT (FDIM long) are
+  used to upsample and convolve, first along x and then along y, each of
+  the four bands, which are then added up in the order LOLO, LOHI, HILO,
+  HIHI.  Any of the bands but LOLO can be NULL, in which case it's
+  skipped.  This gives the same values as the corresponding calls to
+  internal_expand, but keeps only the last FDIM rows of the upsampled
+  bands around, adding them into RESULT as soon as no later row of the
+  bands contributes to them.  EDGES can't be "circular", which wraps the
+  first rows around to the last ones.  Only rows Y_START to Y_STOP-1 of
+  RESULT are computed, so that separate threads can compute different
+  strips of it.  Returns -1 if it can't allocate its memory (or EDGES
+  isn't valid).
+ ------------------------------------------------------------------------ */
+
+int internal_wavelet_expand(lolo, lohi, hilo, hihi, lo_filt, hi_filt, fdim, stagger,
+			    result, x_dim, y_dim, edges, y_start, y_stop)
+  image_type *lolo, *lohi, *hilo, *hihi, *result;
+  filt_type *lo_filt, *hi_filt;
+  int fdim, stagger, x_dim, y_dim, y_start, y_stop;
+  char *edges;
+  {
+  int y_lo = (y_dim-stagger+1)/2, y_hi = y_dim/2;
+  int x_lo = (x_dim-stagger+1)/2, x_hi = x_dim/2;
+  int y_ctr_stop = y_dim - fdim;
+  /* for each band: its rows and columns, and where the filters along x and
+     y start */
+  image_type *bands[4];
+  int n_rows[4], n_cols[4], x_starts[4], y_starts[4];
+  filt_type *x_filts[4], *y_filts[4];
+  int next_in[4], next_up[4];
+  int b, x, y_pos, first, done, status = 0;
+  image_type *bufs, *row, *out, *acc;
+  filt_type *temps, *ctr[2], *temp, *row_temp, *f;
+  fptr reflect = edge_function(edges);
+
+  if (!reflect) return(-1);
+  bands[0] = lolo;  bands[1] = lohi;  bands[2] = hilo;  bands[3] = hihi;
+  for (b=0; b<4; b++)
+    {
+    /* lowpass along x for lolo and lohi, along y for lolo and hilo */
+    x_filts[b] = (b < 2) ? lo_filt : hi_filt;
+    x_starts[b] = (b < 2) ? stagger : 1;
+    n_cols[b] = (b < 2) ? x_lo : x_hi;
+    y_filts[b] = (b % 2) ? hi_filt : lo_filt;
+    y_starts[b] = (b % 2) ? 1 : stagger;
+    n_rows[b] = (b % 2) ? y_hi : y_lo;
+    /* skip the rows of the band that don't add into any of our rows */
+    for (next_in[b]=0; next_in[b]<n_rows[b]; next_in[b]++)
+      if (window_first(y_starts[b] + 2*next_in[b] - fdim/2, fdim, y_dim) + fdim > y_start)
+	break;
+    next_up[b] = y_start;
+    if (next_in[b] < n_rows[b])
+      {
+      first = window_first(y_starts[b] + 2*next_in[b] - fdim/2, fdim, y_dim);
+      if (first < next_up[b]) next_up[b] = first;
+      }
+    }
+
+  bufs = (image_type *) malloc((4*fdim+1)*x_dim*sizeof(image_type));
+  temps = (filt_type *) malloc(4*fdim*sizeof(filt_type));
+  if (!bufs OR !temps)
+    {
+    free(bufs); free(temps);
+    return(-1);
+    }
+  row = bufs + 4*fdim*x_dim;
+  ctr[0] = temps;  ctr[1] = ctr[0] + fdim;  temp = ctr[1] + fdim;  row_temp = temp + fdim;
+  (*reflect)(lo_filt,1,fdim,0,0,ctr[0],EXPAND);
+  (*reflect)(hi_filt,1,fdim,0,0,ctr[1],EXPAND);
+
+  for (done=y_start; done<y_stop; done++)
+    {
+    for (b=0; b<4; b++)
+      {
+      if (!bands[b]) continue;
+      acc = bufs + b*fdim*x_dim;
+      /* add in the rows of the band whose filter window starts at row DONE
+	 (or above), as in internal_expand */
+      for (; next_in[b]<n_rows[b]; next_in[b]++)
+	{
+	y_pos = y_starts[b] + 2*next_in[b] - fdim/2;
+	if (y_pos < 1)
+	  first = 0;
+	else if (y_pos < y_ctr_stop)
+	  first = y_pos;
+	else
+	  first = y_ctr_stop;
+	if (first > done) break;
+	if (y_pos < 1)
+	  { (*reflect)(y_filts[b],1,fdim,0,y_pos-1,temp,EXPAND); f = temp; }
+	else if (y_pos < y_ctr_stop)
+	  f = ctr[b % 2];
+	else
+	  { (*reflect)(y_filts[b],1,fdim,0,y_pos-y_ctr_stop+1,temp,EXPAND); f = temp; }
+
+	for (x=0; x<x_dim; x++)
+	  row[x] = 0.0;
+	status = internal_expand(bands[b]+next_in[b]*n_cols[b], x_filts[b], row_temp, fdim, 1,
+				 x_starts[b], 2, x_dim, 0, 1, 1, row, x_dim, 1, edges);
+	if (status) goto cleanup;
+	for (; next_up[b]<first+fdim; next_up[b]++)
+	  for (x=0; x<x_dim; x++)
+	    acc[(next_up[b]%fdim)*x_dim+x] = 0.0;
+	expand_rows(row, f, acc, fdim, first, x_dim);
+	}
+
+      /* no later row of the band adds into row DONE, so add it into RESULT */
+      if (done >= next_up[b])
+	{
+	for (x=0; x<x_dim; x++)
+	  acc[(done%fdim)*x_dim+x] = 0.0;
+	next_up[b] = done+1;
+	}
+      out = result + done*x_dim;
+      acc += (done%fdim)*x_dim;
+      if (b == 0)
+	for (x=0; x<x_dim; x++)
+	  out[x] = acc[x];
+      else
+	for (x=0; x<x_dim; x++)
+	  out[x] += acc[x];
+      }
+    }
+
+ cleanup:
+  free(bufs); free(temps);
+  return(status);
+  } /* end of internal_wavelet_expand */
+
 /* Local Variables: */
 /* buffer-read-only: t */
 /* End: */
\ No newline at end of file
@@ -31,25 +31,106 @@ typedef struct
   fptr func;
   } EDGE_HANDLER;
 
+/* The images (and results) are double, unless SINGLE_PRECISION is defined, in
+   which case they're float, and/or COMPLEX_VALUES is defined, in which case
+   they're complex.  The functions for anything but double get a suffix (see
+   convolve_float.c, convolve_complex.c, etc.).  Filters are always (real)
+   double, and the sums are always double (or double complex). */
+#ifdef COMPLEX_VALUES
+#include <complex.h>
+#ifdef SINGLE_PRECISION
+typedef float complex image_type;
+#define SUFFIXED(name) name##_complex_float
+#else
+typedef double complex image_type;
+#define SUFFIXED(name) name##_complex
+#endif
+typedef double complex accum_type;
+#else
+#ifdef SINGLE_PRECISION
+typedef float image_type;
+#define SUFFIXED(name) name##_float
+#else
 typedef double image_type;
+#endif
+typedef double accum_type;
+#endif
+typedef double filt_type;
+
+#ifdef SUFFIXED
+#define internal_reduce SUFFIXED(internal_reduce)
+#define internal_expand SUFFIXED(internal_expand)
+#define internal_wrap_reduce SUFFIXED(internal_wrap_reduce)
+#define internal_wrap_expand SUFFIXED(internal_wrap_expand)
+#define internal_reduce_stack SUFFIXED(internal_reduce_stack)
+#define internal_expand_stack SUFFIXED(internal_expand_stack)
+#define internal_wrap_reduce_stack SUFFIXED(internal_wrap_reduce_stack)
+#define internal_wrap_expand_stack SUFFIXED(internal_wrap_expand_stack)
+#define internal_reduce_expand SUFFIXED(internal_reduce_expand)
+#define internal_wavelet_reduce SUFFIXED(internal_wavelet_reduce)
+#define internal_wavelet_expand SUFFIXED(internal_wavelet_expand)
+#endif
+
+/* The interior (non-edge) loops are written so the compiler can vectorize
+   them.  With GCC on x86-64 linux, they're compiled twice, for the baseline
+   instruction set and for AVX2, and the right version for the CPU is picked
+   when the library is loaded.  Elsewhere (e.g., NEON on ARM) they're compiled
+   once, for whatever the compiler targets by default. */
+#if defined(__GNUC__) && !defined(__clang__) && defined(__x86_64__) && defined(__linux__)
+#define VECTOR_CLONES __attribute__((target_clones("avx2","default")))
+#else
+#define VECTOR_CLONES
+#endif
 
 fptr edge_function(char *edges);
 int internal_reduce(image_type *image, int x_idim, int y_idim, 
-		    image_type *filt, image_type *temp, int x_fdim, int y_fdim,
+		    filt_type *filt, filt_type *temp, int x_fdim, int y_fdim,
 		    int x_start, int x_step, int x_stop, 
 		    int y_start, int y_step, int y_stop,
 		    image_type *result, char *edges);
 int internal_expand(image_type *image, 
-		    image_type *filt, image_type *temp, int x_fdim, int y_fdim,
+		    filt_type *filt, filt_type *temp, int x_fdim, int y_fdim,
 		    int x_start, int x_step, int x_stop, 
 		    int y_start, int y_step, int y_stop,
 		    image_type *result, int x_rdim, int y_rdim, char *edges);
 int internal_wrap_reduce(image_type *image, int x_idim, int y_idim, 
-			 image_type *filt, int x_fdim, int y_fdim,
+			 filt_type *filt, int x_fdim, int y_fdim,
 			 int x_start, int x_step, int x_stop, 
 			 int y_start, int y_step, int y_stop,
 			 image_type *result);
-int internal_wrap_expand(image_type *image, image_type *filt, int x_fdim, int y_fdim,
+int internal_wrap_expand(image_type *image, filt_type *filt, int x_fdim, int y_fdim,
 			 int x_start, int x_step, int x_stop, 
 			 int y_start, int y_step, int y_stop,
 			 image_type *result, int x_rdim, int y_rdim);
+int internal_reduce_stack(image_type *image, int n_images, int x_idim, int y_idim,
+			  filt_type *filt, filt_type *temp, int x_fdim, int y_fdim,
+			  int x_start, int x_step, int x_stop,
+			  int y_start, int y_step, int y_stop,
+			  image_type *result, char *edges);
+int internal_expand_stack(image_type *image, int n_images,
+			  filt_type *filt, filt_type *temp, int x_fdim, int y_fdim,
+			  int x_start, int x_step, int x_stop,
+			  int y_start, int y_step, int y_stop,
+			  image_type *result, int x_rdim, int y_rdim, char *edges);
+int internal_wrap_reduce_stack(image_type *image, int n_images, int x_idim, int y_idim,
+			       filt_type *filt, int x_fdim, int y_fdim,
+			       int x_start, int x_step, int x_stop,
+			       int y_start, int y_step, int y_stop,
+			       image_type *result);
+int internal_wrap_expand_stack(image_type *image, int n_images,
+			       filt_type *filt, int x_fdim, int y_fdim,
+			       int x_start, int x_step, int x_stop,
+			       int y_start, int y_step, int y_stop,
+			       image_type *result, int x_rdim, int y_rdim);
+int internal_reduce_expand(image_type *image, int x_dim, int y_dim,
+			   filt_type *filt, int fdim, filt_type *up_filt, int up_fdim,
+			   image_type *band, image_type *lowpass, char *edges,
+			   int y_start, int y_stop);
+int internal_wavelet_reduce(image_type *image, int x_dim, int y_dim,
+			    filt_type *lo_filt, filt_type *hi_filt, int fdim, int stagger,
+			    image_type *lolo, image_type *lohi, image_type *hilo,
+			    image_type *hihi, char *edges, int i_start, int i_stop);
+int internal_wavelet_expand(image_type *lolo, image_type *lohi, image_type *hilo,
+			    image_type *hihi, filt_type *lo_filt, filt_type *hi_filt,
+			    int fdim, int stagger, image_type *result, int x_dim, int y_dim,
+			    char *edges, int y_start, int y_stop);
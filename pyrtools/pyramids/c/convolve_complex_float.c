@@ -0,0 +1,9 @@
+/*
+  Single precision complex versions of the functions in convolve.c: the images
+  and results are float complex, while the filters are still (real) double,
+  and the sums double complex.  See convolve.h.
+*/
+
+#define COMPLEX_VALUES
+#define SINGLE_PRECISION
+#include "convolve.c"
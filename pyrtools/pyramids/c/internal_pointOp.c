@@ -1,9 +1,10 @@
 #include <stdio.h>
 #include <math.h>
+#include "internal_pointOp.h"
 /* Use linear interpolation on a lookup table.
    Taken from OBVIUS.  EPS, Spring, 1987.
  */
-void internal_pointop(register double* im, register double* res, register int size, register double* lut, register int lutsize, register double origin, register double increment, register int warnings)
+void internal_pointop(register point_type* im, register point_type* res, register int size, register double* lut, register int lutsize, register double origin, register double increment, register int warnings)
 
 {
     register int i, index;
@@ -50,3 +51,70 @@ void internal_pointop(register double* im, register double* res, register int si
             /*printf("res[%d]=%f\n", i, res[i]);*/
         }
 }
+
+/* Apply nluts lookup tables (the k-th starting at luts + k*lut_stride, with
+   abscissa origins[k] and spacing increments[k]) to the (possibly strided)
+   y_dim x x_dim image im, in a single pass over it.  Strides are in
+   elements, and the k-th result is the contiguous y_dim x x_dim block
+   starting at res + k*res_stride.  Each value is computed exactly as in
+   internal_pointop.
+
+   warnings is a mask of the warnings still to print (1: extrapolating to the
+   left, 2: to the right), and the mask of those still unprinted is returned,
+   so that callers walking an array in several blocks only warn once.
+ */
+int internal_pointop_batch(point_type *im, int x_dim, int x_stride, int y_dim,
+			   int y_stride, point_type *res, int res_stride,
+			   double *luts, int lutsize, int lut_stride, int nluts,
+			   double *origins, double *increments, int warnings)
+{
+    int x, y, k, index, res_pos;
+    double pos, val, *lut;
+    point_type *row;
+
+    lutsize = lutsize - 2;	/* Maximum index value */
+
+    for (y = 0; y < y_dim; y++)
+    {
+        row = im + (long)y * y_stride;
+        for (x = 0; x < x_dim; x++)
+        {
+            res_pos = y * x_dim + x;
+            for (k = 0; k < nluts; k++)
+            {
+                lut = luts + (long)k * lut_stride;
+                if (increments[k] > 0)
+                {
+                    pos = (row[(long)x * x_stride] - origins[k]) / increments[k];
+                    index = (int)pos;   /* Floor */
+                    if (index < 0)
+                    {
+                        index = 0;
+                        if (warnings & 1)
+                        {
+                            printf("Warning: Extrapolating to left of lookup table...\n");
+                            warnings &= ~1;
+                        }
+                    }
+                    else if (index > lutsize)
+                    {
+                        index = lutsize;
+                        if (warnings & 2)
+                        {
+                            printf("Warning: Extrapolating to right of lookup table...\n");
+                            warnings &= ~2;
+                        }
+                    }
+                    val = lut[index] + (lut[index + 1] - lut[index]) * (pos - index);
+                    res[(long)k * res_stride + res_pos] = val;
+                    if (isnan(res[(long)k * res_stride + res_pos]))
+                        printf("**NAN: lut[%d]=%f lut[%d]=%f pos=%f index=%d\n", index,
+                               lut[index], index + 1, lut[index + 1], pos, index);
+                }
+                else
+                    res[(long)k * res_stride + res_pos] = *lut;
+            }
+        }
+    }
+    return warnings;
+}
@@ -1,3 +1,20 @@
-void internal_pointop(double *im, double *res, int size, double *lut, 
+/* im and res are double, unless SINGLE_PRECISION is defined, in which case
+   they're float and the functions are internal_pointop_float and
+   internal_pointop_batch_float (see internal_pointOp_float.c).  The lookup
+   tables are always double. */
+#ifdef SINGLE_PRECISION
+typedef float point_type;
+#define internal_pointop internal_pointop_float
+#define internal_pointop_batch internal_pointop_batch_float
+#else
+typedef double point_type;
+#endif
+
+void internal_pointop(point_type *im, point_type *res, int size, double *lut, 
 		      int lutsize, double origin, double increment, 
 		      int warnings);
+
+int internal_pointop_batch(point_type *im, int x_dim, int x_stride, int y_dim,
+			   int y_stride, point_type *res, int res_stride,
+			   double *luts, int lutsize, int lut_stride, int nluts,
+			   double *origins, double *increments, int warnings);
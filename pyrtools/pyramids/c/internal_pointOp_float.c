@@ -0,0 +1,7 @@
+/*
+  Single precision version of internal_pointop: the image and result are
+  float, while the lookup tables are still double.  See internal_pointOp.h.
+*/
+
+#define SINGLE_PRECISION
+#include "internal_pointOp.c"
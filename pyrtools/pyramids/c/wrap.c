@@ -46,12 +46,13 @@
 int internal_wrap_reduce(image, x_dim, y_dim, filt, x_fdim, y_fdim,
 		     x_start, x_step, x_stop, y_start, y_step, y_stop, 
 		     result)
-  register image_type *filt, *result;
+  register filt_type *filt;
+  register image_type *result;
   register int x_dim, y_dim, x_fdim, y_fdim;
   image_type *image;
   int x_start, x_step, x_stop, y_start, y_step, y_stop;
   {
-  register double sum;
+  register accum_type sum;
   register int filt_size = x_fdim*y_fdim;
   image_type **imval;
   register int filt_pos, x_im, y_im, x_filt_stop;
@@ -176,12 +177,13 @@ int internal_wrap_reduce(image, x_dim, y_dim, filt, x_fdim, y_fdim,
 int internal_wrap_expand(image, filt, x_fdim, y_fdim,
 	      x_start, x_step, x_stop, y_start, y_step, y_stop,
 	      result, x_dim, y_dim)
-  register image_type *filt, *result;
+  register filt_type *filt;
+  register image_type *result;
   register int x_fdim, y_fdim, x_dim, y_dim;
   image_type *image; 
   int x_start, x_step, x_stop, y_start, y_step, y_stop;
   {
-  register double val;
+  register accum_type val;
   register int filt_size = x_fdim*y_fdim;
   image_type **imval;
   register int filt_pos, x_res, y_res, x_filt_stop;
@@ -276,6 +278,59 @@ int internal_wrap_expand(image, filt, x_fdim, y_fdim,
 
 
 
+/*
+ --------------------------------------------------------------------
+ Stacked versions of internal_wrap_reduce and internal_wrap_expand:
+ apply the operation to each of the N_IMAGES images stored
+ contiguously in IMAGE, with the results stored contiguously in
+ RESULT.
+ -------------------------------------------------------------------- */
+
+int internal_wrap_reduce_stack(image, n_images, x_dim, y_dim, filt, x_fdim, y_fdim,
+		     x_start, x_step, x_stop, y_start, y_step, y_stop,
+		     result)
+  image_type *image, *result;
+  filt_type *filt;
+  int n_images, x_dim, y_dim, x_fdim, y_fdim;
+  int x_start, x_step, x_stop, y_start, y_step, y_stop;
+  {
+  int n, status;
+  int im_size = x_dim*y_dim;
+  int res_size = ((x_stop-x_start+x_step-1)/x_step) * ((y_stop-y_start+y_step-1)/y_step);
+
+  for (n=0; n<n_images; n++)
+    {
+    status = internal_wrap_reduce(image+n*im_size, x_dim, y_dim, filt, x_fdim, y_fdim,
+				  x_start, x_step, x_stop, y_start, y_step, y_stop,
+				  result+n*res_size);
+    if (status) return(status);
+    }
+  return(0);
+  } /* end of internal_wrap_reduce_stack */
+
+int internal_wrap_expand_stack(image, n_images, filt, x_fdim, y_fdim,
+	      x_start, x_step, x_stop, y_start, y_step, y_stop,
+	      result, x_dim, y_dim)
+  image_type *image, *result;
+  filt_type *filt;
+  int n_images, x_fdim, y_fdim, x_dim, y_dim;
+  int x_start, x_step, x_stop, y_start, y_step, y_stop;
+  {
+  int n, status;
+  int im_size = ((x_stop-x_start+x_step-1)/x_step) * ((y_stop-y_start+y_step-1)/y_step);
+  int res_size = x_dim*y_dim;
+
+  for (n=0; n<n_images; n++)
+    {
+    status = internal_wrap_expand(image+n*im_size, filt, x_fdim, y_fdim,
+				  x_start, x_step, x_stop, y_start, y_step, y_stop,
+				  result+n*res_size, x_dim, y_dim);
+    if (status) return(status);
+    }
+  return(0);
+  } /* end of internal_wrap_expand_stack */
+
+
 /* Local Variables: */
 /* buffer-read-only: t */
 /* End: */
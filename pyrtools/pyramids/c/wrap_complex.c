@@ -0,0 +1,7 @@
+/*
+  Complex versions of the functions in wrap.c: the images and results are
+  double complex, while the filters are still (real) double.  See convolve.h.
+*/
+
+#define COMPLEX_VALUES
+#include "wrap.c"
@@ -0,0 +1,8 @@
+/*
+  Single precision versions of the functions in wrap.c: the images and
+  results are float, while the filters (and all the sums) are still double.
+  See convolve.h.
+*/
+
+#define SINGLE_PRECISION
+#include "wrap.c"
@@ -2,11 +2,14 @@
 """functions that interact with the C code, for handling convolutions mostly.
 """
 import ctypes
+import functools
 import warnings
 import os
 import glob
 import numpy as np
+import scipy.signal
 import platform
+from concurrent.futures import ThreadPoolExecutor
 
 # the wrapConv.so file can have some system information after it from the compiler, so we just find
 # whatever it is called
@@ -25,13 +28,76 @@ if len(libpath) > 0:
 else:
     warnings.warn("Can't load in C code, something went wrong in your install!")
 
+# number of threads corrDn and upConv split their work across, see set_num_threads
+_num_threads = 1
+_thread_pool = None
+# below this many output values, it's not worth splitting the work up
+_MIN_PARALLEL_SIZE = 2**16
+# the suffixes of the versions of the C functions for each type of image
+_LIB_SUFFIXES = {np.dtype(np.float64): '', np.dtype(np.float32): '_float',
+                 np.dtype(np.complex128): '_complex', np.dtype(np.complex64): '_complex_float'}
+# roughly how many multiply-adds of the direct method each element of an FFT costs, per log2 of
+# its size. used by method='auto'
+_FFT_COST = 4
 
-def corrDn(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=None):
+
+def set_num_threads(num_threads):
+    """Set the number of threads that the C code splits its work across
+
+    This is used by `corrDn`, `upConv`, `reduce_expand`, `wavelet_reduce` and `wavelet_expand`.
+    The C code releases the GIL, so large convolutions are split into horizontal strips (or, for
+    stacks of images, into sub-stacks) that are processed in parallel by a pool of worker threads.
+    By default, only a single thread is used. Small arrays are always processed in a single
+    thread, since there the overhead isn't worth it.
+
+    Results are identical to the single-threaded case for `corrDn`, `reduce_expand`,
+    `wavelet_reduce` and `wavelet_expand`; for `upConv`, overlapping contributions from neighboring
+    strips may be summed in a different order, so results can differ by floating point rounding.
+
+    Parameters
+    ----------
+    num_threads : `int` or None
+        Number of threads to use. If None, use the number of CPUs on this machine.
+    """
+    global _num_threads, _thread_pool
+    if num_threads is None:
+        num_threads = os.cpu_count() or 1
+    num_threads = int(num_threads)
+    if num_threads < 1:
+        raise Exception("num_threads must be a positive integer, but got %d!" % num_threads)
+    if _thread_pool is not None:
+        _thread_pool.shutdown()
+        _thread_pool = None
+    _num_threads = num_threads
+
+
+def get_num_threads():
+    """Get the number of threads that `corrDn` and `upConv` split their work across
+
+    See `set_num_threads` for details.
+    """
+    return _num_threads
+
+
+def _get_thread_pool():
+    """get the pool of worker threads, creating it if necessary"""
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(_num_threads)
+    return _thread_pool
+
+
+def corrDn(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=None, out=None,
+           workspace=None, separable=False, sep_tol=1e-12, method='direct', dtype=np.float64):
     """Compute correlation of image with filt, followed by downsampling.
 
     These arguments should be 1D or 2D arrays, and image must be larger (in both dimensions) than
     filt.  The origin of filt is assumed to be floor(size(filt)/2)+1.
 
+    image can also be a 3D array, in which case it's treated as a stack of 2D images (indexed by
+    the first dimension), each of which is correlated with filt, and the results are returned
+    stacked in the same way. The whole stack is processed with a single call to the C code.
+
     Downsampling factors are determined by step (optional, default=(1, 1)), which should be a
     2-tuple (y, x).
 
@@ -50,7 +116,8 @@ def corrDn(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=No
     Arguments
     ---------
     image : `array_like`
-        1d or 2d array containing the image to correlate and downsample.
+        1d or 2d array containing the image to correlate and downsample, or 3d array containing a
+        stack of 2d images.
     filt : `array_like`
         1d or 2d array containing the filter to use for correlation and downsampling.
     edge_type : {'circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute'}
@@ -70,61 +137,112 @@ def corrDn(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=No
     start : `tuple` or None
         2-tuple which specifies the end of the window over which we perform the convolution. If
         None, perform convolution over the whole image
+    out : `np.array` or None
+        If not None, C-contiguous array of type dtype with the same shape as the result, into
+        which the result will be written (and which is then returned).
+    workspace : `ConvWorkspace` or None
+        If not None, take the scratch space needed by the C code from this workspace instead of
+        allocating it.
+    separable : `bool`
+        If True, check (once per filter, using its SVD) whether a 2d filt is a sum of a few
+        separable filters and, if that requires fewer operations, apply it as a sequence of 1d
+        column and row passes. The result then differs from the direct computation by floating
+        point rounding (the sums are done in a different order), and by up to `sep_tol` if filt
+        is only close to a sum of separable filters, which is then used instead. This is never
+        done for `'extend'` edges, whose 2d edge handling isn't separable. If False (the
+        default), always use the direct 2d computation.
+    sep_tol : `float`
+        How closely the sum of separable filters must match filt when `separable=True`: the
+        maximum error, relative to the Frobenius norm of filt. The default only allows differences
+        at the level of floating point rounding; larger values trade accuracy for speed.
+    method : {'direct', 'fft', 'auto'}
+        How to compute the convolution away from the edges. `'direct'` uses the C code everywhere.
+        `'fft'` computes all the outputs whose filter window lies completely inside the image
+        using FFTs, and only uses the C code for those near the edges, so that every edge_type is
+        handled exactly as with `'direct'` (results agree up to floating point rounding). This
+        is much faster for large filters. `'auto'` uses whichever of the two should be faster for
+        the given image and filter sizes.
+    dtype : {np.float64, np.float32, np.complex128, np.complex64}
+        Type of image and the result. With float32, image is converted to float32 (if it isn't
+        already) and processed by single precision versions of the C code, which halves the
+        memory used and moved around. filt, and all the sums, are still double, so the only
+        additional error comes from rounding to float32. See `Notes` for bounds. If image or
+        filt is complex, the corresponding complex type is used (complex128 for float64,
+        complex64 for float32) and the real and imaginary parts of image are handled together,
+        in a single pass through complex versions of the C code. Complex filters are applied as
+        two such passes, one each for their real and imaginary parts.
 
     Returns
     -------
     result : `np.array`
-        the correlated and downsampled array
+        the correlated and downsampled array. If image was a stack, so is result.
+
+    Notes
+    -----
+    With `dtype=np.float32`, every value of result differs from the float64 result by at most
+    about ``2**-23 * np.abs(filt).sum() * np.abs(image).max()`` (the rounding of image and of the
+    result to float32, each of relative size at most ``2**-24``), plus, if the separable path is
+    used, the same again for each separable component.
 
     """
-    image = image.copy().astype(float)
-    filt = filt.copy().astype(float)
+    dtype = _check_dtype(dtype, image, filt)
+    if np.iscomplexobj(filt):
+        return _complex_filter(corrDn, image, filt, out, edge_type=edge_type, step=step,
+                               start=start, stop=stop, workspace=workspace, separable=separable,
+                               sep_tol=sep_tol, method=method, dtype=dtype)
+    # the C code only reads from these, so we only copy if they're not already contiguous
+    image = np.ascontiguousarray(image, dtype=dtype)
+    filt = np.ascontiguousarray(filt, dtype=np.float64)
 
-    if image.shape[0] < filt.shape[0] or image.shape[1] < filt.shape[1]:
+    if filt.ndim == 1:
+        filt = filt.reshape(1, -1)
+
+    if image.shape[-2] < filt.shape[0] or image.shape[-1] < filt.shape[1]:
         raise Exception("Signal smaller than filter in corresponding dimension: ", image.shape, filt.shape, " see parse filter")
 
     if edge_type not in ['circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute']:
         raise Exception("Don't know how to do convolution with edge_type %s!" % edge_type)
 
-    if filt.ndim == 1:
-        filt = filt.reshape(1, -1)
+    if method not in ['direct', 'fft', 'auto']:
+        raise Exception("Don't know how to do convolution with method %s!" % method)
 
     if stop is None:
-        stop = (image.shape[0], image.shape[1])
-
-    rxsz = len(range(start[0], stop[0], step[0]))
-    rysz = len(range(start[1], stop[1], step[1]))
-    result = np.zeros((rxsz, rysz))
-
-    if edge_type == 'circular':
-        lib.internal_wrap_reduce(image.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                                 image.shape[1], image.shape[0],
-                                 filt.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                                 filt.shape[1], filt.shape[0],
-                                 start[1], step[1], stop[1], start[0], step[0],
-                                 stop[0],
-                                 result.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
+        stop = (image.shape[-2], image.shape[-1])
+
+    result_shape = image.shape[:-2] + (len(range(start[0], stop[0], step[0])),
+                                       len(range(start[1], stop[1], step[1])))
+    if out is None:
+        result = np.zeros(result_shape, dtype=dtype)
     else:
-        tmp = np.zeros((filt.shape[0], filt.shape[1]))
-        lib.internal_reduce(image.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            image.shape[1], image.shape[0],
-                            filt.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            tmp.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            filt.shape[1], filt.shape[0],
-                            start[1], step[1], stop[1], start[0], step[0],
-                            stop[0],
-                            result.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            edge_type.encode('ascii'))
+        result = _check_out(out, result_shape, dtype)
+
+    factors = None
+    if separable and edge_type != 'extend':
+        factors = _separable_factors(filt, step, sep_tol)
+    if method == 'fft' or (method == 'auto' and factors is None and
+                           _fft_is_faster(image.shape[-2:], filt.shape, result.size)):
+        _fft_reduce(image, filt, edge_type, step, start, stop, result)
+    elif factors is not None:
+        _separable_reduce(image, factors, edge_type, step, start, stop, result, workspace)
+    else:
+        temp = _get_buffer(workspace, 'temp', filt.shape)
+        _parallel_reduce(image, filt, temp, edge_type, step, start, stop, result)
 
     return result
 
 
-def upConv(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=None):
+def upConv(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=None, out=None,
+           workspace=None, separable=False, sep_tol=1e-12, method='direct', dtype=np.float64):
     """Upsample matrix image, followed by convolution with matrix filt.
 
     These arguments should be 1D or 2D matrices, and image must be larger (in both dimensions) than
     filt.  The origin of filt is assumed to be floor(size(filt)/2)+1.
 
+    image can also be a 3D array, in which case it's treated as a stack of 2D images (indexed by
+    the first dimension), each of which is upsampled and convolved with filt, and the results are
+    returned stacked in the same way. The whole stack is processed with a single call to the C
+    code.
+
     Upsampling factors are determined by step (optional, default=(1, 1)),
     a 2-tuple (y, x).
 
@@ -143,7 +261,8 @@ def upConv(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=No
     Arguments
     ---------
     image : `array_like`
-        1d or 2d array containing the image to upsample and convolve.
+        1d or 2d array containing the image to upsample and convolve, or 3d array containing a
+        stack of 2d images.
     filt : `array_like`
         1d or 2d array containing the filter to use for upsampling and convolution.
     edge_type : {'circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute'}
@@ -163,20 +282,67 @@ def upConv(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=No
     start : `tuple` or None
         2-tuple which specifies the end of the window over which we perform the convolution. If
         None, perform convolution over the whole image
+    out : `np.array` or None
+        If not None, C-contiguous array of type dtype with the same shape as the result, into
+        which the result will be written (and which is then returned).
+    workspace : `ConvWorkspace` or None
+        If not None, take the scratch space needed by the C code from this workspace instead of
+        allocating it.
+    separable : `bool`
+        If True, check (once per filter, using its SVD) whether a 2d filt is a sum of a few
+        separable filters and, if that requires fewer operations, apply it as a sequence of 1d
+        column and row passes. The result then differs from the direct computation by floating
+        point rounding (the sums are done in a different order), and by up to `sep_tol` if filt
+        is only close to a sum of separable filters, which is then used instead. This is never
+        done for `'extend'` edges, whose 2d edge handling isn't separable. If False (the
+        default), always use the direct 2d computation.
+    sep_tol : `float`
+        How closely the sum of separable filters must match filt when `separable=True`: the
+        maximum error, relative to the Frobenius norm of filt. The default only allows differences
+        at the level of floating point rounding; larger values trade accuracy for speed.
+    method : {'direct', 'fft', 'auto'}
+        How to compute the convolution away from the edges. `'direct'` uses the C code everywhere.
+        `'fft'` computes all the outputs whose filter window lies completely inside the image
+        using FFTs, and only uses the C code for those near the edges, so that every edge_type is
+        handled exactly as with `'direct'` (results agree up to floating point rounding). This
+        is much faster for large filters. `'auto'` uses whichever of the two should be faster for
+        the given image and filter sizes.
+    dtype : {np.float64, np.float32, np.complex128, np.complex64}
+        Type of image and the result. With float32, image is converted to float32 (if it isn't
+        already) and processed by single precision versions of the C code, which halves the
+        memory used and moved around. filt, and all the sums, are still double, so the only
+        additional error comes from rounding to float32. See `Notes` for bounds. If image or
+        filt is complex, the corresponding complex type is used (complex128 for float64,
+        complex64 for float32) and the real and imaginary parts of image are handled together,
+        in a single pass through complex versions of the C code. Complex filters are applied as
+        two such passes, one each for their real and imaginary parts.
 
     Returns
     -------
     result : `np.array`
-        the correlated and downsampled array
+        the upsampled and convolved array. If image was a stack, so is result.
+
+    Notes
+    -----
+    With `dtype=np.float32`, every value of result differs from the float64 result by at most
+    about ``(1 + n) * 2**-24 * np.abs(filt).sum() * np.abs(image).max()``, where ``n =
+    filt.size / (step[0] * step[1])`` is the number of values added into each value of result,
+    each of those additions being rounded to float32. The separable path rounds twice as often.
 
     """
-    image = image.copy().astype(float)
-    filt = filt.copy().astype(float)
+    dtype = _check_dtype(dtype, image, filt)
+    if np.iscomplexobj(filt):
+        return _complex_filter(upConv, image, filt, out, edge_type=edge_type, step=step,
+                               start=start, stop=stop, workspace=workspace, separable=separable,
+                               sep_tol=sep_tol, method=method, dtype=dtype)
+    # the C code only reads from these, so we only copy if they're not already contiguous
+    image = np.ascontiguousarray(image, dtype=dtype)
+    filt = np.ascontiguousarray(filt, dtype=np.float64)
 
     if image.ndim == 1:
         image = image.reshape(-1, 1)
 
-    image_shape = (image.shape[0] * step[0], image.shape[1] * step[1])
+    image_shape = (image.shape[-2] * step[0], image.shape[-1] * step[1])
 
     if image_shape[0] < filt.shape[0] or image_shape[1] < filt.shape[1]:
         raise Exception("Signal smaller than filter in corresponding dimension: ", image_shape, filt.shape, " see parse filter")
@@ -185,8 +351,42 @@ def upConv(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=No
                          'dont-compute']:
         raise Exception("Don't know how to do convolution with edge_type %s!" % edge_type)
 
-    # from upConv.c, the c code that gets compiled in the matlab version: upConv has a bug for
-    # even-length kernels when using the reflect1, extend, or repeat edge-handlers
+    if method not in ['direct', 'fft', 'auto']:
+        raise Exception("Don't know how to do convolution with method %s!" % method)
+
+    filt = _pad_even_filter(filt, edge_type)
+
+    if stop is None:
+        stop = [imshape_d * step_d for imshape_d, step_d in zip(image.shape[-2:], step)]
+
+    if out is None:
+        result = np.zeros(image.shape[:-2] + tuple(stop), dtype=dtype)
+    else:
+        # the C code adds its values into result, so it has to start out zeroed
+        result = _check_out(out, image.shape[:-2] + tuple(stop), dtype)
+        result[...] = 0
+
+    factors = None
+    if separable and edge_type != 'extend':
+        factors = _separable_factors(filt, step, sep_tol)
+    if method == 'fft' or (method == 'auto' and factors is None and
+                           _fft_is_faster(stop, filt.shape, image.size)):
+        _fft_expand(image, filt, edge_type, step, start, stop, result)
+    elif factors is not None:
+        _separable_expand(image, factors, edge_type, step, start, stop, result, workspace)
+    else:
+        temp = _get_buffer(workspace, 'temp', filt.shape)
+        _parallel_expand(image, filt, temp, edge_type, step, start, stop, result)
+
+    return result
+
+
+def _pad_even_filter(filt, edge_type):
+    """pad an even-length (2d array) filt with a zero, if upConv needs it to be
+
+    from upConv.c, the c code that gets compiled in the matlab version: upConv has a bug for
+    even-length kernels when using the reflect1, extend, or repeat edge-handlers
+    """
     if ((edge_type in ["reflect1", "extend", "repeat"]) and
             (filt.shape[0] % 2 == 0 or filt.shape[1] % 2 == 0)):
         if filt.shape[1] == 1:
@@ -197,66 +397,878 @@ def upConv(image, filt, edge_type='reflect1', step=(1, 1), start=(0, 0), stop=No
             filt = np.reshape(filt, (1, len(filt)))
         else:
             raise Exception('Even sized 2D filters not yet supported by upConv.')
+    return filt
 
-    if stop is None:
-        stop = [imshape_d * step_d for imshape_d, step_d in zip(image.shape, step)]
 
-    result = np.zeros((stop[1], stop[0]))
+def reduce_expand(image, filt, up_filt=None, edge_type='reflect1', dtype=np.float64):
+    """Compute one level of a Laplacian pyramid: the downsampled image and the band-pass residual
 
-    temp = np.zeros((filt.shape[1], filt.shape[0]))
+    This gives the same values as::
 
-    if edge_type == 'circular':
-        lib.internal_wrap_expand(image.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                                 filt.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                                 filt.shape[1], filt.shape[0], start[1],
-                                 step[1], stop[1], start[0], step[0], stop[0],
-                                 result.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                                 stop[1], stop[0])
-    else:
-        lib.internal_expand(image.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            filt.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            temp.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            filt.shape[1], filt.shape[0], start[1], step[1],
-                            stop[1], start[0], step[0], stop[0],
-                            result.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                            stop[1], stop[0], edge_type.encode('ascii'))
-    result = np.reshape(result, stop)
+        tmp = corrDn(image, filt.T, edge_type, step=(1, 2))
+        lowpass = corrDn(tmp, filt, edge_type, step=(2, 1))
+        tmp = upConv(lowpass, up_filt, edge_type, step=(2, 1), stop=(image.shape[0], lowpass.shape[1]))
+        band = image - upConv(tmp, up_filt.T, edge_type, step=(1, 2), stop=image.shape)
+
+    but, for a 2d image, does it all in a single pass through the image in the C code: the
+    image is filtered a row at a time, and only the few rows of the intermediate images that the
+    filters overlap are kept around, so they stay in the cache instead of each of the four steps
+    reading and writing a whole image. The four steps above are used instead for circular edges, 3d
+    stacks of images, or images that aren't larger than the filters in both dimensions. With
+    `set_num_threads`, the image is split into horizontal strips, computed by separate threads.
+
+    Arguments
+    ---------
+    image : `array_like`
+        2d array containing the image, or 3d array containing a stack of 2d images.
+    filt : `array_like`
+        1d filter used (along both dimensions) to downsample the image, as a 1d array or column
+        vector.
+    up_filt : `array_like` or None
+        1d filter used to upsample the downsampled image again. If None, same as filt.
+    edge_type : {'circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute'}
+        Specifies how to handle edges, see `corrDn`.
+    dtype : {np.float64, np.float32}
+        Type of image and the results, see `corrDn`.
+
+    Returns
+    -------
+    band : `np.array`
+        image minus the upsampled lowpass, with the same shape as image.
+    lowpass : `np.array`
+        the downsampled image.
+    """
+    dtype = _check_dtype(dtype, image)
+    image = np.ascontiguousarray(image, dtype=dtype)
+    filt = np.ascontiguousarray(filt, dtype=np.float64).reshape(-1, 1)
+    up_filt = filt if up_filt is None else np.ascontiguousarray(up_filt, dtype=np.float64).reshape(-1, 1)
+
+    func = _lib_function('internal_reduce_expand', dtype)
+    if (func is None or edge_type == 'circular' or image.ndim != 2 or
+            min(image.shape) <= max(filt.shape[0], up_filt.shape[0])):
+        tmp = corrDn(image, filt.T, edge_type, step=(1, 2), dtype=dtype)
+        lowpass = corrDn(tmp, filt, edge_type, step=(2, 1), dtype=dtype)
+        tmp = upConv(lowpass, up_filt, edge_type, step=(2, 1), dtype=dtype,
+                     stop=(image.shape[-2], lowpass.shape[-1]))
+        band = image - upConv(tmp, up_filt.T, edge_type, step=(1, 2), dtype=dtype,
+                              stop=image.shape[-2:])
+        return band, lowpass
+
+    if edge_type not in ['reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute']:
+        raise Exception("Don't know how to do convolution with edge_type %s!" % edge_type)
+    up_filt = _pad_even_filter(up_filt, edge_type)
+    band = np.empty(image.shape, dtype=dtype)
+    lowpass = np.empty(((image.shape[0] + 1) // 2, (image.shape[1] + 1) // 2), dtype=dtype)
+    status = _parallel_rows(func, image.shape[0], band.size, 2, _data_ptr(image), image.shape[1],
+                            image.shape[0], _data_ptr(filt), filt.shape[0], _data_ptr(up_filt),
+                            up_filt.shape[0], _data_ptr(band), _data_ptr(lowpass),
+                            edge_type.encode('ascii'))
+    if status:
+        raise Exception("Couldn't allocate the buffers for reduce_expand!")
+    return band, lowpass
+
+
+def wavelet_reduce(image, lo_filter, hi_filter, stagger, edge_type='reflect1', dtype=np.float64):
+    """Compute the four bands of one level of a wavelet pyramid
+
+    This gives the same values as::
+
+        lo = corrDn(image, lo_filter, edge_type, step=(2, 1), start=(stagger, 0))
+        hi = corrDn(image, hi_filter, edge_type, step=(2, 1), start=(1, 0))
+        lolo = corrDn(lo, lo_filter.T, edge_type, step=(1, 2), start=(0, stagger))
+        lohi = corrDn(hi, lo_filter.T, edge_type, step=(1, 2), start=(0, stagger))
+        hilo = corrDn(lo, hi_filter.T, edge_type, step=(1, 2), start=(0, 1))
+        hihi = corrDn(hi, hi_filter.T, edge_type, step=(1, 2), start=(0, 1))
+
+    but, for a 2d image, does it all in a single pass through the image in the C code: each row
+    of lo and hi is computed from the rows of image under the filters and filtered along x right
+    away, so they're never stored, and image is only read once instead of twice (and lo and hi
+    written and read again). The six steps above are used instead for 3d stacks of images, or
+    images that aren't larger than the filters in both dimensions. With `set_num_threads`, the
+    bands are split into horizontal strips, computed by separate threads.
+
+    Arguments
+    ---------
+    image : `array_like`
+        2d array containing the image, or 3d array containing a stack of 2d images.
+    lo_filter, hi_filter : `array_like`
+        1d lowpass and highpass filters, of the same length, as 1d arrays or column vectors.
+    stagger : `int`
+        Position of the first lowpass sample (the first highpass one is at 1), along both
+        dimensions.
+    edge_type : {'circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute'}
+        Specifies how to handle edges, see `corrDn`.
+    dtype : {np.float64, np.float32}
+        Type of image and the results, see `corrDn`.
+
+    Returns
+    -------
+    lolo, lohi, hilo, hihi : `np.array`
+        The four bands, named by the filter used along y and then along x.
+    """
+    dtype = _check_dtype(dtype, image)
+    image = np.ascontiguousarray(image, dtype=dtype)
+    lo_filter = np.ascontiguousarray(lo_filter, dtype=np.float64).reshape(-1, 1)
+    hi_filter = np.ascontiguousarray(hi_filter, dtype=np.float64).reshape(-1, 1)
+    if lo_filter.shape != hi_filter.shape:
+        raise Exception("lo_filter and hi_filter must have the same length!")
+
+    func = _lib_function('internal_wavelet_reduce', dtype)
+    if func is None or image.ndim != 2 or min(image.shape) <= lo_filter.shape[0]:
+        lo = corrDn(image, lo_filter, edge_type, step=(2, 1), start=(stagger, 0), dtype=dtype)
+        hi = corrDn(image, hi_filter, edge_type, step=(2, 1), start=(1, 0), dtype=dtype)
+        lolo = corrDn(lo, lo_filter.T, edge_type, step=(1, 2), start=(0, stagger), dtype=dtype)
+        lohi = corrDn(hi, lo_filter.T, edge_type, step=(1, 2), start=(0, stagger), dtype=dtype)
+        hilo = corrDn(lo, hi_filter.T, edge_type, step=(1, 2), start=(0, 1), dtype=dtype)
+        hihi = corrDn(hi, hi_filter.T, edge_type, step=(1, 2), start=(0, 1), dtype=dtype)
+        return lolo, lohi, hilo, hihi
+
+    if edge_type not in ['circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute']:
+        raise Exception("Don't know how to do convolution with edge_type %s!" % edge_type)
+    lo = [len(range(stagger, n, 2)) for n in image.shape]
+    hi = [n // 2 for n in image.shape]
+    bands = [np.empty((y, x), dtype=dtype) for y, x in
+             [(lo[0], lo[1]), (hi[0], lo[1]), (lo[0], hi[1]), (hi[0], hi[1])]]
+    status = _parallel_rows(func, max(lo[0], hi[0]), image.size, 1, _data_ptr(image),
+                            image.shape[1], image.shape[0], _data_ptr(lo_filter),
+                            _data_ptr(hi_filter), lo_filter.shape[0], stagger,
+                            *[_data_ptr(b) for b in bands], edge_type.encode('ascii'))
+    if status:
+        raise Exception("Couldn't allocate the buffers for wavelet_reduce!")
+    return tuple(bands)
+
+
+def wavelet_expand(lolo, lohi, hilo, hihi, lo_filter, hi_filter, stagger, size,
+                   edge_type='reflect1', dtype=np.float64):
+    """Reconstruct an image from the four bands of one level of a wavelet pyramid
+
+    The inverse of `wavelet_reduce` (for orthogonal filters): this gives the same values as::
 
+        lo_size = (len(range(stagger, size[0], 2)), size[1])
+        hi_size = (size[0] // 2, size[1])
+        tmp = upConv(lolo, lo_filter.T, edge_type, step=(1, 2), start=(0, stagger), stop=lo_size)
+        recon = upConv(tmp, lo_filter, edge_type, step=(2, 1), start=(stagger, 0), stop=size)
+        tmp = upConv(lohi, lo_filter.T, edge_type, step=(1, 2), start=(0, stagger), stop=hi_size)
+        recon += upConv(tmp, hi_filter, edge_type, step=(2, 1), start=(1, 0), stop=size)
+        tmp = upConv(hilo, hi_filter.T, edge_type, step=(1, 2), start=(0, 1), stop=lo_size)
+        recon += upConv(tmp, lo_filter, edge_type, step=(2, 1), start=(stagger, 0), stop=size)
+        tmp = upConv(hihi, hi_filter.T, edge_type, step=(1, 2), start=(0, 1), stop=hi_size)
+        recon += upConv(tmp, hi_filter, edge_type, step=(2, 1), start=(1, 0), stop=size)
+
+    but, for 2d bands, does it all in a single pass in the C code, which upsamples each row of the
+    bands along x and adds it into the few rows of recon it overlaps, so that the intermediate
+    images are never stored. The steps above are used instead for 3d stacks, images that aren't
+    larger than the filters in both dimensions, or circular edges: these wrap the last rows of the
+    bands around into the first rows of recon, which would have to be kept around until the end to
+    add them in the same order upConv does. With `set_num_threads`, recon is split into horizontal
+    strips, computed by separate threads.
+
+    Arguments
+    ---------
+    lolo : `array_like`
+        The lowpass band, 2d (or a 3d stack, in which case the other bands have to be too).
+    lohi, hilo, hihi : `array_like` or None
+        The other bands. Any of them can be None, in which case it's left out of the sum.
+    lo_filter, hi_filter : `array_like`
+        1d lowpass and highpass filters, of the same length, as 1d arrays or column vectors.
+    stagger : `int`
+        Position of the first lowpass sample (the first highpass one is at 1), along both
+        dimensions.
+    size : `tuple`
+        The (2d) size of the reconstructed image. The bands must have the sizes `wavelet_reduce`
+        returns for an image of this size.
+    edge_type : {'circular', 'reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute'}
+        Specifies how to handle edges, see `upConv`.
+    dtype : {np.float64, np.float32}
+        Type of the bands and the result, see `upConv`.
+
+    Returns
+    -------
+    recon : `np.array`
+        The reconstructed image.
+    """
+    dtype = _check_dtype(dtype, lolo)
+    lo_filter = np.ascontiguousarray(lo_filter, dtype=np.float64).reshape(-1, 1)
+    hi_filter = np.ascontiguousarray(hi_filter, dtype=np.float64).reshape(-1, 1)
+    if lo_filter.shape != hi_filter.shape:
+        raise Exception("lo_filter and hi_filter must have the same length!")
+    size = tuple(int(n) for n in size)
+    lo = [len(range(stagger, n, 2)) for n in size]
+    hi = [n // 2 for n in size]
+    bands = [lolo, lohi, hilo, hihi]
+    for band, shape in zip(bands, [(lo[0], lo[1]), (hi[0], lo[1]), (lo[0], hi[1]), (hi[0], hi[1])]):
+        if band is not None and np.shape(band)[-2:] != shape:
+            raise Exception("Band has shape %s, but should have %s for an image of size %s!" %
+                            (np.shape(band)[-2:], shape, size))
+    bands = [b if b is None else np.ascontiguousarray(b, dtype=dtype) for b in bands]
+
+    func = _lib_function('internal_wavelet_expand', dtype)
+    if (func is None or edge_type == 'circular' or bands[0].ndim != 2 or
+            min(size) <= _pad_even_filter(lo_filter, edge_type).shape[0]):
+        lo_size, hi_size = (lo[0], size[1]), (hi[0], size[1])
+        # the filters (and starts) along x and then y for each band
+        steps = [(lo_filter, stagger, lo_size, lo_filter, stagger),
+                 (lo_filter, stagger, hi_size, hi_filter, 1),
+                 (hi_filter, 1, lo_size, lo_filter, stagger),
+                 (hi_filter, 1, hi_size, hi_filter, 1)]
+        recon = None
+        for band, (x_filt, x_start, tmp_size, y_filt, y_start) in zip(bands, steps):
+            if band is None:
+                continue
+            tmp = upConv(band, x_filt.T, edge_type, step=(1, 2), start=(0, x_start),
+                         stop=tmp_size, dtype=dtype)
+            tmp = upConv(tmp, y_filt, edge_type, step=(2, 1), start=(y_start, 0), stop=size,
+                         dtype=dtype)
+            if recon is None:
+                recon = tmp
+            else:
+                recon += tmp
+        return recon
+
+    if edge_type not in ['reflect1', 'reflect2', 'repeat', 'zero', 'extend', 'dont-compute']:
+        raise Exception("Don't know how to do convolution with edge_type %s!" % edge_type)
+    lo_filter = _pad_even_filter(lo_filter, edge_type)
+    hi_filter = _pad_even_filter(hi_filter, edge_type)
+    recon = np.empty(size, dtype=dtype)
+    status = _parallel_rows(func, size[0], recon.size, 1,
+                            *[None if b is None else _data_ptr(b) for b in bands],
+                            _data_ptr(lo_filter), _data_ptr(hi_filter), lo_filter.shape[0],
+                            stagger, _data_ptr(recon), size[1], size[0], edge_type.encode('ascii'))
+    if status:
+        raise Exception("Couldn't allocate the buffers for wavelet_expand!")
+    return recon
+
+
+def _complex_filter(func, image, filt, out, **kwargs):
+    """apply func (`corrDn` or `upConv`) with a complex filt, whose parts the C code handles separately
+
+    kwargs are passed on to func, and must include the (complex) dtype.
+    """
+    filt = np.asarray(filt)
+    result = func(image, filt.real, out=out, **kwargs)
+    imag = func(image, filt.imag, **kwargs)
+    # result + 1j * imag
+    result.real -= imag.imag
+    result.imag += imag.real
     return result
 
 
-def pointOp(image, lut, origin, increment, warnings=False):
+def _separable_factors(filt, step, tol):
+    """decompose filt into a sum of separable filters, if that makes applying it cheaper
+
+    Returns a sequence of (column filter, row filter) pairs whose outer products sum to filt (to
+    within relative error tol), or None if filt is 1d or applying the pairs one after the other
+    wouldn't save any work compared to applying filt directly.
+    """
+    if filt.shape[0] == 1 or filt.shape[1] == 1:
+        return None
+    factors = _svd_factors(filt.tobytes(), filt.shape, tol)
+    # the first, row, pass has to be computed on step[0] times as many rows as the second
+    if not factors or len(factors) * (step[0] * filt.shape[1] + filt.shape[0]) >= filt.size:
+        return None
+    return factors
+
+
+@functools.lru_cache(maxsize=128)
+def _svd_factors(filt_bytes, shape, tol):
+    """compute the separable factors of a filter, see `_separable_factors`
+
+    this takes the filter as bytes, so that the (relatively expensive) SVD is only computed once
+    per filter.
+    """
+    u, s, vt = np.linalg.svd(np.frombuffer(filt_bytes).reshape(shape))
+    # residual[r] is the Frobenius norm of the error when only keeping the first r components
+    residual = np.append(np.sqrt(np.cumsum(s[::-1]**2))[::-1], 0)
+    if residual[0] == 0:
+        return ()
+    rank = np.nonzero(residual <= tol * residual[0])[0][0]
+    factors = []
+    for i in range(rank):
+        col_filt = np.ascontiguousarray(u[:, i:i+1] * np.sqrt(s[i]))
+        row_filt = np.ascontiguousarray(vt[i:i+1, :] * np.sqrt(s[i]))
+        # these get cached, so make sure no one changes them
+        col_filt.setflags(write=False)
+        row_filt.setflags(write=False)
+        factors.append((col_filt, row_filt))
+    return tuple(factors)
+
+
+def _separable_reduce(image, factors, edge_type, step, start, stop, result, workspace):
+    """correlate and downsample with the sum of separable filters in factors, see `corrDn`
+
+    The row filter is applied first, on every row of image (since the column filter needs them
+    all), then the column filter. The result is placed into result.
+    """
+    rows_shape = image.shape[:-1] + (len(range(start[1], stop[1], step[1])), )
+    for i, (col_filt, row_filt) in enumerate(factors):
+        rows = corrDn(image, row_filt, edge_type, (1, step[1]), (0, start[1]),
+                      (image.shape[-2], stop[1]), workspace=workspace, dtype=result.dtype,
+                      out=_get_buffer(workspace, 'separable_rows', rows_shape, result.dtype))
+        if i == 0:
+            corrDn(rows, col_filt, edge_type, (step[0], 1), (start[0], 0),
+                   (stop[0], rows.shape[-1]), out=result, workspace=workspace,
+                   dtype=result.dtype)
+        else:
+            result += corrDn(rows, col_filt, edge_type, (step[0], 1), (start[0], 0),
+                             (stop[0], rows.shape[-1]), workspace=workspace,
+                             dtype=result.dtype,
+                             out=_get_buffer(workspace, 'separable_result', result.shape,
+                                             result.dtype))
+
+
+def _separable_expand(image, factors, edge_type, step, start, stop, result, workspace):
+    """upsample and convolve with the sum of separable filters in factors, see `upConv`
+
+    The column filter is applied first (upsampling the rows), then the row filter. The result is
+    placed into result.
+    """
+    cols_shape = image.shape[:-2] + (stop[0], image.shape[-1])
+    for i, (col_filt, row_filt) in enumerate(factors):
+        cols = upConv(image, col_filt, edge_type, (step[0], 1), (start[0], 0),
+                      (stop[0], image.shape[-1]), workspace=workspace, dtype=result.dtype,
+                      out=_get_buffer(workspace, 'separable_cols', cols_shape, result.dtype))
+        if i == 0:
+            upConv(cols, row_filt, edge_type, (1, step[1]), (0, start[1]), stop, out=result,
+                   workspace=workspace, dtype=result.dtype)
+        else:
+            result += upConv(cols, row_filt, edge_type, (1, step[1]), (0, start[1]), stop,
+                             workspace=workspace, dtype=result.dtype,
+                             out=_get_buffer(workspace, 'separable_result', result.shape,
+                                             result.dtype))
+
+
+def _fft_is_faster(shape, filt_shape, n_samples):
+    """guess whether the FFT method will be faster than the direct one
+
+    shape is the 2d full-resolution shape (of the image for `corrDn`, of the result for
+    `upConv`) and n_samples the total number of samples on the (possibly stacked) sampling
+    lattice, each of which the direct method multiplies with every filter tap. The FFT method
+    instead transforms arrays of about shape + filt_shape, whatever the sampling, but still
+    computes the samples near the edges directly, so we only compare the interior ones.
+    """
+    fft_size = (shape[0] + filt_shape[0]) * (shape[1] + filt_shape[1])
+    interior = (max(shape[0] - filt_shape[0], 0) * max(shape[1] - filt_shape[1], 0) /
+                (shape[0] * shape[1]))
+    return (interior * n_samples * filt_shape[0] * filt_shape[1] >
+            _FFT_COST * fft_size * np.log2(fft_size))
+
+
+def _interior_range(start, step, stop, dim, fdim):
+    """get the range of samples for which the C code uses the filter without any edge handling
+
+    The C code treats the sample at position pos of an axis (of the image for `corrDn`, of the
+    result for `upConv`) of length dim as interior if pos - fdim//2 is in [1, dim-fdim) (or in
+    [0, dim) if the filter has length 1 along this axis). Returns (lo, hi) such that samples
+    lo, ..., hi-1 of range(start, stop, step) are interior.
+    """
+    n_samples = len(range(start, stop, step))
+    fmid = fdim // 2
+    first, last = (0, dim) if fdim == 1 else (1, dim - fdim)
+    lo = min(max(-((start - first - fmid) // step), 0), n_samples)
+    hi = min(max(-((start - last - fmid) // step), lo), n_samples)
+    return lo, hi
+
+
+def _edge_windows(shape, interior):
+    """split the samples of a 2d lattice of the given shape outside interior into four windows
+
+    interior is a pair of (lo, hi) ranges, as returned by `_interior_range`. Returns a list of
+    ((row_lo, row_hi), (col_lo, col_hi)) pairs for the top, bottom, left and right edge strips,
+    leaving out any empty ones.
+    """
+    (r0, r1), (c0, c1) = interior
+    windows = [((0, r0), (0, shape[1])), ((r1, shape[0]), (0, shape[1])),
+               ((r0, r1), (0, c0)), ((r0, r1), (c1, shape[1]))]
+    return [(r, c) for r, c in windows if r[0] < r[1] and c[0] < c[1]]
+
+
+def _lattice_window(start, step, stop, rows, cols):
+    """get the start and stop (2-tuples) of the given rows and cols of the sampling lattice"""
+    window_start = (start[0] + rows[0] * step[0], start[1] + cols[0] * step[1])
+    window_stop = (min(start[0] + rows[1] * step[0], stop[0]),
+                   min(start[1] + cols[1] * step[1], stop[1]))
+    return window_start, window_stop
+
+
+def _fft_reduce(image, filt, edge_type, step, start, stop, result):
+    """correlate and downsample using FFTs, see `corrDn`
+
+    The interior samples (see `_interior_range`) all come from a single FFT correlation with the
+    part of image they need, while the samples in the four edge strips around them are computed
+    by the C code, one strip at a time. The result is placed into result.
+    """
+    interior = [_interior_range(start[i], step[i], stop[i], image.shape[i-2], filt.shape[i])
+                for i in range(2)]
+    (r0, r1), (c0, c1) = interior
+    if r0 == r1 or c0 == c1:
+        # every sample is close to the edge
+        return _parallel_reduce(image, filt, np.zeros(filt.shape), edge_type, step, start, stop,
+                                result)
+    y0 = start[0] + r0 * step[0] - filt.shape[0] // 2
+    x0 = start[1] + c0 * step[1] - filt.shape[1] // 2
+    sub_image = image[..., y0:y0 + (r1 - r0 - 1) * step[0] + filt.shape[0],
+                      x0:x0 + (c1 - c0 - 1) * step[1] + filt.shape[1]]
+    # fftconvolve convolves, so we flip the filter to correlate
+    kernel = filt[::-1, ::-1].reshape((1, ) * (image.ndim - 2) + filt.shape)
+    corr = scipy.signal.fftconvolve(sub_image, kernel, 'valid', axes=(-2, -1))
+    result[..., r0:r1, c0:c1] = corr[..., ::step[0], ::step[1]]
+    for rows, cols in _edge_windows(result.shape[-2:], interior):
+        window_start, window_stop = _lattice_window(start, step, stop, rows, cols)
+        result[..., rows[0]:rows[1], cols[0]:cols[1]] = corrDn(image, filt, edge_type, step,
+                                                               window_start, window_stop,
+                                                               dtype=result.dtype)
+
+
+def _fft_expand(image, filt, edge_type, step, start, stop, result):
+    """upsample and convolve using FFTs, see `upConv`
+
+    The interior samples of image (see `_interior_range`) are upsampled and convolved with a
+    single FFT convolution, while the samples in the four edge strips around them are handed to
+    the C code, one strip at a time. The values are added into (zeroed) result.
+    """
+    interior = [_interior_range(start[i], step[i], stop[i], stop[i], filt.shape[i])
+                for i in range(2)]
+    (r0, r1), (c0, c1) = interior
+    temp = np.zeros(filt.shape)
+    if r0 == r1 or c0 == c1:
+        # every sample is close to the edge
+        return _parallel_expand(image, filt, temp, edge_type, step, start, stop, result)
+    for rows, cols in _edge_windows(image.shape[-2:], interior):
+        window_start, window_stop = _lattice_window(start, step, stop, rows, cols)
+        window = np.ascontiguousarray(image[..., rows[0]:rows[1], cols[0]:cols[1]])
+        _expand(window, filt, temp, edge_type, step, window_start, window_stop, result, stop)
+    upsampled = np.zeros(image.shape[:-2] + ((r1 - r0 - 1) * step[0] + 1,
+                                             (c1 - c0 - 1) * step[1] + 1), dtype=image.dtype)
+    upsampled[..., ::step[0], ::step[1]] = image[..., r0:r1, c0:c1]
+    kernel = filt.reshape((1, ) * (image.ndim - 2) + filt.shape)
+    conv = scipy.signal.fftconvolve(upsampled, kernel, 'full', axes=(-2, -1))
+    y0 = start[0] + r0 * step[0] - filt.shape[0] // 2
+    x0 = start[1] + c0 * step[1] - filt.shape[1] // 2
+    result[..., y0:y0 + conv.shape[-2], x0:x0 + conv.shape[-1]] += conv
+
+
+class ConvWorkspace:
+    """Reusable buffers for `corrDn` and `upConv`
+
+    Every call to these functions allocates a small scratch array (used by the C code to hold the
+    edge-corrected filter) and, unless `out` is given, its result. When the same operations are
+    repeated many times on same-sized arrays (e.g., building pyramids for every frame of a video),
+    you can create one workspace, pass it to all those calls as `workspace`, and use `get` to
+    keep the output buffers alive across calls, so that nothing gets allocated in steady state.
+
+    Examples
+    --------
+    >>> ws = ConvWorkspace()
+    >>> for frame in frames:
+    ...     res = corrDn(frame, filt, step=(2, 2), workspace=ws,
+    ...                  out=ws.get('level1', ((frame.shape[0]+1)//2, (frame.shape[1]+1)//2)))
+
+    """
+    def __init__(self):
+        self._buffers = {}
+
+    def get(self, key, shape, dtype=np.float64):
+        """Return the buffer stored under `key`, (re)allocating it if `shape` or `dtype` changed
+
+        The contents of the returned buffer are undefined, and it will be returned again (and so
+        overwritten) the next time someone asks for `key`.
+
+        Parameters
+        ----------
+        key : hashable
+            Name of the buffer.
+        shape : `tuple`
+            Shape the buffer must have.
+        dtype : {np.float64, np.float32}
+            Type the buffer must have.
+
+        Returns
+        -------
+        buffer : `np.array`
+            C-contiguous array of shape `shape` and type `dtype`.
+        """
+        shape = tuple(shape)
+        buf = self._buffers.get(key)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self._buffers[key] = buf
+        return buf
+
+    def clear(self):
+        """Release all the buffers held by this workspace"""
+        self._buffers.clear()
+
+
+def _get_buffer(workspace, key, shape, dtype=np.float64):
+    """get buffer `key` from `workspace` or, if `workspace` is None, allocate a new one"""
+    if workspace is None:
+        return np.zeros(shape, dtype=dtype)
+    return workspace.get(key, shape, dtype)
+
+
+def _check_dtype(dtype, *arrays):
+    """check that the C code can handle dtype, returning it as a `np.dtype`
+
+    if any of arrays is complex, the corresponding complex type is returned instead.
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in _LIB_SUFFIXES:
+        raise Exception("dtype must be one of float64, float32, complex128 or complex64, but got"
+                        " %s!" % dtype)
+    if any(np.iscomplexobj(a) for a in arrays):
+        # complex64 if dtype is float32, complex128 if it's float64
+        dtype = np.result_type(dtype, np.complex64)
+    return dtype
+
+
+def _check_out(out, shape, dtype=np.float64):
+    """check that the user-supplied `out` can be handed to the C code as the result"""
+    if (out.shape != tuple(shape) or out.dtype != dtype or
+            not out.flags.c_contiguous or not out.flags.writeable):
+        raise Exception("out must be a writeable, C-contiguous %s array of shape %s, but got"
+                        " a %s array of shape %s" % (np.dtype(dtype), tuple(shape), out.dtype,
+                                                     out.shape))
+    return out
+
+
+def _data_ptr(array):
+    """get a pointer to the data of contiguous `array`, of one of the types in `_LIB_SUFFIXES`"""
+    if array.dtype in [np.float32, np.complex64]:
+        return array.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
+    return array.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+
+
+def _lib_function(name, dtype):
+    """get the version of the C function name for images of type dtype
+
+    returns None if the loaded library doesn't contain it (e.g., an older, prebuilt, library).
+    """
+    return getattr(lib, name + _LIB_SUFFIXES[np.dtype(dtype)], None)
+
+
+def _real_parts(image, result):
+    """split image and result into (real and imaginary) parts the double C code can handle
+
+    returns a list of (part of image, as a contiguous float64 array, corresponding view of
+    result) pairs, used when the loaded library doesn't have the C code for image's type.
+    """
+    if np.iscomplexobj(image):
+        return [(np.ascontiguousarray(image.real, dtype=np.float64), result.real),
+                (np.ascontiguousarray(image.imag, dtype=np.float64), result.imag)]
+    return [(image.astype(np.float64), result)]
+
+
+def _reduce(image, filt, temp, edge_type, step, start, stop, result):
+    """call the C code to correlate and downsample image, placing the values into result
+
+    This does no checking: image, filt, temp and result must all be C-contiguous arrays of the
+    right size (temp is scratch space the size of filt, unused for circular edges), with filt and
+    temp float64 and image and result both of the same one of the types in `_LIB_SUFFIXES`.
+    image and result can be 3d stacks. If the loaded C library is too old to contain the stacked
+    or the single precision / complex functions, we loop over the stack in python or compute (the
+    real and imaginary parts separately) in double, respectively.
+    """
+    if _lib_function('internal_reduce', image.dtype) is None:
+        for part, result_part in _real_parts(image, result):
+            res = np.zeros(result.shape)
+            _reduce(part, filt, temp, edge_type, step, start, stop, res)
+            result_part[...] = res
+    elif image.ndim == 3:
+        if _lib_function('internal_reduce_stack', image.dtype) is None:
+            for im, res in zip(image, result):
+                _reduce(im, filt, temp, edge_type, step, start, stop, res)
+        elif edge_type == 'circular':
+            _lib_function('internal_wrap_reduce_stack', image.dtype)(
+                _data_ptr(image), image.shape[0], image.shape[2], image.shape[1],
+                _data_ptr(filt), filt.shape[1], filt.shape[0],
+                start[1], step[1], stop[1], start[0], step[0], stop[0], _data_ptr(result))
+        else:
+            _lib_function('internal_reduce_stack', image.dtype)(
+                _data_ptr(image), image.shape[0], image.shape[2], image.shape[1],
+                _data_ptr(filt), _data_ptr(temp), filt.shape[1], filt.shape[0],
+                start[1], step[1], stop[1], start[0], step[0], stop[0], _data_ptr(result),
+                edge_type.encode('ascii'))
+    elif edge_type == 'circular':
+        _lib_function('internal_wrap_reduce', image.dtype)(
+            _data_ptr(image), image.shape[1], image.shape[0],
+            _data_ptr(filt), filt.shape[1], filt.shape[0],
+            start[1], step[1], stop[1], start[0], step[0], stop[0], _data_ptr(result))
+    else:
+        _lib_function('internal_reduce', image.dtype)(
+            _data_ptr(image), image.shape[1], image.shape[0],
+            _data_ptr(filt), _data_ptr(temp), filt.shape[1], filt.shape[0],
+            start[1], step[1], stop[1], start[0], step[0], stop[0], _data_ptr(result),
+            edge_type.encode('ascii'))
+
+
+def _expand(image, filt, temp, edge_type, step, start, stop, result, result_dims=None):
+    """call the C code to upsample and convolve image, adding the values into result
+
+    This does no checking: image, filt, temp and result must all be C-contiguous arrays of the
+    right size (temp is scratch space the size of filt, unused for circular edges), with filt and
+    temp float64 and image and result both of the same one of the types in `_LIB_SUFFIXES`, and
+    result should generally be zeroed beforehand. image and result can be 3d stacks. If the
+    loaded C library is too old to contain the stacked or the single precision / complex
+    functions, we loop over the stack in python or compute (the real and imaginary parts
+    separately) in double, respectively.
+
+    result_dims gives the (2d) size of result, and is only needed if it's different from stop,
+    i.e., if image only covers part of the sampling lattice.
+    """
+    if result_dims is None:
+        result_dims = stop
+    if _lib_function('internal_expand', image.dtype) is None:
+        for part, result_part in _real_parts(image, result):
+            res = np.zeros(result.shape)
+            _expand(part, filt, temp, edge_type, step, start, stop, res, result_dims)
+            result_part += res
+    elif image.ndim == 3:
+        if _lib_function('internal_expand_stack', image.dtype) is None:
+            for im, res in zip(image, result):
+                _expand(im, filt, temp, edge_type, step, start, stop, res, result_dims)
+        elif edge_type == 'circular':
+            _lib_function('internal_wrap_expand_stack', image.dtype)(
+                _data_ptr(image), image.shape[0], _data_ptr(filt), filt.shape[1], filt.shape[0],
+                start[1], step[1], stop[1], start[0], step[0], stop[0], _data_ptr(result),
+                result_dims[1], result_dims[0])
+        else:
+            _lib_function('internal_expand_stack', image.dtype)(
+                _data_ptr(image), image.shape[0], _data_ptr(filt), _data_ptr(temp),
+                filt.shape[1], filt.shape[0],
+                start[1], step[1], stop[1], start[0], step[0], stop[0], _data_ptr(result),
+                result_dims[1], result_dims[0], edge_type.encode('ascii'))
+    elif edge_type == 'circular':
+        _lib_function('internal_wrap_expand', image.dtype)(
+            _data_ptr(image), _data_ptr(filt), filt.shape[1], filt.shape[0],
+            start[1], step[1], stop[1], start[0], step[0], stop[0], _data_ptr(result),
+            result_dims[1], result_dims[0])
+    else:
+        _lib_function('internal_expand', image.dtype)(
+            _data_ptr(image), _data_ptr(filt), _data_ptr(temp), filt.shape[1], filt.shape[0],
+            start[1], step[1], stop[1], start[0], step[0], stop[0], _data_ptr(result),
+            result_dims[1], result_dims[0], edge_type.encode('ascii'))
+
+
+def _chunk_bounds(length, n_chunks):
+    """split range(length) into n_chunks contiguous pieces, returning the (start, stop) pairs"""
+    bounds = [length * i // n_chunks for i in range(n_chunks + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parallel_rows(func, n_rows, size, step, *args):
+    """call one of the single-pass C functions, splitting the work across our worker threads if it's worth it
+
+    func takes args followed by the range of rows to compute, and each thread computes a
+    horizontal strip of them (recomputing whatever intermediate rows its strip needs, so the
+    strips don't depend on each other). The strips start at multiples of step. Returns the
+    (nonzero on failure) status of the calls.
+    """
+    if _num_threads == 1 or size < _MIN_PARALLEL_SIZE:
+        return func(*args, 0, n_rows)
+    n_chunks = min(_num_threads, n_rows // step)
+    tasks = []
+    for lo, hi in _chunk_bounds(n_rows // step, n_chunks):
+        hi = hi * step if hi < n_rows // step else n_rows
+        tasks.append(_get_thread_pool().submit(func, *args, lo * step, hi))
+    return max(t.result() for t in tasks)
+
+
+def _parallel_reduce(image, filt, temp, edge_type, step, start, stop, result):
+    """call `_reduce`, splitting the work across our worker threads if it's worth it
+
+    2d images are split into horizontal strips of output rows; since each output value is
+    computed independently, each strip is just a call to `_reduce` with a narrower window, writing
+    into the corresponding rows of result. stacks are split along the stack dimension instead.
+    """
+    if _num_threads == 1 or result.size < _MIN_PARALLEL_SIZE:
+        return _reduce(image, filt, temp, edge_type, step, start, stop, result)
+    n_chunks = min(_num_threads, result.shape[0])
+    tasks = []
+    for lo, hi in _chunk_bounds(result.shape[0], n_chunks):
+        # each thread needs its own scratch space
+        chunk_temp = np.empty_like(temp)
+        if image.ndim == 3:
+            args = (image[lo:hi], filt, chunk_temp, edge_type, step, start, stop, result[lo:hi])
+        else:
+            chunk_start = (start[0] + lo * step[0], start[1])
+            chunk_stop = (start[0] + hi * step[0] if hi < result.shape[0] else stop[0], stop[1])
+            args = (image, filt, chunk_temp, edge_type, step, chunk_start, chunk_stop,
+                    result[lo:hi])
+        tasks.append(_get_thread_pool().submit(_reduce, *args))
+    for t in tasks:
+        t.result()
+
+
+def _parallel_expand(image, filt, temp, edge_type, step, start, stop, result):
+    """call `_expand`, splitting the work across our worker threads if it's worth it
+
+    stacks are split along the stack dimension. 2d images are split into horizontal strips of
+    input rows, each of which is handed to `_expand` as a window on the sampling lattice. since
+    the filter spreads each input value over several output rows, neighboring strips write to
+    overlapping rows of result, so we process the even strips in parallel and then the odd ones,
+    making the strips tall enough that no two strips in the same batch can overlap (even with
+    circular boundaries, since we always use an even number of strips).
+    """
+    if _num_threads == 1 or result.size < _MIN_PARALLEL_SIZE:
+        return _expand(image, filt, temp, edge_type, step, start, stop, result)
+    if image.ndim == 3:
+        tasks = []
+        for lo, hi in _chunk_bounds(image.shape[0], min(_num_threads, image.shape[0])):
+            tasks.append(_get_thread_pool().submit(_expand, image[lo:hi], filt,
+                                                   np.empty_like(temp), edge_type, step, start,
+                                                   stop, result[lo:hi]))
+        for t in tasks:
+            t.result()
+        return
+    n_rows = image.shape[0]
+    # every strip must cover at least this many output rows
+    min_height = 2 * filt.shape[0] + 2
+    n_chunks = min(2 * _num_threads, (n_rows * step[0]) // min_height)
+    n_chunks -= n_chunks % 2
+    if n_chunks < 2:
+        return _expand(image, filt, temp, edge_type, step, start, stop, result)
+    chunks = _chunk_bounds(n_rows, n_chunks)
+    for parity in [0, 1]:
+        tasks = []
+        for lo, hi in chunks[parity::2]:
+            chunk_start = (start[0] + lo * step[0], start[1])
+            chunk_stop = (start[0] + hi * step[0] if hi < n_rows else stop[0], stop[1])
+            tasks.append(_get_thread_pool().submit(_expand, image[lo:hi], filt,
+                                                   np.empty_like(temp), edge_type, step,
+                                                   chunk_start, chunk_stop, result, stop))
+        for t in tasks:
+            t.result()
+
+
+def _strided_blocks(array):
+    """split array into 2d strided blocks that the C code can walk without copying
+
+    Adjacent dimensions that can be traversed as one (in C order) are merged, so that any
+    contiguous array, and most views of one, give a single block. Returns a list of (pointer,
+    (y_dim, y_stride, x_dim, x_stride)) tuples, with strides in elements, in the C order of the
+    array's values; the blocks all have the same size.
+    """
+    if any(st % array.itemsize for st in array.strides):
+        # e.g., a field of a structured array, the C code can't index into that
+        array = np.ascontiguousarray(array)
+    dims = []
+    for sz, st in zip(array.shape, array.strides):
+        if sz == 1:
+            continue
+        st = st // array.itemsize
+        if dims and dims[-1][1] == st * sz:
+            dims[-1] = (dims[-1][0] * sz, st)
+        else:
+            dims.append((sz, st))
+    dims = [(1, 0)] * (2 - len(dims)) + dims
+    ptr_type = type(_data_ptr(array))
+    (y_dim, y_stride), (x_dim, x_stride) = dims[-2:]
+    blocks = []
+    for idx in np.ndindex(*[sz for sz, _ in dims[:-2]]):
+        offset = sum(i * st for i, (_, st) in zip(idx, dims)) * array.itemsize
+        blocks.append((ctypes.cast(array.ctypes.data + offset, ptr_type),
+                       (y_dim, y_stride, x_dim, x_stride)))
+    return blocks
+
+
+def pointOp(image, lut, origin, increment, warnings=False, out=None, dtype=np.float64):
     """Apply a point operation, specified by lookup table `lut`, to `image`
 
     This function is very fast and allows extrapolation beyond the lookup table domain.  The
     drawbacks are that the lookup table must be equi-spaced, and the interpolation is linear.
 
+    Several lookup tables can be applied at once (e.g., the same table with different origins):
+    if `lut` is 2d or `origin` or `increment` is an array, the K resulting point operations are
+    all computed in a single pass over `image`, and stacked along a new first dimension.
+
     Arguments
     ---------
     image : `array_like`
-        1d or 2d array
+        array of any shape. It's not copied if it already has type `dtype`, even if it's not
+        contiguous (e.g., a slice or a transpose).
     lut : `array_like`
-        a row or column vector, assumed to contain (equi-spaced) samples of the function.
-    origin : `float`
-        specifies the abscissa associated with the first sample
-    increment : `float`
-        specifies the spacing between samples.
+        a row or column vector, assumed to contain (equi-spaced) samples of the function, or a
+        2d array of shape (K, n) containing K such lookup tables.
+    origin : `float` or `array_like`
+        specifies the abscissa associated with the first sample, or a 1d array of K of them.
+    increment : `float` or `array_like`
+        specifies the spacing between samples, or a 1d array of K of them.
     warnings : `bool`
         whether to print a warning whenever the lookup table is extrapolated
+    out : `np.array` or None
+        If not None, C-contiguous array of type dtype with the same shape as the result, into
+        which the result will be written (and which is then returned).
+    dtype : {np.float64, np.float32}
+        Precision of image and the result. The lookup table and the interpolation are always
+        double, so with float32 each value of the result is just the float64 one rounded to
+        float32 (after rounding image to float32, if it wasn't already).
+
+    Returns
+    -------
+    result : `np.array`
+        Array of type `dtype`, with the shape of `image` or, if several lookup tables were given,
+        of shape (K, *image.shape), with `result[k]` the point operation given by `lut[k]`,
+        `origin[k]` and `increment[k]` (broadcasting each of them if there's only one).
 
     """
-    result = np.empty_like(image)
-    # this way we can use python booleans when calling
+    dtype = _check_dtype(dtype)
+    if dtype.kind == 'c':
+        raise Exception("pointOp only handles real images, but got dtype %s!" % dtype)
+    image = np.asarray(image)
+    if image.dtype != dtype:
+        image = image.astype(dtype)
+    lut = np.asarray(lut, dtype=np.float64)
+    batched = lut.ndim > 1 and lut.shape[0] > 1 and lut.shape[1] > 1
+    batched = batched or np.ndim(origin) > 0 or np.ndim(increment) > 0
+    if batched:
+        if lut.ndim == 1 or lut.shape[0] == 1 or lut.shape[1] == 1:
+            lut = lut.reshape(1, -1)
+        if lut.ndim != 2 or np.ndim(origin) > 1 or np.ndim(increment) > 1:
+            raise Exception("lut must be 1d or 2d, and origin and increment scalars or 1d!")
+        nluts = np.broadcast_shapes(lut.shape[:1], np.shape(origin), np.shape(increment))[0]
+        shape = (nluts,) + image.shape
+    else:
+        lut = lut.reshape(1, -1)
+        nluts = 1
+        shape = image.shape
+    lut = np.ascontiguousarray(lut)
+    origins = np.ascontiguousarray(np.broadcast_to(origin, (nluts,)), dtype=np.float64)
+    increments = np.ascontiguousarray(np.broadcast_to(increment, (nluts,)), dtype=np.float64)
+    if out is None:
+        result = np.empty(shape, dtype)
+    else:
+        result = _check_out(out, shape, dtype)
+    if result.size == 0:
+        return result
+    # 1 and 2 are the left and right extrapolation warnings still to print
     if warnings:
-        warnings = 1
+        warnings = 3
     else:
         warnings = 0
-    lib.internal_pointop(image.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                         result.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                         image.shape[0] * image.shape[1],
-                         lut.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
-                         lut.shape[0],
-                         ctypes.c_double(origin),
-                         ctypes.c_double(increment), warnings)
-
-    return np.array(result)
+    # a single table is applied to every value of every result
+    lut_stride = 0 if lut.shape[0] == 1 else lut.shape[1]
+    internal_pointop_batch = _lib_function('internal_pointop_batch', dtype)
+    if internal_pointop_batch is None:
+        # older library without the batched version, so go through the contiguous one
+        image = np.ascontiguousarray(image)
+        result = result.reshape((nluts,) + image.shape)
+        internal_pointop = _lib_function('internal_pointop', dtype)
+        for k in range(nluts):
+            table = lut[min(k, lut.shape[0]-1)]
+            if internal_pointop is None:
+                result[k] = pointOp(image, table, origins[k], increments[k], warnings)
+            else:
+                internal_pointop(_data_ptr(image), _data_ptr(result[k]), image.size,
+                                 _data_ptr(table), table.size, ctypes.c_double(origins[k]),
+                                 ctypes.c_double(increments[k]), warnings)
+        return result.reshape(shape)
+    block_start = 0
+    for ptr, (y_dim, y_stride, x_dim, x_stride) in _strided_blocks(image):
+        res_ptr = ctypes.cast(result.ctypes.data + block_start * result.itemsize, type(ptr))
+        warnings = internal_pointop_batch(ptr, x_dim, x_stride, y_dim, y_stride, res_ptr,
+                                          image.size, _data_ptr(lut), lut.shape[1], lut_stride,
+                                          nluts, _data_ptr(origins), _data_ptr(increments),
+                                          warnings)
+        block_start += y_dim * x_dim
+
+    return result
@@ -0,0 +1,229 @@
+"""Saving pyramids to (and loading them from) a binary file
+
+The file starts with the 8 bytes ``b'PYRTOOLS'``, followed by the format version and the length
+(in bytes) of the header, both as little-endian uint32. The header is a utf-8 encoded JSON
+object, with:
+
+* `'class'`: the name of the pyramid's class (e.g., `'SteerablePyramidFreq'`).
+* `'pyr_type'`, `'dtype'`, `'image_size'` and `'batch_size'`: the corresponding attributes.
+* `'params'`: the rest of the arguments needed to create the pyramid (e.g., `height` or
+  `order`), with filters given as (nested) lists.
+* `'bands'`: for each band, in the order of `pyr_coeffs`, its `'key'` (`(level, band)` tuples
+  are stored as lists), `'shape'`, `'dtype'` (a numpy type string, e.g. `'<f8'`) and
+  `'offset'`, the position of its first byte in the file.
+* `'image'`: if the image was saved, the same information for it (with key `'image'`), else
+  null.
+
+It's padded with spaces so that the data starts at a multiple of 64 bytes. Each band (and the
+image) is stored in C order, and also starts at a multiple of 64 bytes, so that it can be
+memory-mapped directly.
+"""
+import json
+import struct
+import numpy as np
+from .pyr_utils import ImageShape
+
+_MAGIC = b'PYRTOOLS'
+_VERSION = 1
+_ALIGNMENT = 64
+
+
+def _aligned(offset):
+    """round offset up to the next multiple of _ALIGNMENT"""
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _encode_key(key):
+    return list(key) if isinstance(key, tuple) else key
+
+
+def _decode_key(key):
+    return tuple(key) if isinstance(key, list) else key
+
+
+def _pyramid_classes():
+    """the pyramid classes that can be saved, by name"""
+    from .GaussianPyramid import GaussianPyramid
+    from .LaplacianPyramid import LaplacianPyramid
+    from .WaveletPyramid import WaveletPyramid
+    from .SteerablePyramidSpace import SteerablePyramidSpace
+    from .SteerablePyramidFreq import SteerablePyramidFreq
+    classes = [GaussianPyramid, LaplacianPyramid, WaveletPyramid, SteerablePyramidSpace,
+               SteerablePyramidFreq]
+    return {c.__name__: c for c in classes}
+
+
+def _header(pyr, bands, image=None):
+    """lay out a file containing bands of pyr (and, optionally, its image)
+
+    bands is a list of (key, shape, dtype) for each band, and image the same for the image (or
+    None). Returns the encoded (and padded) header, and the entries of the bands followed by that
+    of the image, with their offsets filled in.
+    """
+    entries = [{'key': _encode_key(key), 'shape': [int(s) for s in shape],
+                'dtype': np.dtype(dtype).str} for key, shape, dtype in bands]
+    if image is not None:
+        entries.append({'key': 'image', 'shape': [int(s) for s in image[1]],
+                        'dtype': np.dtype(image[2]).str})
+    header = {'class': type(pyr).__name__, 'pyr_type': pyr.pyr_type, 'dtype': pyr.dtype.name,
+              'image_size': list(pyr.image_size), 'batch_size': pyr.batch_size,
+              'params': pyr._save_params(), 'bands': entries[:len(bands)],
+              'image': entries[-1] if image is not None else None}
+
+    # the offsets are part of the header, so its length depends on them. we encode it with
+    # placeholder offsets at least as long as the real ones, then fill those in and pad
+    for e in entries:
+        e['offset'] = 2**63
+    start = _aligned(len(_MAGIC) + 8 + len(json.dumps(header).encode('utf-8')))
+    offset = start
+    for e in entries:
+        e['offset'] = offset
+        nbytes = int(np.prod(e['shape'])) * np.dtype(e['dtype']).itemsize
+        offset = _aligned(offset + nbytes)
+    encoded = json.dumps(header).encode('utf-8')
+    encoded += b' ' * (start - len(_MAGIC) - 8 - len(encoded))
+    return encoded, entries
+
+
+def _write_header(f, encoded):
+    """write the magic bytes, version and (encoded) header to the start of file f"""
+    f.write(_MAGIC)
+    f.write(struct.pack('<II', _VERSION, len(encoded)))
+    f.write(encoded)
+
+
+def save_pyramid(pyr, path, include_image=False):
+    """Save a pyramid to a binary file, see `Pyramid.save`
+
+    Parameters
+    ----------
+    pyr : `Pyramid`
+        The pyramid to save.
+    path : `str`
+        The file to save it to.
+    include_image : `bool`
+        Whether to also save the image the pyramid was built from.
+    """
+    name = type(pyr).__name__
+    if name not in _pyramid_classes():
+        raise Exception("Don't know how to save pyramids of class %s!" % name)
+    arrays = [np.ascontiguousarray(pyr.pyr_coeffs[key]) for key in pyr.pyr_coeffs]
+    bands = [(key, a.shape, a.dtype) for key, a in zip(pyr.pyr_coeffs, arrays)]
+    image = None
+    if include_image:
+        if pyr.image is None:
+            raise Exception("This pyramid doesn't have an image to save!")
+        arrays.append(np.ascontiguousarray(pyr.image))
+        image = ('image', pyr.image.shape, pyr.image.dtype)
+    encoded, entries = _header(pyr, bands, image)
+
+    with open(path, 'wb') as f:
+        _write_header(f, encoded)
+        for e, a in zip(entries, arrays):
+            f.seek(e['offset'])
+            f.write(a.tobytes())
+
+
+def create_pyramid_file(pyr, path):
+    """Create a file for pyr (see `Pyramid.save`), whose coefficients are written afterwards
+
+    Used to build pyramids that don't fit in memory directly into their file: the file is created
+    with room for every band of `pyr.pyr_size` (of type `pyr.dtype`), and each band is returned as
+    a writeable `np.memmap` of its place in the file.
+
+    Parameters
+    ----------
+    pyr : `Pyramid`
+        The pyramid the file is for. Only its parameters and sizes are used.
+    path : `str`
+        The file to create.
+
+    Returns
+    -------
+    bands : `dict`
+        The `np.memmap` of each band, with the same keys as `pyr.pyr_size`.
+    """
+    name = type(pyr).__name__
+    if name not in _pyramid_classes():
+        raise Exception("Don't know how to save pyramids of class %s!" % name)
+    batch = () if pyr.batch_size is None else (pyr.batch_size,)
+    bands = [(key, batch + tuple(size), pyr.dtype) for key, size in pyr.pyr_size.items()]
+    encoded, entries = _header(pyr, bands)
+    end = entries[-1]['offset'] + int(np.prod(entries[-1]['shape'])) * pyr.dtype.itemsize
+    with open(path, 'wb') as f:
+        _write_header(f, encoded)
+        f.truncate(end)
+    return {key: np.memmap(path, pyr.dtype, 'r+', e['offset'], tuple(e['shape']))
+            for (key, _, _), e in zip(bands, entries)}
+
+
+def _read_header(path):
+    """read the header of a pyramid file"""
+    with open(path, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise Exception("%s isn't a pyramid file!" % path)
+        version, length = struct.unpack('<II', f.read(8))
+        if version > _VERSION:
+            raise Exception("%s was saved with a newer version of pyrtools (format version %d)!"
+                            % (path, version))
+        return json.loads(f.read(length).decode('utf-8'))
+
+
+def load_pyramid(path, mmap=False):
+    """Load a pyramid saved with `Pyramid.save`, see `Pyramid.load`
+
+    Parameters
+    ----------
+    path : `str`
+        The file to load the pyramid from.
+    mmap : `bool`
+        Whether to memory-map the coefficients (read-only) instead of reading them.
+
+    Returns
+    -------
+    pyr : `Pyramid`
+        The loaded pyramid.
+    """
+    header = _read_header(path)
+    classes = _pyramid_classes()
+    if header['class'] not in classes:
+        raise Exception("Don't know how to load pyramids of class %s!" % header['class'])
+    dtype = np.dtype(header['dtype'])
+    shape = tuple(header['image_size'])
+    if header['batch_size'] is not None:
+        shape = (header['batch_size'],) + shape
+    # this only sets up the filters (or masks) and sizes, without needing the image
+    pyr = classes[header['class']](ImageShape(shape), dtype=dtype, lazy=True, **header['params'])
+
+    if mmap:
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+    else:
+        f = open(path, 'rb')
+
+    def read(entry):
+        dt = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape']))
+        if mmap:
+            array = data[entry['offset']:entry['offset'] + count * dt.itemsize].view(dt)
+        else:
+            f.seek(entry['offset'])
+            array = np.fromfile(f, dt, count)
+        return array.reshape(entry['shape'])
+
+    try:
+        coeffs = {}
+        for entry in header['bands']:
+            key = _decode_key(entry['key'])
+            if tuple(entry['shape'][-2:]) != tuple(pyr.pyr_size.get(key, ())):
+                raise Exception("Band %s of %s has shape %s, but should have %s!" %
+                                (key, path, entry['shape'], pyr.pyr_size.get(key)))
+            coeffs[key] = read(entry)
+        image = read(header['image']) if header['image'] is not None else None
+    finally:
+        if not mmap:
+            f.close()
+
+    pyr.pyr_coeffs = coeffs
+    pyr.image = image
+    pyr.lazy = False
+    return pyr
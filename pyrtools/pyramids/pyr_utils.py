@@ -1,5 +1,7 @@
 import functools
 from operator import mul
+from collections.abc import MutableMapping
+import numpy as np
 
 
 def convert_pyr_coeffs_to_pyr(pyr_coeffs):
@@ -66,3 +68,182 @@ def max_pyr_height(imsz, filtsz):
             return 0
         else:
             return 1 + max_pyr_height((imsz[0] // 2, imsz[1] // 2), filtsz)
+
+
+class LazyCoeffs(MutableMapping):
+    """Dictionary of pyramid coefficients that computes each band when it's first accessed
+
+    This behaves like the `dict` pyramids normally store their coefficients in (with the keys in
+    the same order), except that the value of each key is only computed (by calling
+    `compute(key)`) the first time it's needed, and then kept. Setting a value replaces it (and
+    adds the key, if it's new).
+
+    Parameters
+    ----------
+    compute : `callable`
+        Function taking a key and returning the corresponding coefficients.
+    keys : `list`
+        The keys of the pyramid's coefficients.
+    """
+    def __init__(self, compute, keys):
+        self._compute = compute
+        self._keys = list(keys)
+        self._values = {}
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            if key not in self._keys:
+                raise KeyError(key)
+            self._values[key] = self._compute(key)
+        return self._values[key]
+
+    def __setitem__(self, key, value):
+        if key not in self._keys:
+            self._keys.append(key)
+        self._values[key] = value
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        self._keys.remove(key)
+        self._values.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return "%s(%s computed of %s)" % (type(self).__name__, list(self._values), self._keys)
+
+    def is_computed(self, key):
+        """Whether the coefficients of key have been computed (or set) yet"""
+        return key in self._values
+
+    def copy(self):
+        """Return a `dict` with all the coefficients, computing the ones we haven't yet"""
+        return dict(self.items())
+
+
+class PackedCoeffs(dict):
+    """Dictionary of pyramid coefficients that are all views into a single buffer
+
+    The bands are laid out one after the other in `buffer`, in the order of `sizes` (for all the
+    pyramids, that's the order of `convert_pyr_coeffs_to_pyr`, as in matlabPyrTools), each
+    flattened in C (row-major) or Fortran (column-major, as in matlabPyrTools) order. For a
+    batched pyramid, `buffer` is 2d, with one such row per image. Setting the value of a band
+    copies the new values into the buffer, so they must have the band's shape; bands can't be
+    added.
+
+    Parameters
+    ----------
+    sizes : `dict`
+        The size of each band (not including the batch dimension).
+    dtype : `np.dtype`
+        Type of the buffer (and so of all the bands).
+    batch_size : `int` or None
+        Number of images in the batch, or None if the pyramid isn't batched.
+    order : {'C', 'F'}
+        The order in which each band's values are stored.
+
+    Attributes
+    ----------
+    buffer : `np.array`
+        The buffer containing all the coefficients.
+    index : `dict`
+        For each band, the (start, stop) indices of its coefficients in (the last dimension of)
+        `buffer`.
+    order : {'C', 'F'}
+        The order in which each band's values are stored.
+    """
+    def __init__(self, sizes, dtype, batch_size=None, order='C'):
+        super().__init__()
+        if order not in ['C', 'F']:
+            raise Exception("order must be 'C' or 'F', but got %s!" % order)
+        total = sum(int(np.prod(size)) for size in sizes.values())
+        self.buffer = np.zeros((total,) if batch_size is None else (batch_size, total), dtype)
+        self.index = {}
+        self.order = order
+        # the views, so that a band can be put back after being popped
+        self._bands = {}
+        start = 0
+        for key, size in sizes.items():
+            size = tuple(size)
+            stop = start + int(np.prod(size))
+            self.index[key] = (start, stop)
+            flat = self.buffer[..., start:stop]
+            if order == 'C':
+                band = flat.reshape(flat.shape[:-1] + size)
+            else:
+                band = np.swapaxes(flat.reshape(flat.shape[:-1] + size[::-1]), -1, -2)
+            self._bands[key] = band
+            super().__setitem__(key, band)
+            start = stop
+
+    def __setitem__(self, key, value):
+        if key not in self.index:
+            raise KeyError("Can't add band %s to packed coefficients!" % (key,))
+        self._bands[key][...] = value
+        super().__setitem__(key, self._bands[key])
+
+
+class ImageShape:
+    """Stands in for the image of a lazy pyramid whose coefficients come from somewhere else
+
+    Creating a lazy pyramid with one of these instead of an image sets up its filters and sizes
+    without ever allocating the image (whose `image` is then None), which is what `load_pyramid`
+    and `GaussianPyramid.build_tiled` need: they fill in the coefficients themselves.
+
+    Parameters
+    ----------
+    shape : `tuple`
+        The shape the image would have.
+    """
+    def __init__(self, shape):
+        self.shape = tuple(int(s) for s in shape)
+
+
+class RowReader:
+    """Read strips of rows of an image that might not fit in memory
+
+    Parameters
+    ----------
+    image : `array_like` or `callable`
+        1d or 2d array that can be sliced along its first dimension without loading all of it
+        (e.g., a `np.memmap`, or an h5py or zarr dataset), or function taking `start` and `stop`
+        and returning rows `start` to `stop` (excluded) of the image.
+    image_size : `tuple` or None
+        The size of the image. Must be given if `image` is a function, ignored otherwise.
+    dtype : `np.dtype`
+        The type the rows are returned as.
+
+    Attributes
+    ----------
+    shape : `tuple`
+        The 2d shape of the image (1d images are treated as a single column).
+    """
+    def __init__(self, image, image_size=None, dtype=np.float64):
+        if callable(image):
+            if image_size is None:
+                raise Exception("image_size must be given when image is a function!")
+            self._read = image
+            shape = tuple(image_size)
+        else:
+            self._read = lambda start, stop: image[start:stop]
+            shape = tuple(image.shape)
+        if len(shape) == 1:
+            shape = (shape[0], 1)
+        if len(shape) != 2:
+            raise Exception("Error: Input signal must be 1D or 2D.")
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+
+    def __getitem__(self, rows):
+        start, stop, _ = rows.indices(self.shape[0])
+        stop = max(start, stop)
+        strip = np.asarray(self._read(start, stop), dtype=self.dtype)
+        return strip.reshape(stop - start, self.shape[1])
@@ -1,9 +1,16 @@
+import copy
 import numpy as np
 import warnings
-from .pyr_utils import max_pyr_height
+from collections import OrderedDict
+from .pyr_utils import max_pyr_height, LazyCoeffs, PackedCoeffs, ImageShape
+from .pyr_io import save_pyramid, load_pyramid
 from .filters import named_filter
 from .steer import steer
 
+# number of coefficients the whole-pyramid operations process at once when working on the packed
+# buffer, so that their temporary arrays stay in cache
+_BUFFER_CHUNK = 2**14
+
 
 class Pyramid:
     """Base class for multiscale pyramids
@@ -25,17 +32,34 @@ class Pyramid:
         * `'zero'` - assume values of zero outside image boundary
         * `'extend'` - reflect and invert
         * `'dont-compute'` - zero output when filter overhangs imput boundaries.
+    dtype : {np.float64, np.float32}
+        Precision with which the pyramid is built (and reconstructed): the image and all the
+        coefficients are stored with this type. float32 halves the memory used; see `corrDn` and
+        `upConv` for how much the results can differ from float64.
+    allow_batch : `bool`
+        Whether `image` can also be a 3d stack of 2d images, indexed along the first dimension
+        (only for pyramids that support building on all of them at once).
+    lazy : `bool`
+        Whether to compute each band only when it's first accessed, instead of building the whole
+        pyramid at construction. `pyr_coeffs` is then a `LazyCoeffs` (which otherwise behaves like
+        a `dict`), while `pyr_size` is filled in right away. The lowpass images the bands are
+        computed from are kept, so that accessing the bands of neighboring levels doesn't
+        recompute them, but only for the `lowpass_cache_size` most recently used levels.
 
     Attributes
     ----------
     image : `array_like`
         The input image used to construct the pyramid.
     image_size : `tuple`
-        The size of the input image.
+        The size of the input image (of each image, for a stack).
+    batch_size : `int` or None
+        The number of images in the stack, or None if `image` was a single image.
     pyr_type : `str` or `None`
         Human-readable string specifying the type of pyramid. For base class, is None.
     edge_type : `str`
         Specifies how edges were handled.
+    dtype : `np.dtype`
+        The precision of the image and the coefficients.
     pyr_coeffs : `dict`
         Dictionary containing the coefficients of the pyramid. Keys are `(level, band)` tuples and
         values are 1d or 2d numpy arrays (same number of dimensions as the input image)
@@ -45,23 +69,175 @@ class Pyramid:
     is_complex : `bool`
         Whether the coefficients are complex- or real-valued. Only `SteerablePyramidFreq` can have
         a value of True, all others must be False.
+    lazy : `bool`
+        Whether the bands are computed when first accessed.
+    lowpass_cache_size : `int`
+        If `lazy`, the maximum number of intermediate lowpass images to keep around (the least
+        recently used ones are dropped first). Can be changed at any time.
+    pyr_buffer : `np.array` or None
+        If the coefficients are packed (see `pack`), the buffer containing all of them, which the
+        values of `pyr_coeffs` are views into. None otherwise.
     """
 
-    def __init__(self, image, edge_type):
-
-        self.image = np.array(image).astype(np.float)
-        if self.image.ndim == 1:
-            self.image = self.image.reshape(-1, 1)
-        assert self.image.ndim == 2, "Error: Input signal must be 1D or 2D."
+    def __init__(self, image, edge_type, dtype=np.float64, allow_batch=False, lazy=False):
+
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in [np.float32, np.float64]:
+            raise Exception("dtype must be float32 or float64, but got %s!" % self.dtype)
+        if isinstance(image, ImageShape):
+            # the coefficients will be filled in from elsewhere (e.g., a file), see ImageShape
+            if not lazy:
+                raise Exception("Only lazy pyramids can be created without an image!")
+            self.image = None
+            shape = image.shape
+            if len(shape) == 1:
+                shape = (shape[0], 1)
+        else:
+            self.image = np.array(image).astype(self.dtype)
+            if self.image.ndim == 1:
+                self.image = self.image.reshape(-1, 1)
+            shape = self.image.shape
+        self.batch_size = None
+        if allow_batch and len(shape) == 3:
+            self.batch_size = shape[0]
+        else:
+            assert len(shape) == 2, "Error: Input signal must be 1D or 2D."
 
-        self.image_size = self.image.shape
+        self.image_size = tuple(shape[-2:])
         if not hasattr(self, 'pyr_type'):
             self.pyr_type = None
         self.edge_type = edge_type
         self.pyr_coeffs = {}
         self.pyr_size = {}
         self.is_complex = False
+        self.lazy = lazy
+        self.lowpass_cache_size = 3
+        self._lowpass_cache = OrderedDict()
+
+    @property
+    def pyr_buffer(self):
+        if isinstance(self.pyr_coeffs, PackedCoeffs):
+            return self.pyr_coeffs.buffer
+        return None
+
+    def pack(self, order='C'):
+        """Store all the coefficients in a single buffer
+
+        After this, `pyr_coeffs` is a `PackedCoeffs`: its values are views into `pyr_buffer`, a
+        single (flat, or 2d for a batched pyramid) array containing all the bands one after the
+        other, in the order of `pyr_coeffs`. Operations on all the coefficients can then be done
+        on `pyr_buffer` directly, without any copies. The bands of a lazy pyramid are all
+        computed. Pass `packed=True` when creating the pyramid to build it directly into the
+        buffer instead.
+
+        Parameters
+        ----------
+        order : {'C', 'F'}
+            The order in which each band's values are laid out in the buffer: C (row-major) or
+            Fortran (column-major). With 'F', the buffer has the layout of matlabPyrTools
+            pyramids.
+
+        Returns
+        -------
+        pyr_buffer : `np.array`
+            The buffer containing all the coefficients.
+        """
+        if isinstance(self.pyr_coeffs, PackedCoeffs) and self.pyr_coeffs.order == order:
+            return self.pyr_coeffs.buffer
+        coeffs = self.pyr_coeffs
+        # this computes all the bands of a lazy pyramid
+        dtype = np.result_type(*[coeffs[k].dtype for k in coeffs])
+        self.lazy = False
+        self._lowpass_cache.clear()
+        self._set_packed({k: self.pyr_size[k] for k in coeffs}, dtype, order)
+        for k in coeffs:
+            self.pyr_coeffs[k] = coeffs[k]
+        return self.pyr_coeffs.buffer
+
+    def _set_packed(self, sizes, dtype=None, order='C'):
+        """Make `pyr_coeffs` a `PackedCoeffs`, so the bands are stored in a single buffer
+
+        The user should not call this directly. This is called during construction of a pyramid
+        when `packed=True`, before building it, with the size of each band (in the order of
+        `pyr_coeffs`): setting the coefficients of a band then copies them into the buffer.
+
+        Parameters
+        ----------
+        sizes : `dict`
+            Dictionary containing the size of each band of the pyramid.
+        dtype : `np.dtype` or None
+            The type of the coefficients. If None, use `self.dtype`.
+        order : {'C', 'F'}
+            The order in which each band's values are laid out in the buffer.
+        """
+        if self.lazy:
+            raise Exception("A lazy pyramid can't be packed when it's created, call pack()!")
+        if dtype is None:
+            dtype = self.dtype
+        self.pyr_coeffs = PackedCoeffs(sizes, dtype, self.batch_size, order)
+
+    def _set_lazy(self, sizes):
+        """Make `pyr_coeffs` compute each band the first time it's accessed
+
+        The user should not call this directly. This is called during construction of a lazy
+        pyramid, instead of building it, with the size of each band (in the order of
+        `pyr_coeffs`). The subclass has to define `_compute_bands`, which computes the
+        coefficients of a band, and, to use `_lowpass`, `_next_lowpass` (and `_first_lowpass`, if
+        the first level isn't built from `image`).
+
+        Parameters
+        ----------
+        sizes : `dict`
+            Dictionary containing the size of each band of the pyramid.
+        """
+        self.pyr_size.update(sizes)
+        self.pyr_coeffs = LazyCoeffs(self._lazy_band, sizes.keys())
 
+    def _lazy_band(self, key):
+        """compute the band with this key, for `LazyCoeffs`
+
+        `_compute_bands` can return more bands than requested, if they come for free, in which case
+        we keep them as well.
+        """
+        bands = self._compute_bands(key)
+        for k, band in bands.items():
+            if k != key and not self.pyr_coeffs.is_computed(k):
+                self.pyr_coeffs[k] = band
+        if all(self.pyr_coeffs.is_computed(k) for k in self.pyr_coeffs if k != key):
+            # the lowpass images won't be needed anymore
+            self._lowpass_cache.clear()
+        return bands[key]
+
+    def _first_lowpass(self):
+        """the lowpass image the first level of a lazy pyramid is built from"""
+        return self.image
+
+    def _lowpass(self, lev):
+        """get the lowpass image level lev of a lazy pyramid is built from
+
+        This is computed from the closest cached level below it (or from `_first_lowpass`), by
+        calling `_next_lowpass`, and cached, along with all the levels in between.
+        """
+        if lev in self._lowpass_cache:
+            self._lowpass_cache.move_to_end(lev)
+            return self._lowpass_cache[lev]
+        start = max([l for l in self._lowpass_cache if l < lev], default=None)
+        if start is None:
+            start, lowpass = 0, self._first_lowpass()
+            self._cache_lowpass(0, lowpass)
+        else:
+            lowpass = self._lowpass_cache[start]
+        for l in range(start, lev):
+            lowpass = self._next_lowpass(l, lowpass)
+            self._cache_lowpass(l+1, lowpass)
+        return lowpass
+
+    def _cache_lowpass(self, lev, lowpass):
+        """add the lowpass image of level lev to the cache, dropping the least recently used"""
+        self._lowpass_cache[lev] = lowpass
+        self._lowpass_cache.move_to_end(lev)
+        while len(self._lowpass_cache) > max(self.lowpass_cache_size, 0):
+            self._lowpass_cache.popitem(last=False)
 
     def _set_num_scales(self, filter_name, height, extra_height=0):
         """Figure out the number of scales (height) of the pyramid
@@ -92,7 +268,7 @@ class Pyramid:
         """
         # the Gaussian and Laplacian pyramids can go one higher than the value returned here, so we
         # use the extra_height argument to allow for that
-        max_ht = max_pyr_height(self.image.shape, self.filters[filter_name].shape) + extra_height
+        max_ht = max_pyr_height(self.image_size, self.filters[filter_name].shape) + extra_height
         if height == 'auto':
             self.num_scales = max_ht
         elif height > max_ht:
@@ -173,6 +349,255 @@ class Pyramid:
             assert (bands < self.num_orientations).all(), "Error: band numbers must be in the range [0, %d]" % (self.num_orientations - 1)
         return bands
 
+    def copy(self):
+        """Return a copy of the pyramid, whose coefficients can be changed independently
+
+        All the bands of a lazy pyramid are computed (and the copy isn't lazy). A packed pyramid
+        stays packed, with its own buffer.
+
+        Returns
+        -------
+        pyr : `Pyramid`
+            The copy.
+        """
+        pyr = copy.copy(self)
+        if isinstance(self.pyr_coeffs, PackedCoeffs):
+            sizes = {k: self.pyr_size[k] for k in self.pyr_coeffs.index}
+            pyr.pyr_coeffs = PackedCoeffs(sizes, self.pyr_buffer.dtype, self.batch_size,
+                                          self.pyr_coeffs.order)
+            pyr.pyr_buffer[...] = self.pyr_buffer
+            for k in sizes:
+                # in case some bands were removed
+                if k not in self.pyr_coeffs:
+                    dict.pop(pyr.pyr_coeffs, k)
+        else:
+            pyr.pyr_coeffs = {k: np.copy(v) for k, v in self.pyr_coeffs.items()}
+        pyr.pyr_size = dict(self.pyr_size)
+        pyr.lazy = False
+        pyr._lowpass_cache = OrderedDict()
+        return pyr
+
+    def save(self, path, include_image=False):
+        """Save the pyramid to a binary file
+
+        The file contains a header, with the type of pyramid, the parameters it was created with
+        and the size of each band, followed by the coefficients, each band aligned so that it can
+        be memory-mapped (see `pyrtools.pyramids.pyr_io` for the details of the format). Use
+        `load` to get the pyramid back. Unlike pickling, this doesn't store the image (unless
+        `include_image=True`) or any filters and masks, which are recomputed when loading. The
+        bands of a lazy pyramid are all computed.
+
+        Parameters
+        ----------
+        path : `str`
+            The file to save the pyramid to.
+        include_image : `bool`
+            Whether to also save `image`.
+        """
+        save_pyramid(self, path, include_image)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Load a pyramid saved with `save`
+
+        The pyramid is of the class it was saved from (which must be this class, or a subclass of
+        it). Its `image` is None, unless it was saved too.
+
+        Parameters
+        ----------
+        path : `str`
+            The file to load the pyramid from.
+        mmap : `bool`
+            Whether to memory-map the file instead of reading it: the values of `pyr_coeffs` are
+            then read-only `np.memmap` arrays, whose data is only read from disk when needed, so
+            even very large pyramids open instantly.
+
+        Returns
+        -------
+        pyr : `Pyramid`
+            The loaded pyramid.
+        """
+        pyr = load_pyramid(path, mmap)
+        if not isinstance(pyr, cls):
+            raise Exception("%s contains a %s, not a %s!" % (path, type(pyr).__name__,
+                                                              cls.__name__))
+        return pyr
+
+    def _save_params(self):
+        """the arguments (other than image and dtype) needed to create this pyramid, for `save`
+
+        Every pyramid class that can be saved overrides this, returning a dict of keyword
+        arguments which, passed to its constructor along with an image of the same shape and
+        dtype, create the same pyramid (see `load_pyramid`). They must be JSON-serializable, so
+        filters are returned as lists.
+        """
+        raise TypeError("%s pyramids can't be saved: %s doesn't define _save_params" %
+                        (self.pyr_type, type(self).__name__))
+
+    def _band_keys(self, levels, bands):
+        """the keys of the bands of `pyr_coeffs` in these levels and bands (see `_recon_keys`)"""
+        return [k for k in self._recon_keys(levels, bands) if k in self.pyr_coeffs]
+
+    def _update_bands(self, func, levels, bands, inplace, per_band=False):
+        """call func(coeffs, key) on the selected bands, which should change coeffs in place
+
+        If the coefficients are packed, all the bands are selected and not `per_band`, func is
+        instead called on consecutive chunks of the buffer (with key the `slice` of the buffer's
+        last dimension). If not `inplace`, this is done on a copy of the pyramid, which is
+        returned.
+        """
+        pyr = self if inplace else self.copy()
+        keys = pyr._band_keys(levels, bands)
+        if pyr.pyr_buffer is not None and not per_band and keys == list(pyr.pyr_coeffs.keys()):
+            buffer = pyr.pyr_buffer
+            chunk = max(_BUFFER_CHUNK // int(np.prod(buffer.shape[:-1])), 1)
+            for start in range(0, buffer.shape[-1], chunk):
+                index = slice(start, start + chunk)
+                func(buffer[..., index], index)
+        else:
+            for k in keys:
+                func(pyr.pyr_coeffs[k], k)
+        return pyr
+
+    def scale(self, gain, levels='all', bands='all', inplace=False):
+        """Multiply the coefficients of some (or all) bands by a gain
+
+        Parameters
+        ----------
+        gain : `float` or `dict`
+            The gain to multiply the coefficients by, or a dictionary with a gain for each band
+            (with the same keys as `pyr_coeffs`).
+        levels : `list`, `int`,  or {`'all'`, `'residual_highpass'`, `'residual_lowpass'`}
+            The levels to change, as in `recon_pyr`.
+        bands : `list`, `int`, or `'all'`.
+            The orientations to change, as in `recon_pyr`.
+        inplace : `bool`
+            Whether to change the coefficients of this pyramid, or of a copy of it.
+
+        Returns
+        -------
+        pyr : `Pyramid`
+            The scaled pyramid (this one, if `inplace`).
+        """
+        def func(coeffs, key):
+            np.multiply(coeffs, gain[key] if isinstance(gain, dict) else gain, out=coeffs)
+        return self._update_bands(func, levels, bands, inplace, isinstance(gain, dict))
+
+    def threshold(self, threshold, mode='soft', levels='all', bands='all', inplace=False):
+        """Threshold the coefficients of some (or all) bands
+
+        With `mode='hard'`, coefficients whose magnitude is at most `threshold` are set to 0. With
+        `mode='soft'`, the magnitude of all coefficients is also reduced by `threshold` (and
+        complex coefficients keep their phase).
+
+        Parameters
+        ----------
+        threshold : `float` or `dict`
+            The threshold, or a dictionary with a threshold for each band (with the same keys as
+            `pyr_coeffs`).
+        mode : {'soft', 'hard'}
+            The kind of thresholding.
+        levels : `list`, `int`,  or {`'all'`, `'residual_highpass'`, `'residual_lowpass'`}
+            The levels to change, as in `recon_pyr`.
+        bands : `list`, `int`, or `'all'`.
+            The orientations to change, as in `recon_pyr`.
+        inplace : `bool`
+            Whether to change the coefficients of this pyramid, or of a copy of it.
+
+        Returns
+        -------
+        pyr : `Pyramid`
+            The thresholded pyramid (this one, if `inplace`).
+        """
+        if mode not in ['soft', 'hard']:
+            raise Exception("Don't know how to threshold with mode %s!" % mode)
+
+        def func(coeffs, key):
+            thresh = threshold[key] if isinstance(threshold, dict) else threshold
+            magnitude = np.abs(coeffs)
+            if mode == 'hard':
+                np.multiply(coeffs, magnitude > thresh, out=coeffs)
+            elif np.iscomplexobj(coeffs):
+                shrunk = np.maximum(magnitude - thresh, 0)
+                np.multiply(coeffs, np.divide(shrunk, magnitude, out=np.zeros_like(shrunk),
+                                              where=magnitude > 0), out=coeffs)
+            else:
+                np.copysign(np.maximum(magnitude - thresh, 0, out=magnitude), coeffs, out=coeffs)
+        return self._update_bands(func, levels, bands, inplace, isinstance(threshold, dict))
+
+    def add(self, other, weight=1, levels='all', bands='all', inplace=False):
+        """Add the coefficients of another pyramid to some (or all) bands
+
+        Parameters
+        ----------
+        other : `Pyramid` or `dict`
+            The pyramid (or dictionary of coefficients, like `pyr_coeffs`) to add. Its bands must
+            have the same sizes as ours.
+        weight : `float`
+            The coefficients of `other` are multiplied by this before being added (e.g., -1 to
+            subtract them).
+        levels : `list`, `int`,  or {`'all'`, `'residual_highpass'`, `'residual_lowpass'`}
+            The levels to change, as in `recon_pyr`.
+        bands : `list`, `int`, or `'all'`.
+            The orientations to change, as in `recon_pyr`.
+        inplace : `bool`
+            Whether to change the coefficients of this pyramid, or of a copy of it.
+
+        Returns
+        -------
+        pyr : `Pyramid`
+            The pyramid with the sum (this one, if `inplace`).
+        """
+        other_coeffs = other.pyr_coeffs if isinstance(other, Pyramid) else other
+        # we can add the two buffers directly if they're laid out the same way
+        same_layout = (isinstance(other_coeffs, PackedCoeffs) and
+                       isinstance(self.pyr_coeffs, PackedCoeffs) and
+                       other_coeffs.index == self.pyr_coeffs.index and
+                       other_coeffs.order == self.pyr_coeffs.order and
+                       other_coeffs.buffer.shape == self.pyr_buffer.shape)
+
+        def func(coeffs, key):
+            if isinstance(key, slice):
+                other_band = other_coeffs.buffer[..., key]
+            else:
+                other_band = other_coeffs[key]
+                if other_band.shape != coeffs.shape:
+                    raise Exception("Can't add band %s of shape %s to one of shape %s!" %
+                                    (key, other_band.shape, coeffs.shape))
+            if weight == 1:
+                np.add(coeffs, other_band, out=coeffs)
+            else:
+                np.add(coeffs, weight * other_band, out=coeffs)
+        return self._update_bands(func, levels, bands, inplace, not same_layout)
+
+    def apply(self, func, levels='all', bands='all', inplace=False, elementwise=False):
+        """Apply a function to the coefficients of some (or all) bands
+
+        Parameters
+        ----------
+        func : `callable`
+            Function taking the coefficients of a band and returning their new values, which must
+            have the same shape.
+        levels : `list`, `int`,  or {`'all'`, `'residual_highpass'`, `'residual_lowpass'`}
+            The levels to change, as in `recon_pyr`.
+        bands : `list`, `int`, or `'all'`.
+            The orientations to change, as in `recon_pyr`.
+        inplace : `bool`
+            Whether to change the coefficients of this pyramid, or of a copy of it.
+        elementwise : `bool`
+            Whether `func` acts on each coefficient separately, in which case, if the coefficients
+            are packed and all bands are selected, it's called on chunks of `pyr_buffer` instead
+            of on each band.
+
+        Returns
+        -------
+        pyr : `Pyramid`
+            The pyramid with the new coefficients (this one, if `inplace`).
+        """
+        def update(coeffs, key):
+            coeffs[...] = func(coeffs)
+        return self._update_bands(update, levels, bands, inplace, not elementwise)
+
     def _recon_keys(self, levels, bands, max_orientations=None):
         """Make a list of all the relevant keys from `pyr_coeffs` to use in pyramid reconstruction
 
@@ -230,8 +655,9 @@ class SteerablePyramidBase(Pyramid):
     SteerablePyramidSpace inherit the steer_coeffs function
 
     """
-    def __init__(self, image, edge_type):
-        super().__init__(image=image, edge_type=edge_type)
+    def __init__(self, image, edge_type, dtype=np.float64, allow_batch=False, lazy=False):
+        super().__init__(image=image, edge_type=edge_type, dtype=dtype, allow_batch=allow_batch,
+                         lazy=lazy)
 
     def steer_coeffs(self, angles, even_phase=True):
         """Steer pyramid coefficients to the specified angles
@@ -23,6 +23,16 @@ def comparePyr(matPyr, pyPyr, rtol=1e-5, atol=1e-8):
         print("size difference: %d != %d, returning False" % (matSz, pySz))
         return False
 
+    # if the coefficients are packed in matlabPyrTools' layout (see `Pyramid.pack`), we can compare
+    # them all at once, without any copies
+    buffer = getattr(pyPyr, 'pyr_buffer', None)
+    if buffer is not None and buffer.ndim == 1 and pyPyr.pyr_coeffs.order == 'F':
+        keys = sorted([k for k in pyPyr.pyr_coeffs.keys() if isinstance(k, tuple)])
+        keys = ([k for k in ['residual_highpass'] if k in pyPyr.pyr_coeffs] + keys +
+                [k for k in ['residual_lowpass'] if k in pyPyr.pyr_coeffs])
+        if keys == list(pyPyr.pyr_coeffs.keys()) and np.isclose(matPyr.reshape(-1), buffer, rtol, atol).all():
+            return True
+
     # values are close to each other?
     matStart = 0
     try:
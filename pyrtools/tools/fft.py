@@ -0,0 +1,129 @@
+"""2d FFTs used by the frequency-domain pyramids and synthetic images, with a configurable backend
+"""
+import os
+import contextlib
+import warnings
+import numpy as np
+
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    # scipy.fft was added in scipy 1.4
+    scipy_fft = None
+try:
+    import pyfftw
+    import pyfftw.interfaces.numpy_fft as pyfftw_fft
+except ImportError:
+    pyfftw = None
+
+# the backend and number of threads the FFTs use, see set_fft_backend
+_backend = 'numpy'
+_workers = 1
+# how long (in seconds) pyFFTW keeps unused plans around. each level of a pyramid has a different
+# size, so this needs to be longer than it takes to process an image
+_PYFFTW_KEEPALIVE = 30
+
+
+def set_fft_backend(backend='numpy', workers=1):
+    """Set the library used to compute the FFTs of `SteerablePyramidFreq` and the synthetic images
+
+    For large images, building and reconstructing frequency-domain pyramids is dominated by the
+    cost of the FFTs. numpy's FFT (the default) only uses a single thread, but `scipy.fft` and
+    pyFFTW (which keeps the plans it computes, so each size is only planned once) can split them
+    across several. The FFTs are always computed in double precision, whatever the backend.
+
+    See `fft_backend` to only change the backend for a block of code.
+
+    Parameters
+    ----------
+    backend : {'numpy', 'scipy', 'pyfftw'}
+        The library to use. 'scipy' requires scipy>=1.4, and 'pyfftw' requires pyFFTW to be
+        installed.
+    workers : `int` or None
+        Number of threads the FFTs use (ignored by numpy). If None, use the number of CPUs on
+        this machine.
+    """
+    global _backend, _workers
+    if backend not in ['numpy', 'scipy', 'pyfftw']:
+        raise Exception("Don't know how to compute FFTs with backend %s!" % backend)
+    if backend == 'scipy' and scipy_fft is None:
+        raise Exception("The scipy backend requires scipy>=1.4!")
+    if backend == 'pyfftw' and pyfftw is None:
+        raise Exception("The pyfftw backend requires pyFFTW, which isn't installed!")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = int(workers)
+    if workers < 1:
+        raise Exception("workers must be a positive integer, but got %d!" % workers)
+    if backend == 'numpy' and workers > 1:
+        warnings.warn("numpy's FFT is single-threaded, ignoring workers.")
+        workers = 1
+    if backend == 'pyfftw':
+        pyfftw.interfaces.cache.enable()
+        pyfftw.interfaces.cache.set_keepalive_time(_PYFFTW_KEEPALIVE)
+    _backend = backend
+    _workers = workers
+
+
+def get_fft_backend():
+    """Get the library and number of threads used to compute FFTs, see `set_fft_backend`
+
+    Returns
+    -------
+    backend : {'numpy', 'scipy', 'pyfftw'}
+        The library used.
+    workers : `int`
+        The number of threads used.
+    """
+    return _backend, _workers
+
+
+@contextlib.contextmanager
+def fft_backend(backend='numpy', workers=1):
+    """Context manager to temporarily set the library used to compute FFTs
+
+    The previous backend is restored when exiting the block. See `set_fft_backend` for details.
+
+    Examples
+    --------
+    >>> with fft_backend('scipy', workers=8):
+    ...     pyr = SteerablePyramidFreq(image)
+
+    """
+    previous = get_fft_backend()
+    set_fft_backend(backend, workers)
+    try:
+        yield
+    finally:
+        set_fft_backend(*previous)
+
+
+def _transform(name, x, **kwargs):
+    """compute FFT name (e.g., 'fft2') of x with the current backend, in double precision"""
+    x = np.asarray(x)
+    x = x.astype(np.complex128 if x.dtype.kind == 'c' else np.float64, copy=False)
+    if _backend == 'scipy':
+        return getattr(scipy_fft, name)(x, workers=_workers, **kwargs)
+    if _backend == 'pyfftw':
+        return getattr(pyfftw_fft, name)(x, threads=_workers, **kwargs)
+    return getattr(np.fft, name)(x, **kwargs)
+
+
+def fft2(x):
+    """2d FFT of `x`, computed with the current backend (see `set_fft_backend`)"""
+    return _transform('fft2', x)
+
+
+def ifft2(x):
+    """2d inverse FFT of `x`, computed with the current backend (see `set_fft_backend`)"""
+    return _transform('ifft2', x)
+
+
+def rfft2(x):
+    """2d FFT of real `x`, computed with the current backend (see `set_fft_backend`)"""
+    return _transform('rfft2', x)
+
+
+def irfft2(x, s):
+    """2d inverse of `rfft2`, of shape `s`, computed with the current backend"""
+    return _transform('irfft2', x, s=s)
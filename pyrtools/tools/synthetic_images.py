@@ -2,6 +2,7 @@ import numpy as np
 from ..pyramids.c.wrapper import pointOp
 from .utils import rcosFn
 from .image_stats import var
+from . import fft
 
 
 def ramp(size, direction=0, slope=1, intercept=0, origin=None):
@@ -558,7 +559,7 @@ def pink_noise(size, fract_dim=1):
         size = (size, size)
 
     res = np.random.randn(size[0], size[1])
-    fres = np.fft.fft2(res)
+    fres = fft.fft2(res)
 
     exp = -(2.5-fract_dim)
     ctr = np.ceil((res.shape + np.ones(2))/2.)
@@ -566,7 +567,7 @@ def pink_noise(size, fract_dim=1):
     sh[0, 0] = 1  # DC term
 
     fres = sh * fres
-    fres = np.fft.ifft2(fres)
+    fres = fft.ifft2(fres)
 
     if abs(fres.imag).max() > 1e-10:
         print('Symmetry error in creating fractal')
@@ -606,7 +607,7 @@ def blue_noise(size, fract_dim=1):
         size = (size, size)
 
     res = np.random.randn(size[0], size[1])
-    fres = np.fft.fft2(res)
+    fres = fft.fft2(res)
 
     exp = 2.5-fract_dim
     ctr = np.ceil((res.shape + np.ones(2))/2.)
@@ -614,7 +615,7 @@ def blue_noise(size, fract_dim=1):
     sh[0, 0] = 1  # DC term
 
     fres = sh * fres
-    fres = np.fft.ifft2(fres)
+    fres = fft.ifft2(fres)
 
     if abs(fres.imag).max() > 1e-10:
         print('Symmetry error in creating fractal')
@@ -57,9 +57,18 @@ else:
                             sources=['pyrtools/pyramids/c/convolve.c',
                                         'pyrtools/pyramids/c/edges.c',
                                         'pyrtools/pyramids/c/wrap.c',
-                                        'pyrtools/pyramids/c/internal_pointOp.c'],
+                                        'pyrtools/pyramids/c/internal_pointOp.c',
+                                        'pyrtools/pyramids/c/convolve_float.c',
+                                        'pyrtools/pyramids/c/wrap_float.c',
+                                        'pyrtools/pyramids/c/internal_pointOp_float.c',
+                                        'pyrtools/pyramids/c/convolve_complex.c',
+                                        'pyrtools/pyramids/c/wrap_complex.c',
+                                        'pyrtools/pyramids/c/convolve_complex_float.c',
+                                        'pyrtools/pyramids/c/wrap_complex_float.c'],
                             depends=['pyrtools/pyramids/c/convolve.h',
-                                        'pyrtools/pyramids/c/internal_pointOp.h'],
+                                        'pyrtools/pyramids/c/internal_pointOp.h',
+                                        'pyrtools/pyramids/c/convolve.c',
+                                        'pyrtools/pyramids/c/wrap.c'],
                             extra_compile_args=['-fPIC', '-shared'])],
         tests='TESTS',
         )